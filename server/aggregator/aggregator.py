@@ -1,14 +1,23 @@
 import asyncio
 import json
+import orjson
+import numpy as np
 from datetime import datetime, timedelta, timezone, time as dt_time
 import logging
 from collections import defaultdict
 import os
 import redis.asyncio as aioredis
 import typing
-import pytz
+from pymongo import UpdateOne
 from pymongo.errors import BulkWriteError
 import time
+import zlib
+from server.common.trading_calendar import calendar
+from server.common.tick_codec import SymbolDictionary, is_binary, is_conflated, decode_tick, decode_conflated
+from server.aggregator.state import TIMEFRAMES, TF_INDEX, TF_1M, TF_1D, TF_1W, COLLECTIONS, Candle, SymbolState, ms_to_datetime
+from server.aggregator.columnar import COLUMNAR_STORE, ColumnarCandleStore, PREV_1M
+from server.aggregator.checkpoint import (CHECKPOINT_INTERVAL, CHECKPOINT_MAX_AGE, checkpoint_key,
+                                          encode_checkpoint, decode_checkpoint)
 
 def get_bucket(ts, minutes):
     if isinstance(ts, (int, float)):
@@ -81,13 +90,127 @@ async def publish_candle_to_redis(symbol, timeframe, candle):
         logger = logging.getLogger('aggregator')
         logger.debug(f"Failed to publish aggregated candle to Redis: {e}")
 
+# Publish batching: ticks only mark SymbolState slots dirty and finalized candles are
+# queued; one flusher sends both every PUBLISH_THROTTLE through a single Redis pipeline
+dirty_states = set()  # {SymbolState} with in-progress candles updated since the last flush
+final_publishes = []  # [(symbol, timeframe, candle)] finalized candles awaiting publish
+PUBLISH_PIPELINE_CHUNK = 2000  # candles per pipeline execute (2 commands each)
+
+def mark_dirty(state, mask):
+    state.dirty |= mask
+    dirty_states.add(state)
+
+async def flush_publishes():
+    """Publish queued final candles, then the latest view of every dirty in-progress candle."""
+    global dirty_states, final_publishes
+    if not dirty_states and not final_publishes:
+        return 0
+    batch, final_publishes = final_publishes, []
+    dirty, dirty_states = dirty_states, set()
+    if columnar is not None:
+        # DIRTY then marks the rows written since this flush
+        columnar.clear_dirty()
+        sync_columnar()
+    for state in dirty:
+        mask, state.dirty = state.dirty, 0
+        symbol = state.symbol
+        for idx, tf in enumerate(TIMEFRAMES):
+            if not mask & (1 << idx):
+                continue
+            if idx == TF_1M:
+                candle = state.candles[idx] or state.prev_1m
+            elif ROLLUP_MODE:
+                candle = rollup_view(state, idx)
+            else:
+                candle = state.candles[idx]
+            if candle is None or candle.final:
+                continue  # finalized since it was marked; its final publish is already queued
+            batch.append((symbol, tf, {**candle.to_doc(symbol), 'final': False}))
+
+    for symbol, tf, candle in batch:
+        for queue in pubsub_channels.get((symbol, tf), ()):
+            await queue.put(candle)
+
+    if redis_pub is not None:
+        for i in range(0, len(batch), PUBLISH_PIPELINE_CHUNK):
+            pipe = redis_pub.pipeline(transaction=False)
+            for symbol, tf, candle in batch[i:i + PUBLISH_PIPELINE_CHUNK]:
+                try:
+                    msg = orjson.dumps({'tickerID': symbol, 'timeframe': tf, **candle}, default=_serialize_for_redis)
+                except TypeError as e:
+                    logging.getLogger('aggregator').warning(f"Skipping unserializable {tf} candle for {symbol}: {e}")
+                    continue
+                # publish to pattern channel so subscribers can psubscribe to aggr:*,
+                # and keep the last published aggregated message for diagnostics
+                pipe.publish(f"aggr:{tf}", msg)
+                pipe.set(f"aggr:last:{symbol}:{tf}", msg)
+            try:
+                await pipe.execute()
+            except Exception as e:
+                logging.getLogger('aggregator').warning(f"Failed to publish {len(pipe)} aggregated candle commands to Redis: {e}")
+    return len(batch)
+
+async def publish_flusher_loop(interval=None):
+    """Bounded publish latency (one interval) without a task per candle update."""
+    while True:
+        await asyncio.sleep(interval or PUBLISH_THROTTLE)
+        try:
+            await flush_publishes()
+        except Exception as e:
+            logging.getLogger('aggregator').error(f"Publish flush error: {e}")
+
 logger = logging.getLogger("aggregator")
 logger.setLevel(logging.INFO)
 
+def _upsert_op(doc):
+    return UpdateOne(
+        {'tickerID': doc['tickerID'], 'timestamp': doc['timestamp']},
+        {'$set': {'open': doc['open'], 'high': doc['high'], 'low': doc['low'],
+                  'close': doc['close'], 'volume': doc['volume']}},
+        upsert=True
+    )
+
+async def upsert_bars(collection, docs, collection_name):
+    """Write bars that may already be stored (one upsert each on tickerID + timestamp). Returns the number written."""
+    ops = [_upsert_op(doc) for doc in docs if validate_candle_data(doc)]
+    if not ops:
+        return 0
+    try:
+        await collection.bulk_write(ops, ordered=False)
+        return len(ops)
+    except BulkWriteError as bwe:
+        errors = bwe.details.get('writeErrors', [])
+        logger.error(f"[{collection_name}] {len(errors)} bars failed to upsert: {errors[0].get('errmsg') if errors else bwe}")
+        return len(ops) - len(errors)
+    except Exception as e:
+        logger.error(f"[{collection_name}] Failed to upsert {len(ops)} bars: {e}")
+        return 0
+
+async def upload_finals(db, coll_name, docs, label, max_retries, chunk_size):
+    """
+    batch_insert_with_retry for queued final bars (replayed ones are upserted); once it returns
+    (written or given up) late-tick amendments may upsert them.
+    """
+    collection = db.get_collection(coll_name)
+    inserts = docs
+    try:
+        if replayed_finals:
+            inserts = [doc for doc in docs if (coll_name, doc['tickerID'], doc['timestamp']) not in replayed_finals]
+            if len(inserts) < len(docs):
+                kept = {id(doc) for doc in inserts}
+                await upsert_bars(collection, [doc for doc in docs if id(doc) not in kept], label)
+        return await batch_insert_with_retry(collection, inserts, label, max_retries=max_retries, chunk_size=chunk_size)
+    finally:
+        for doc in docs:
+            key = (coll_name, doc['tickerID'], doc['timestamp'])
+            unstored_finals.pop(key, None)
+            replayed_finals.discard(key)
+
 async def upload_worker(db, worker_id: int, queue: asyncio.Queue):
     """
     Background worker that processes candle uploads from queue.
     Smooths out upload spikes when 8500 symbols complete simultaneously.
+    A None item (see stop_upload_workers) flushes the buffer and ends the worker.
     """
     worker_logger = logging.getLogger(f"upload_worker_{worker_id}")
     global upload_workers_active
@@ -106,6 +229,8 @@ async def upload_worker(db, worker_id: int, queue: asyncio.Queue):
             try:
                 # Get upload task with timeout to allow periodic flushing
                 upload_task = await asyncio.wait_for(queue.get(), timeout=WORKER_FLUSH_INTERVAL)
+                if upload_task is None:
+                    break  # shutdown: everything queued before it is buffered, flushed below
                 
                 collection_name = upload_task['collection']
                 doc = upload_task['doc']
@@ -121,9 +246,9 @@ async def upload_worker(db, worker_id: int, queue: asyncio.Queue):
                         if docs:
                             # Upload batch
                             try:
-                                coll = db.get_collection(coll_name)
-                                result = await batch_insert_with_retry(
-                                    coll,
+                                result = await upload_finals(
+                                    db,
+                                    coll_name,
                                     docs,
                                     f"{coll_name} (worker_{worker_id})",
                                     max_retries=2,
@@ -147,9 +272,9 @@ async def upload_worker(db, worker_id: int, queue: asyncio.Queue):
                     for coll_name, docs in list(batch_buffer.items()):
                         if docs:
                             try:
-                                coll = db.get_collection(coll_name)
-                                result = await batch_insert_with_retry(
-                                    coll,
+                                result = await upload_finals(
+                                    db,
+                                    coll_name,
                                     docs,
                                     f"{coll_name} (worker_{worker_id}_periodic)",
                                     max_retries=2,
@@ -161,18 +286,38 @@ async def upload_worker(db, worker_id: int, queue: asyncio.Queue):
                                 batch_buffer[coll_name] = []
                     last_flush = datetime.utcnow()
                     
-    except asyncio.CancelledError:
-        # Flush remaining on shutdown
+    finally:
+        # Flush remaining on shutdown (stop item or cancellation)
         worker_logger.info(f"Worker {worker_id} shutting down, flushing {sum(len(docs) for docs in batch_buffer.values())} remaining candles")
         for coll_name, docs in batch_buffer.items():
             if docs:
                 try:
-                    coll = db.get_collection(coll_name)
-                    await batch_insert_with_retry(coll, docs, f"{coll_name} (worker_{worker_id}_shutdown)", max_retries=3, chunk_size=100)
+                    await upload_finals(db, coll_name, docs, f"{coll_name} (worker_{worker_id}_shutdown)", max_retries=3, chunk_size=100)
                 except Exception as e:
                     worker_logger.error(f"Shutdown flush error for {coll_name}: {e}")
         upload_workers_active -= 1
-        raise
+
+async def stop_upload_workers(db, tasks, timeout=None):
+    """
+    Shutdown: let the upload workers drain the queue and flush their buffers, then write
+    anything a stuck worker left behind. Must finish before the Mongo client is closed.
+    """
+    for _ in tasks:
+        await upload_queue.put(None)
+    _done, pending = await asyncio.wait(tasks, timeout=timeout or UPLOAD_DRAIN_TIMEOUT)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    leftover = defaultdict(list)
+    while not upload_queue.empty():
+        item = upload_queue.get_nowait()
+        if item is not None:
+            leftover[item['collection']].append(item['doc'])
+    for coll_name, docs in leftover.items():
+        try:
+            await upload_finals(db, coll_name, docs, f"{coll_name} (shutdown)", max_retries=3, chunk_size=500)
+        except Exception as e:
+            logger.error(f"Shutdown upload error for {coll_name}: {e}")
 
 def get_1min_bucket(ts):
     # ts: ISO8601 string or epoch ms
@@ -184,14 +329,39 @@ def get_1min_bucket(ts):
         raise ValueError("Unknown timestamp format")
     return dt.replace(second=0, microsecond=0)
 
+MINUTE_MS = 60000
+DAY_MS = 86400000
+WEEK_MS = 7 * DAY_MS
+EPOCH_MONDAY_MS = -3 * DAY_MS  # 1969-12-29 00:00 UTC, the Monday before the epoch
+
+def to_epoch_ms(ts):
+    """Exchange timestamp (ISO8601 or epoch ms) -> integer epoch ms. Parsed once per tick; buckets are integer math."""
+    if isinstance(ts, (int, float)):
+        return int(ts)
+    if isinstance(ts, str):
+        return int(datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp() * 1000)
+    raise ValueError("Unknown timestamp format")
+
+def week_start_ms(ts_ms):
+    """Monday 00:00 UTC of ts_ms's week, in epoch ms."""
+    return ts_ms - (ts_ms - EPOCH_MONDAY_MS) % WEEK_MS
+
+def now_ms():
+    return int(time.time() * 1000)
+
 
 """
 Module-level caches and helper
 """
-candles = {}  # {(symbol, bucket): candle_dict} for 1m candles
-pending_candles = {}  # {(symbol, timeframe): candle_dict} for higher timeframes
-pending_daily_candles = {} # Daily candle cache: {(symbol): candle_dict}
-pending_weekly_candles = {} # Weekly candle cache: {(symbol): candle_dict}
+states = {}  # {symbol: SymbolState} every timeframe's in-progress candle for the symbol
+candle_wheel = defaultdict(set)  # {bucket ms: {SymbolState, ...}} open 1m candles by the minute they expire after
+# Optional NumPy mirror of every live candle for vectorized whole-market operations (AGGREGATOR_COLUMNAR=1)
+columnar = ColumnarCandleStore() if COLUMNAR_STORE else None
+columnar_unsynced = set()  # SymbolStates changed since the last columnar sync
+# Roll-up mode (AGGREGATOR_ROLLUP=1): ticks only update the 1m candle; higher timeframe slots hold
+# the roll-up of finalized 1m bars and their in-progress view adds the still-open bars (rollup_view)
+ROLLUP_MODE = os.getenv('AGGREGATOR_ROLLUP', '0').lower() in ('1', 'true', 'yes')
+PUBLISH_THROTTLE = 0.5  # Publish flush interval: in-progress candles go out at most 0.5s after a tick (lower latency for pro app)
 
 # Upload failure tracking
 upload_failures = defaultdict(int)
@@ -199,11 +369,66 @@ last_upload_attempt = {}
 
 # Upload queue to handle massive concurrent candle completions (8500 symbols × 7 timeframes)
 upload_queue = None  # Will be initialized in start_aggregator
+UPLOAD_DRAIN_TIMEOUT = 20  # seconds the upload workers get to drain the queue on shutdown
 upload_workers_active = 0
 
-# Recently completed candles cache (keeps candles available during upload)
-# {(symbol, timeframe, timestamp): {'candle': dict, 'completed_at': datetime}}
-recently_completed_candles = {}
+# Recently completed candles stay in a small per-(symbol, timeframe) ring on their SymbolState for this long
+RECENTLY_COMPLETED_TTL = 5000  # ms
+RECENT_FINALS = int(os.getenv('AGGREGATOR_RECENT_FINALS', '4'))  # ring size
+
+# Late ticks: per-symbol watermark = newest tick - ALLOWED_LATENESS_MS. Ticks behind it are dropped;
+# newer ones for a finalized bar amend it in place (the bar must still be in the recent-final ring,
+# which is kept at least this long; keep the lateness within RECENT_FINALS minutes for 1m bars)
+# and the bar is rewritten with one coalesced upsert
+ALLOWED_LATENESS_MS = int(os.getenv('AGGREGATOR_ALLOWED_LATENESS_MS', '120000'))
+AMEND_FLUSH_INTERVAL = 1.0  # seconds between coalesced upserts of amended bars
+pending_amends = {}  # {(collection, symbol, timestamp): (timeframe, doc)} amended final bars awaiting their upsert
+# Finalized bars queued for upload but not written yet. Their amendments ride along in the queued
+# dict, and the upsert waits until the insert is done (there is no unique index to stop a duplicate).
+# Checkpoints save them: their ticks are already behind the checkpoint's stream id
+unstored_finals = {}  # {(collection, symbol, timestamp): doc}
+BAR_FIELDS = ('tickerID', 'timestamp', 'open', 'high', 'low', 'close', 'volume')  # an amended doc may carry Mongo's _id by now
+late_ticks = {'amended': 0, 'dropped': 0}
+
+# Symbol partitioning (set by the worker entrypoint, see workers.py): (index, count) when this
+# process is one of several aggregator workers and only owns crc32(symbol) % count == index
+symbol_partition = None
+_owned_symbols = {}
+
+def partition_of(symbol, count):
+    return zlib.crc32(symbol.encode('utf-8')) % count
+
+def owns_symbol(symbol):
+    if symbol_partition is None:
+        return True
+    owned = _owned_symbols.get(symbol)
+    if owned is None:
+        index, count = symbol_partition
+        owned = _owned_symbols[symbol] = partition_of(symbol, count) == index
+    return owned
+
+# Checkpointing (see checkpoint.py): set up by restore_checkpoint before the stream adapter starts
+checkpoint_target = None  # (redis client, consumer group)
+checkpoint_restored = False
+checkpoint_saved = False  # a checkpoint for this group exists (restored or written by this process)
+stranded_1m = []  # [(symbol, Candle)] 1m candles handed over in a checkpoint too old to resume from
+restored_finals = []  # [(collection, doc)] finalized bars a checkpoint held before they reached Mongo
+stream_position = None  # id of the last stream entry applied to states
+checkpoint_dirty = set()  # SymbolStates changed since the last checkpoint
+applying_batch = False  # a batch is half-applied (checkpoints wait for it)
+# After a restore, bars ending by this time (epoch ms) may already have been written by the process
+# that was replaced (its replay re-finalizes them), so they are upserted instead of inserted
+replay_upsert_before = 0
+replayed_finals = set()  # {(collection, symbol, timestamp)} queued bars to upsert
+
+class StreamBatch(list):
+    """One XREADGROUP batch for the aggregator queue, with the id of its last entry."""
+    __slots__ = ('last_id',)
+
+# Crypto symbols (AssetInfo AssetType 'Crypto'): 24/7 sessions, UTC-day daily candles,
+# skipped by the market-close flush. Refreshed from Mongo and extended by crypto_data frames.
+crypto_symbols = set()
+CRYPTO_SYMBOLS_REFRESH = 600  # seconds
 
 # Metrics callbacks (set by app.py)
 metrics_callbacks = {
@@ -212,7 +437,10 @@ metrics_callbacks = {
     'upload_invalid': None,
     'upload_batch_size': None,
     'upload_duration': None,
-    'pending_candles': None
+    'pending_candles': None,
+    'ingest_batch_size': None,
+    'ingest_batch_duration': None,
+    'late_ticks': None
 }
 
 def validate_candle_data(candle: dict) -> bool:
@@ -367,44 +595,88 @@ async def batch_insert_with_retry(collection, documents: list, collection_name:
         'invalid': invalid_count
     }
 
+def get_state(symbol):
+    state = states.get(symbol)
+    if state is None:
+        state = states[symbol] = SymbolState(symbol)
+        if columnar is not None:
+            state.row = columnar.add(symbol)
+    return state
+
+def sync_state(state):
+    """Queue a SymbolState whose slots changed for the columnar store (sync_columnar) and the next checkpoint."""
+    if columnar is not None:
+        columnar_unsynced.add(state)
+    if checkpoint_target is not None:
+        checkpoint_dirty.add(state)
+
+def sync_columnar():
+    """
+    Copy the queued SymbolStates into the columnar store. Runs with every publish flush and
+    before each whole-market read, so a symbol ticking many times in between is written once.
+    """
+    global columnar_unsynced
+    if columnar is None or not columnar_unsynced:
+        return
+    pending, columnar_unsynced = columnar_unsynced, set()
+    write_state = columnar.write_state
+    for state in pending:
+        write_state(state)
+
+def state_counts():
+    """Open candles per kind, for status logs and metrics."""
+    if columnar is not None:
+        sync_columnar()
+        return columnar.counts()
+    counts = {'1m': 0, 'higher_tf': 0, 'daily': 0, 'weekly': 0}
+    for state in states.values():
+        slots = state.candles
+        counts['1m'] += (slots[TF_1M] is not None) + (state.prev_1m is not None)
+        counts['higher_tf'] += sum(1 for cndl in slots[TF_1M + 1:TF_1D] if cndl is not None)
+        counts['daily'] += slots[TF_1D] is not None
+        counts['weekly'] += slots[TF_1W] is not None
+    return counts
+
 async def cleanup_old_candles():
     """
     PERFORMANCE: Periodically clean up old 1m candles from memory to prevent unbounded growth.
-    Keep last 4 hours with 32GB RAM (increased from 2 hours for standard VPS).
-    Also update pending candle metrics and clean recently_completed_candles cache.
+    The minute timer finalizes 1m candles; this only drops ones older than 4 hours if it couldn't.
+    Also update pending candle metrics and expire recently completed candles.
     """
     while True:
         await asyncio.sleep(300)  # Run every 5 minutes
         try:
-            now = datetime.utcnow().replace(tzinfo=timezone.utc)
-            cutoff = now - timedelta(hours=4)  # Keep 4 hours with 32GB RAM
+            now = now_ms()
+            cutoff = now - 4 * 3600 * 1000
+            recent_cutoff = now - max(RECENTLY_COMPLETED_TTL, ALLOWED_LATENESS_MS)  # late ticks may still amend them
             
-            before_count = len(candles)
-            keys_to_delete = [k for k, v in candles.items() if k[1] < cutoff]
-            for k in keys_to_delete:
-                candles.pop(k, None)
+            removed = 0
+            recent_removed = 0
+            for state in states.values():
+                if state.prev_1m is not None and state.prev_1m.start < cutoff:
+                    state.prev_1m = None
+                    removed += 1
+                    sync_state(state)
+                if state.candles[TF_1M] is not None and state.candles[TF_1M].start < cutoff:
+                    state.candles[TF_1M] = None
+                    removed += 1
+                    sync_state(state)
+                completed = state.completed
+                for i, ring in enumerate(completed):
+                    if ring is not None and ring[-1][0] < recent_cutoff:
+                        completed[i] = None
+                        recent_removed += len(ring)
             
-            if keys_to_delete:
-                logger.info(f"[MemoryCleanup] Removed {len(keys_to_delete)} old 1m candles (kept {before_count - len(keys_to_delete)})")
-            
-            # Clean recently_completed_candles cache (TTL: 5 seconds)
-            recent_cutoff = now - timedelta(seconds=5)
-            recent_before = len(recently_completed_candles)
-            recent_to_delete = [k for k, v in recently_completed_candles.items() 
-                              if v['completed_at'] < recent_cutoff]
-            for k in recent_to_delete:
-                recently_completed_candles.pop(k, None)
-            
-            if recent_to_delete:
-                logger.debug(f"[MemoryCleanup] Removed {len(recent_to_delete)} recently completed candles from cache")
+            if removed:
+                logger.info(f"[MemoryCleanup] Removed {removed} old 1m candles")
+            if recent_removed:
+                logger.debug(f"[MemoryCleanup] Removed {recent_removed} recently completed candles from cache")
             
             # Update pending candle metrics
             if metrics_callbacks['pending_candles']:
                 try:
-                    metrics_callbacks['pending_candles']('1m', len(candles))
-                    metrics_callbacks['pending_candles']('higher_tf', len(pending_candles))
-                    metrics_callbacks['pending_candles']('daily', len(pending_daily_candles))
-                    metrics_callbacks['pending_candles']('weekly', len(pending_weekly_candles))
+                    for candle_type, count in state_counts().items():
+                        metrics_callbacks['pending_candles'](candle_type, count)
                 except Exception:
                     pass
                     
@@ -414,45 +686,29 @@ async def cleanup_old_candles():
 def get_latest_in_progress_candle(symbol, timeframe):
     """
     Returns the latest in-progress candle for the given symbol and timeframe.
-    For '1m', finds the candle in 'candles' with the latest timestamp for symbol.
-    For higher timeframes, returns from 'pending_candles'.
-    For '1d', returns from pending_daily_candles.
-    Also checks recently_completed_candles as fallback (candles being uploaded).
+    For '1m', the open candle of the current (or, until the timer fires, previous) minute.
+    For higher timeframes, the pending candle with start/end/final fields.
+    Falls back to the newest recently completed candle (being uploaded) marked final.
+    O(1): one dict lookup, then the symbol's slot and recent-final ring for the timeframe.
     """
-    if timeframe == '1m':
-        relevant = [(k, v) for k, v in candles.items() if k[0] == symbol]
-        if not relevant:
-            # Check recently completed cache (candles being uploaded)
-            recent_relevant = [(k, v) for k, v in recently_completed_candles.items() 
-                             if k[0] == symbol and k[1] == '1m']
-            if recent_relevant:
-                latest_recent = max(recent_relevant, key=lambda x: x[0][2])  # Sort by timestamp
-                return {**latest_recent[1]['candle'], 'final': True}
-            return None
-        latest = max(relevant, key=lambda x: x[0][1])
-        cndl = latest[1]
-        return {**cndl, 'final': False}
-    elif timeframe == '1d':
-        cndl = pending_daily_candles.get(symbol)
-        if cndl and not cndl.get('final', False):
-            return cndl.copy()
-        return None
-    elif timeframe == '1w':
-        cndl = pending_weekly_candles.get(symbol)
-        if cndl and not cndl.get('final', False):
-            return cndl.copy()
+    state = states.get(symbol)
+    idx = TF_INDEX.get(timeframe)
+    if state is None or idx is None:
         return None
+    if idx == TF_1M:
+        cndl = state.candles[TF_1M] or state.prev_1m
+        if cndl is not None:
+            return {**cndl.to_doc(symbol), 'final': False}
     else:
-        cndl = pending_candles.get((symbol, timeframe))
-        if cndl and not cndl.get('final', False):
-            return cndl.copy()
-        # Check recently completed cache
-        recent_relevant = [(k, v) for k, v in recently_completed_candles.items() 
-                         if k[0] == symbol and k[1] == timeframe]
-        if recent_relevant:
-            latest_recent = max(recent_relevant, key=lambda x: x[0][2])
-            return {**latest_recent[1]['candle'], 'final': True}
-        return None
+        cndl = rollup_view(state, idx) if ROLLUP_MODE else state.candles[idx]
+        if cndl is not None and not cndl.final:
+            return cndl.to_pending()
+    ring = state.completed[idx]
+    if ring is not None:
+        finalized_at, doc = ring[-1]
+        if now_ms() - finalized_at <= RECENTLY_COMPLETED_TTL:
+            return {**doc, 'final': True}
+    return None
 
 HIGHER_TIMEFRAMES = {
     '5m': 5,
@@ -460,21 +716,520 @@ HIGHER_TIMEFRAMES = {
     '30m': 30,
     '1hr': 60
 }
+INTRADAY_SLOTS = tuple((TF_INDEX[tf], tf, minutes * MINUTE_MS) for tf, minutes in HIGHER_TIMEFRAMES.items())
+INTRADAY_SPANS = {idx: span for idx, _tf, span in INTRADAY_SLOTS}
+HIGHER_MASK = ((1 << len(TIMEFRAMES)) - 1) & ~(1 << TF_1M)  # dirty bits of every timeframe above 1m
+
+def slot_bounds(symbol, idx, ts_ms):
+    """(start, end) epoch ms of the idx bucket containing ts_ms (daily ends at the stock close, UTC midnight for crypto)."""
+    if idx == TF_1D:
+        day_start = ts_ms - ts_ms % DAY_MS
+        if symbol in crypto_symbols:
+            return day_start, day_start + DAY_MS
+        return day_start, round(calendar.close_for_day(ts_ms / 1000) * 1000)
+    if idx == TF_1W:
+        week_start = week_start_ms(ts_ms)
+        return week_start, week_start + WEEK_MS
+    span = INTRADAY_SPANS[idx]
+    start = ts_ms - ts_ms % span
+    return start, start + span
+
+def rollup_view(state, idx):
+    """
+    Roll-up mode: in-progress idx candle = roll-up of the finalized 1m bars in its bucket plus
+    the open 1m bars (previous and current minute). Its close is the 1m close by construction.
+    """
+    base = state.candles[idx]
+    view = None
+    if base is not None:
+        view = Candle(base.start, base.end, base.open, base.high, base.low, base.close, base.volume)
+        view.final = base.final
+    for bar in (state.prev_1m, state.candles[TF_1M]):
+        if bar is None:
+            continue
+        if view is not None and view.start <= bar.start < view.end:
+            if not view.final:
+                view.update(bar.high, bar.low, bar.close, bar.volume)
+            continue
+        start, end = slot_bounds(state.symbol, idx, bar.start)
+        if view is None or end > view.end:
+            view = Candle(start, end, bar.open, bar.high, bar.low, bar.close, bar.volume)
+    return view
+
+async def finalize_candle(state, idx, candle, now=None):
+    """Queue a completed candle for upload, keep it as recently completed and publish it as final."""
+    candle.final = True
+    symbol = state.symbol
+    doc = candle.to_doc(symbol)
+    
+    # Keep in recently completed (available to websocket during upload)
+    entry = (now or now_ms(), doc)
+    ring = state.completed[idx]
+    if ring is None:
+        state.completed[idx] = [entry]
+    else:
+        ring.append(entry)
+        if len(ring) > RECENT_FINALS:
+            del ring[0]
+    
+    # Add to upload queue (non-blocking, handled by workers)
+    collection_name = COLLECTIONS[idx]
+    unstored_finals[(collection_name, symbol, doc['timestamp'])] = doc
+    if candle.end <= replay_upsert_before:
+        replayed_finals.add((collection_name, symbol, doc['timestamp']))
+    try:
+        upload_queue.put_nowait({'collection': collection_name, 'doc': doc})
+    except asyncio.QueueFull:
+        logger.warning(f"Upload queue full, waiting to enqueue {TIMEFRAMES[idx]} candle for {symbol}")
+        await upload_queue.put({'collection': collection_name, 'doc': doc})
+    
+    # Publish finalized candle with the next flush (ahead of in-progress updates)
+    final_publishes.append((symbol, TIMEFRAMES[idx], {**doc, 'final': True}))
+
+async def finalize_1m(state, candle, now=None):
+    if state.closed_1m is None or candle.start > state.closed_1m:
+        state.closed_1m = candle.start
+    await finalize_candle(state, TF_1M, candle, now)
+    if ROLLUP_MODE:
+        await fold_1m_bar(state, candle)
+
+async def fold_1m_bar(state, bar, expire=True):
+    """
+    Roll-up mode: fold a 1m bar into the higher timeframe roll-ups, as one OHLC tick at the
+    bar's start. Bars fold in order, so a bucket is complete (and finalized) once the bar
+    ending it is in; expire=False leaves that to the caller (market close).
+    """
+    await _apply_higher_timeframes(state, bar.start, bar.close, bar.open, bar.high, bar.low, bar.volume,
+                                   expire_at=bar.end, expire=expire)
+    sync_state(state)
+
+async def finalize_1m_candles(now):
+    """Finalize (upload + publish) every 1m candle whose bucket ended at or before now (epoch ms)."""
+    expired = [bkt for bkt in candle_wheel if now >= bkt + MINUTE_MS]
+    finalized = 0
+    for bkt in sorted(expired):
+        for state in candle_wheel.pop(bkt):
+            if state.prev_1m is not None and state.prev_1m.start == bkt:
+                cndl, state.prev_1m = state.prev_1m, None
+            elif state.candles[TF_1M] is not None and state.candles[TF_1M].start == bkt:
+                cndl, state.candles[TF_1M] = state.candles[TF_1M], None
+            else:
+                continue  # already flushed (market close) or finalized on rollover
+            await finalize_1m(state, cndl, now)
+            sync_state(state)
+            finalized += 1
+    return finalized
+
+def _count_late(outcome):
+    late_ticks[outcome] += 1
+    if metrics_callbacks['late_ticks']:
+        try:
+            metrics_callbacks['late_ticks'](outcome)
+        except Exception:
+            pass
+
+def amend_final(state, idx, start, high_price, low_price, volume):
+    """
+    Fold a late tick into the idx bar starting at start when it is already finalized (or, in
+    roll-up mode, a still-open roll-up). High/low widen and volume adds; open/close stay, since
+    a late tick's place inside the bar is unknown. Returns False if the bar is no longer held.
+    """
+    candle = state.candles[idx]
+    if candle is not None and candle.start == start and not candle.final:
+        candle.update(high_price, low_price, candle.close, volume)
+        mark_dirty(state, 1 << idx)
+        return True
+    ring = state.completed[idx]
+    if ring is None:
+        return False
+    timestamp = ms_to_datetime(start)
+    for _finalized_at, doc in reversed(ring):
+        if doc['timestamp'] == timestamp:
+            # Same dict as the queued upload: an insert that hasn't run yet picks the change up too
+            if high_price > doc['high']:
+                doc['high'] = high_price
+            if low_price < doc['low']:
+                doc['low'] = low_price
+            if volume:
+                doc['volume'] += volume
+            pending_amends[(COLLECTIONS[idx], state.symbol, timestamp)] = (TIMEFRAMES[idx], doc)
+            return True
+    return False
+
+def _amend_late_1m(state, bucket, high_price, low_price, volume):
+    """
+    Late tick for a finalized minute: amend the 1m bar (and in roll-up mode the bars it was folded
+    into). Returns whether the 1m bar was still held; the tick is counted as amended or dropped by that.
+    """
+    if ROLLUP_MODE:
+        for idx in range(TF_1M + 1, len(TIMEFRAMES)):
+            amend_final(state, idx, slot_bounds(state.symbol, idx, bucket)[0], high_price, low_price, volume)
+    return amend_final(state, TF_1M, bucket, high_price, low_price, volume)
+
+async def flush_amends(db):
+    """
+    One upsert per amended bar (however many late ticks hit it), then republish it as final.
+    Bars whose own insert hasn't run yet stay pending until it has.
+    """
+    global pending_amends
+    if not pending_amends:
+        return 0
+    amends, pending_amends = pending_amends, {}
+    by_collection = defaultdict(list)
+    flushed = 0
+    for key, (tf, doc) in amends.items():
+        if key in unstored_finals:
+            pending_amends[key] = (tf, doc)
+            continue
+        collection_name, symbol, _timestamp = key
+        flushed += 1
+        by_collection[collection_name].append(doc)
+        final_publishes.append((symbol, tf, {**{field: doc[field] for field in BAR_FIELDS}, 'final': True}))
+    for collection_name, docs in by_collection.items():
+        await upsert_bars(db.get_collection(collection_name), docs, f"{collection_name} (amended)")
+    return flushed
+
+async def amend_flusher_loop(db, interval=None):
+    while True:
+        await asyncio.sleep(interval or AMEND_FLUSH_INTERVAL)
+        try:
+            await flush_amends(db)
+        except Exception as e:
+            logger.error(f"Amend flush error: {e}")
+
+async def candle_timer_loop():
+    """
+    Timing wheel for 1m candles: wakes at each minute boundary and finalizes only
+    the buckets that just expired, so per-tick work doesn't scale with open candles.
+    """
+    while True:
+        now = now_ms()
+        await asyncio.sleep((MINUTE_MS - now % MINUTE_MS) / 1000)
+        try:
+            now = now_ms()
+            await finalize_1m_candles(now - now % MINUTE_MS)
+        except Exception as e:
+            logger.error(f"1m candle finalization error: {e}")
+
+async def refresh_crypto_symbols_loop(db, interval=CRYPTO_SYMBOLS_REFRESH):
+    while True:
+        try:
+            docs = await db.AssetInfo.find({'AssetType': 'Crypto', 'Delisted': False}, {'Symbol': 1}).to_list(length=None)
+            crypto_symbols.update(doc['Symbol'].upper() for doc in docs if doc.get('Symbol'))
+        except Exception as e:
+            logger.error(f"Failed to refresh crypto symbols: {e}")
+        await asyncio.sleep(interval)
+
+async def flush_crypto_candles_at_midnight():
+    """
+    Crypto has no market close: finalize crypto daily candles at each UTC midnight
+    (and weekly candles on Monday 00:00 UTC) for symbols that haven't traded since.
+    """
+    while True:
+        now = datetime.utcnow().replace(tzinfo=timezone.utc)
+        next_midnight = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        await asyncio.sleep((next_midnight - now).total_seconds() + 1)
+        now = now_ms()
+        flushed = 0
+        for symbol in list(crypto_symbols):
+            state = states.get(symbol)
+            if state is None:
+                continue
+            for idx in (TF_1D, TF_1W):
+                candle = state.candles[idx]
+                if candle is not None and candle.end <= now:
+                    state.candles[idx] = None
+                    sync_state(state)
+                    if not candle.final:
+                        await finalize_candle(state, idx, candle, now)
+                        flushed += 1
+        if flushed:
+            logger.info(f"[CryptoClose] Finalized {flushed} crypto daily/weekly candles")
+
+async def _apply_session_tick(state, idx, start, end, is_crypto, price, open_price, high_price, low_price, volume, late=False):
+    """
+    Daily/weekly slot update: stocks are finalized by the market-close flush, crypto on rollover.
+    Returns the slot's dirty bit, or 0 if the tick was too late for this slot.
+    """
+    candle = state.candles[idx]
+    if candle is None or candle.end != end:
+        if candle is not None and end < candle.end:
+            # Late tick for a session that already rolled over
+            amend_final(state, idx, start, high_price, low_price, volume)
+            return 0
+        if is_crypto and candle is not None and not candle.final:
+            await finalize_candle(state, idx, candle)
+        candle = state.candles[idx] = Candle(start, end, open_price, high_price, low_price, price, volume)
+    else:
+        candle.update(high_price, low_price, candle.close if late else price, volume)
+    return 1 << idx
+
+async def apply_tick(symbol, ts, price, open_price, high_price, low_price, volume=0):
+    """Fold one trade (or conflated OHLC tick) into every timeframe of the symbol's state (only the 1m in roll-up mode)."""
+    state = get_state(symbol)
+    slots = state.candles
+    ts_ms = to_epoch_ms(ts)
+    dirty = 0
+
+    # Bounded lateness: ticks behind the symbol's watermark are dropped; an out-of-order tick
+    # inside it widens high/low and adds volume but doesn't move a bar's close back in time
+    late = ts_ms < state.latest_ts
+    if not late:
+        state.latest_ts = ts_ms
+    elif ts_ms < state.latest_ts - ALLOWED_LATENESS_MS:
+        _count_late('dropped')
+        return
+
+    # --- 1m candle (finalized by the minute timer) ---
+    bucket = ts_ms - ts_ms % MINUTE_MS
+    candle = slots[TF_1M]
+    if candle is not None and candle.start == bucket:
+        candle.update(high_price, low_price, candle.close if late else price, volume)
+        logger.debug(f"[Aggregator] Updated 1m candle for {symbol} at {bucket} - price: {price}")
+    elif candle is None or bucket > candle.start:
+        if state.closed_1m is not None and bucket <= state.closed_1m:
+            candle = None  # late tick for a minute that was already finalized
+            _count_late('amended' if _amend_late_1m(state, bucket, high_price, low_price, volume) else 'dropped')
+        else:
+            expired = None
+            if candle is not None:
+                # The minute rolled over before the timer fired: keep last minute open for stragglers
+                expired, state.prev_1m = state.prev_1m, candle
+            candle = slots[TF_1M] = Candle(bucket, bucket + MINUTE_MS, open_price, high_price, low_price, price, volume)
+            candle_wheel[bucket].add(state)
+            if expired is not None:
+                await finalize_1m(state, expired)
+            logger.info(f"[Aggregator] Created new 1m candle for {symbol} at {ms_to_datetime(bucket)}")
+    elif state.prev_1m is not None and state.prev_1m.start == bucket:
+        candle = state.prev_1m
+        candle.update(high_price, low_price, candle.close if late else price, volume)
+    elif state.closed_1m is not None and bucket <= state.closed_1m:
+        candle = None  # older than the minute kept open for stragglers
+        _count_late('amended' if _amend_late_1m(state, bucket, high_price, low_price, volume) else 'dropped')
+    else:
+        candle = None  # a minute with no bar of its own, older than the open ones
+        _count_late('dropped')
+
+    if candle is not None:
+        dirty = 1 << TF_1M
+
+    if ROLLUP_MODE:
+        # Higher timeframes follow the 1m bar (folded in when it is finalized)
+        if dirty:
+            dirty |= HIGHER_MASK
+    else:
+        dirty |= await _apply_higher_timeframes(state, ts_ms, price, open_price, high_price, low_price, volume, late=late)
 
-def get_week_start(dt):
-    # Always return Monday 00:00 UTC for the week of dt
-    dt = dt.astimezone(timezone.utc)
-    monday = dt - timedelta(days=dt.weekday())
-    return monday.replace(hour=0, minute=0, second=0, microsecond=0)
-
-# Market hours with automatic DST handling
-def get_market_close_hour_utc():
-    """Calculate market close hour in UTC (4:00 PM ET), automatically accounting for DST"""
-    et = pytz.timezone('US/Eastern')
-    now_et = datetime.now(et)
-    close_et = now_et.replace(hour=16, minute=0, second=0, microsecond=0)
-    close_utc = close_et.astimezone(pytz.UTC)
-    return close_utc.hour
+    # In-progress candles go out with the next publish flush
+    if dirty:
+        mark_dirty(state, dirty)
+    if columnar is not None:
+        columnar_unsynced.add(state)
+    if checkpoint_target is not None:
+        checkpoint_dirty.add(state)
+
+async def _apply_higher_timeframes(state, ts_ms, price, open_price, high_price, low_price, volume,
+                                   expire_at=None, expire=True, late=False):
+    """
+    Fold a trade (or, in roll-up mode, a finalized 1m bar) into the intraday, daily and weekly
+    slots and return their dirty bits. Unless expire is False, intraday candles whose interval
+    ended by expire_at (default: the current minute) are finalized. A late (out-of-order) trade
+    leaves the closes of open candles alone.
+    """
+    symbol = state.symbol
+    slots = state.candles
+    dirty = 0
+
+    # --- Higher timeframe candle logic ---
+    for idx, tf, span in INTRADAY_SLOTS:
+        bucket_start = ts_ms - ts_ms % span
+        bucket_end = bucket_start + span
+        candle = slots[idx]
+        if candle is None or candle.end != bucket_end:
+            if candle is not None and bucket_end < candle.end:
+                # Late tick for an interval that already rolled over
+                amend_final(state, idx, bucket_start, high_price, low_price, volume)
+                continue
+            # Finalize previous candle if exists and not finalized
+            if candle is not None and not candle.final:
+                await finalize_candle(state, idx, candle)
+            candle = slots[idx] = Candle(bucket_start, bucket_end, open_price, high_price, low_price, price, volume)
+        else:
+            candle.update(high_price, low_price, candle.close if late else price, volume)
+        dirty |= 1 << idx
+
+    # --- Daily candle logic (UTC) ---
+    # Use UTC midnight for candle timestamp, finalize at market close
+    day_start = ts_ms - ts_ms % DAY_MS
+    is_crypto = symbol in crypto_symbols
+    if is_crypto:
+        # Crypto trades 24/7: daily candles are UTC calendar days
+        market_close = day_start + DAY_MS
+    else:
+        market_close = round(calendar.close_for_day(ts_ms / 1000) * 1000)
+    dirty |= await _apply_session_tick(state, TF_1D, day_start, market_close, is_crypto,
+                                       price, open_price, high_price, low_price, volume, late)
+
+    # Finalize and persist higher timeframe candles if their interval is over
+    # (This catches any stragglers that didn't finalize at bucket transitions)
+    if expire:
+        now = now_ms()
+        now -= now % MINUTE_MS
+        if expire_at is None:
+            expire_at = now
+        for idx, tf, span in INTRADAY_SLOTS:
+            candle = slots[idx]
+            if candle is not None and not candle.final and expire_at >= candle.end:
+                slots[idx] = None
+                await finalize_candle(state, idx, candle, now)
+
+    # --- Weekly candle logic (UTC week start) ---
+    week_start = week_start_ms(ts_ms)
+    dirty |= await _apply_session_tick(state, TF_1W, week_start, week_start + WEEK_MS, is_crypto,
+                                       price, open_price, high_price, low_price, volume, late)
+    return dirty
+
+def parse_message(msg):
+    """
+    Stream message -> (symbol, ts, close, open, high, low, volume) for apply_tick, or None if it
+    carries no trade. Binary records arrive already decoded by the adapter: (symbol, price, epoch ms)
+    or, conflated, (symbol, close, epoch ms, open, high, low).
+    """
+    if type(msg) is tuple:
+        if len(msg) == 3:
+            symbol, price, ts = msg
+            return symbol, ts, price, price, price, price, 0
+        symbol, price, ts, open_price, high_price, low_price = msg
+        return symbol, ts, price, open_price, high_price, low_price, 0
+
+    data = json.loads(msg)
+    service = data.get("service")
+    d = data.get("data")
+    if not isinstance(d, list):
+        logger.warning(f"Malformed data: {data}")
+        return None
+
+    if service == "iex" and len(d) > 2:
+        price = float(d[2])
+        return d[1].upper(), d[0], price, price, price, price, 0
+    if service == "crypto_data" and len(d) > 5 and d[0] == "T":
+        # Crypto trade: ["T", ticker, date, exchange, size, price]
+        symbol = d[1].upper()
+        price = float(d[5])
+        crypto_symbols.add(symbol)
+        return symbol, d[2], price, price, price, price, float(d[4] or 0)
+    if service == "iex_conflated" and len(d) > 5:
+        # Conflated ticks: [ts, symbol, close, open, high, low, count]
+        return d[1].upper(), d[0], float(d[2]), float(d[3]), float(d[4]), float(d[5]), 0
+    logger.warning(f"Unknown service or data format: {data}")
+    return None
+
+def _record_batch_metrics(size, duration):
+    for name, value in (('ingest_batch_size', size), ('ingest_batch_duration', duration)):
+        callback = metrics_callbacks[name]
+        if callback:
+            try:
+                callback(value)
+            except Exception:
+                pass
+
+async def restore_checkpoint(redis_client, group, stream='tiingo:stream'):
+    """
+    Enable checkpoints for this consumer group and resume from the latest one: restore the open
+    candles and rewind the group to the checkpoint's stream id so the entries after it are replayed.
+    Must run before the stream adapter starts reading. Returns the number of symbols restored.
+    """
+    global checkpoint_target, checkpoint_restored, checkpoint_saved, stream_position, replay_upsert_before
+    if CHECKPOINT_INTERVAL <= 0:
+        return 0
+    checkpoint_target = (redis_client, group)
+    key = checkpoint_key(group)
+    try:
+        checkpoint = decode_checkpoint(await redis_client.hgetall(key))
+    except Exception as e:
+        logger.error(f"✗ Could not read checkpoint {key}: {e}")
+        return 0
+    if checkpoint is None:
+        logger.info(f"No checkpoint for group {group}; starting fresh")
+        return 0
+    stream_id, saved_at, restored, finals = checkpoint
+    restored_finals.extend(finals)  # queued (as upserts) once the upload workers run, stale or not
+    now = now_ms()
+    age = (now - saved_at) / 1000
+    if age > CHECKPOINT_MAX_AGE or calendar.next_close(saved_at / 1000) * 1000 <= now:
+        reason = f"{age:.0f}s old (max {CHECKPOINT_MAX_AGE}s)" if age > CHECKPOINT_MAX_AGE else "taken before the last market close"
+        logger.warning(f"Ignoring checkpoint {key}: {reason}")
+        # Its 1m candles (a shutdown hands them over) are still written once the upload workers run
+        for saved in restored:
+            for cndl in (saved.prev_1m, saved.candles[TF_1M]):
+                if cndl is not None:
+                    stranded_1m.append((saved.symbol, cndl))
+        # (upserted: after a crash the old process may have written them already)
+        replay_upsert_before = max([now] + [cndl.end for _symbol, cndl in stranded_1m])
+        # Checkpoints are incremental: start the next one from an empty hash
+        await redis_client.delete(key)
+        return 0
+
+    for saved in restored:
+        state = get_state(saved.symbol)
+        state.closed_1m = saved.closed_1m
+        state.latest_ts = saved.latest_ts
+        state.prev_1m = saved.prev_1m
+        state.candles = saved.candles
+        for cndl in (state.prev_1m, state.candles[TF_1M]):
+            if cndl is not None:
+                candle_wheel[cndl.start].add(state)  # the minute timer finalizes what expired meanwhile
+        if columnar is not None:
+            columnar_unsynced.add(state)  # already in the checkpoint hash
+
+    # Rewind the group: entries after the checkpoint are delivered again (acked or not)
+    try:
+        await redis_client.xgroup_create(stream, group, id=stream_id, mkstream=True)
+    except Exception:
+        await redis_client.xgroup_setid(stream, group, stream_id)
+    stream_position = stream_id
+    checkpoint_restored = checkpoint_saved = True
+    replay_upsert_before = now
+    logger.info(f"✓ Restored {len(restored)} symbols from checkpoint ({age:.1f}s old); replaying {stream} after {stream_id}")
+    return len(restored)
+
+async def save_checkpoint():
+    """
+    Write the states changed since the last checkpoint and the stream position to Redis
+    (skipped mid-batch or before any batch). A failed write keeps them queued for the next one.
+    """
+    global checkpoint_dirty, checkpoint_saved
+    if checkpoint_target is None or stream_position is None or applying_batch:
+        return False
+    redis_client, group = checkpoint_target
+    started = time.perf_counter()
+    # Encoded without awaiting, so the snapshot matches stream_position exactly
+    changed, checkpoint_dirty = checkpoint_dirty, set()
+    fields = encode_checkpoint(changed, stream_position, now_ms(),
+                               [(key[0], doc) for key, doc in unstored_finals.items()])
+    key = checkpoint_key(group)
+    try:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, CHECKPOINT_MAX_AGE)
+        await pipe.execute()
+    except Exception as e:
+        checkpoint_dirty |= changed
+        logger.error(f"✗ Checkpoint write failed: {e}")
+        return False
+    checkpoint_saved = True
+    logger.debug(f"Checkpoint: {len(changed)} symbols at {stream_position} in {(time.perf_counter() - started) * 1000:.1f}ms")
+    return True
+
+async def checkpoint_loop(interval=None):
+    while True:
+        await asyncio.sleep(interval or CHECKPOINT_INTERVAL)
+        try:
+            while applying_batch:
+                await asyncio.sleep(0.05)
+            await save_checkpoint()
+        except Exception as e:
+            logger.error(f"Checkpoint error: {e}")
 
 async def start_aggregator(message_queue, mongo_client):
     # Ensure mongo_client is a Motor client
@@ -487,12 +1242,12 @@ async def start_aggregator(message_queue, mongo_client):
     collection = db.get_collection('OHCLVData1m')
     daily_collection = db.get_collection('OHCLVData')
     weekly_collection = db.get_collection('OHCLVData2')
-    MARKET_CLOSE_UTC_HOUR = get_market_close_hour_utc()  # Automatically handles DST
-    logger.info(f"Aggregator market close hour: {MARKET_CLOSE_UTC_HOUR}:00 UTC (4:00 PM ET)")
+    # Market close per day comes from the shared trading calendar (DST, early closes)
+    logger.info(f"Aggregator next market close: {datetime.utcfromtimestamp(calendar.next_close()):%Y-%m-%d %H:%M} UTC")
     
     # PERFORMANCE: Upload queue to smooth out massive concurrent candle completions
     # With 8500 symbols × 7 timeframes, candles complete simultaneously at aligned intervals
-    global upload_queue
+    global upload_queue, stream_position, applying_batch
     upload_queue = asyncio.Queue(maxsize=100000)  # Large queue for peak loads
     
     # Start upload worker pool (parallel uploads to MongoDB)
@@ -502,36 +1257,59 @@ async def start_aggregator(message_queue, mongo_client):
         task = asyncio.create_task(upload_worker(db, i, upload_queue))
         upload_worker_tasks.append(task)
     logger.info(f"Started {NUM_UPLOAD_WORKERS} upload workers for parallel MongoDB writes")
+
+    # 1m candles from a stale checkpoint (not folded into the fresh higher timeframes)
+    for symbol, cndl in stranded_1m:
+        state = get_state(symbol)
+        if state.closed_1m is None or cndl.start > state.closed_1m:
+            state.closed_1m = cndl.start
+        await finalize_candle(state, TF_1M, cndl)
+    if stranded_1m:
+        logger.info(f"Wrote {len(stranded_1m)} 1m candles from a stale checkpoint")
+        stranded_1m.clear()
+    # Bars finalized before the checkpoint but not written yet (upserted: the old process may have since)
+    for collection_name, doc in restored_finals:
+        key = (collection_name, doc['tickerID'], doc['timestamp'])
+        unstored_finals[key] = doc
+        replayed_finals.add(key)
+        await upload_queue.put({'collection': collection_name, 'doc': doc})
+    if restored_finals:
+        logger.info(f"Requeued {len(restored_finals)} finalized candles from the checkpoint")
+        restored_finals.clear()
     
-    # PERFORMANCE: Batch insert buffers and throttling
-    last_publish_time = {}  # {(symbol, tf): timestamp} for throttling
-    PUBLISH_THROTTLE = 0.5  # Publish updates every 0.5s (lower latency for pro app)
+    # 1m finalization timer, memory cleanup, publish flusher, plus crypto candles running 24/7 alongside the market-hours candles
+    background_tasks = [
+        asyncio.create_task(candle_timer_loop()),
+        asyncio.create_task(cleanup_old_candles()),
+        asyncio.create_task(publish_flusher_loop()),
+        asyncio.create_task(refresh_crypto_symbols_loop(db)),
+        asyncio.create_task(flush_crypto_candles_at_midnight()),
+    ]
+    background_tasks.append(asyncio.create_task(amend_flusher_loop(db)))
+    if checkpoint_target is not None:
+        background_tasks.append(asyncio.create_task(checkpoint_loop()))
     
     # Upload metrics
     upload_stats = {
         '1m': {'batches': 0, 'success': 0, 'failed': 0},
         'higher_tf': {'batches': 0, 'success': 0, 'failed': 0}
     }
-    last_stats_log = datetime.utcnow()
 
     # --- Weekly candle cache initialization ---
-    now_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
-    week_start_utc = get_week_start(now_utc)
+    # (a restored checkpoint already holds the week so far)
+    week_start = week_start_ms(now_ms())
+    week_start_utc = ms_to_datetime(week_start)
     # Query all weekly candles for current week
-    weekly_docs = await weekly_collection.find({"timestamp": week_start_utc}).to_list(length=10000)
+    weekly_docs = [] if checkpoint_restored else await weekly_collection.find({"timestamp": week_start_utc}).to_list(length=10000)
     symbols_to_delete = []
     for doc in weekly_docs:
         symbol = doc["tickerID"]
-        pending_weekly_candles[symbol] = {
-            "open": doc["open"],
-            "high": doc["high"],
-            "low": doc["low"],
-            "close": doc["close"],
-            "volume": doc.get("volume", 0),
-            "start": week_start_utc,
-            "end": week_start_utc + timedelta(days=7),
-            "final": False
-        }
+        if not owns_symbol(symbol):
+            continue  # another partition worker resumes (and deletes) this one
+        state = get_state(symbol)
+        state.candles[TF_1W] = Candle(week_start, week_start + WEEK_MS,
+                                      doc["open"], doc["high"], doc["low"], doc["close"], doc.get("volume", 0))
+        sync_state(state)
         symbols_to_delete.append(symbol)
     # Delete current week's weekly candle documents from DB
     if symbols_to_delete:
@@ -542,344 +1320,80 @@ async def start_aggregator(message_queue, mongo_client):
         anomaly_count = 0
         last_log_time = datetime.utcnow()
         while True:
-            msg = await message_queue.get()
-            try:
-                data = json.loads(msg)
-                service = data.get("service")
-                d = data.get("data")
-                if not isinstance(d, list):
-                    logger.warning(f"Malformed data: {data}")
-                    continue
-
-                # --- Parse symbol, price, timestamp for IEX data only ---
-                if service == "iex" and len(d) > 2:
-                    symbol = d[1].upper()
-                    price = float(d[2])
-                    ts = d[0]
-                    processed_count += 1
-                else:
-                    logger.warning(f"Unknown service or data format: {data}")
-                    continue
-
-                # Log summary every minute
-                now_log = datetime.utcnow()
-                if (now_log - last_log_time).total_seconds() >= 60:
-                    logger.info(f"[Aggregator] Status - Active 1m candles: {len(candles)}, Pending higher TF: {len(pending_candles)}, Daily: {len(pending_daily_candles)}, Weekly: {len(pending_weekly_candles)}")
-                    last_log_time = now_log
-
-                bucket = get_1min_bucket(ts)
-                key = (symbol, bucket)
-                candle = candles.get(key)
-                if not candle:
-                    candles[key] = {
-                        "timestamp": bucket,
-                        "tickerID": symbol,
-                        "open": price,
-                        "high": price,
-                        "low": price,
-                        "close": price,
-                        "volume": 0
-                    }
-                    logger.info(f"[Aggregator] Created new 1m candle for {symbol} at {bucket}")
-                else:
-                    candle["high"] = max(candle["high"], price)
-                    candle["low"] = min(candle["low"], price)
-                    candle["close"] = price
-                    logger.debug(f"[Aggregator] Updated 1m candle for {symbol} at {bucket} - price: {price}")
-
-                # --- OPTIMIZED: Throttled publish for in-progress 1m candle ---
-                pub_key = (symbol, "1m")
-                now_time = datetime.utcnow()
-                last_pub = last_publish_time.get(pub_key)
-                if last_pub is None or (now_time - last_pub).total_seconds() >= PUBLISH_THROTTLE:
-                    asyncio.create_task(publish_candle(symbol, "1m", {
-                        "timestamp": candles[key]["timestamp"],
-                        "tickerID": candles[key]["tickerID"],
-                        "open": candles[key]["open"],
-                        "close": candles[key]["close"],
-                        "high": candles[key]["high"],
-                        "low": candles[key]["low"],
-                        "volume": candles[key].get("volume", 0),
-                        "final": False
-                    }))
-                    last_publish_time[pub_key] = now_time
-
-                # Check for finished buckets and queue for upload
-                now = datetime.utcnow().replace(second=0, microsecond=0, tzinfo=timezone.utc)
-                finished = []
-                for (sym, bkt), cndl in list(candles.items()):
-                    if now >= bkt + timedelta(minutes=1):
-                        # Queue finished candle for upload (handled by workers)
-                        doc = {
-                            "timestamp": cndl["timestamp"],
-                            "tickerID": cndl["tickerID"],
-                            "open": cndl["open"],
-                            "close": cndl["close"],
-                            "high": cndl["high"],
-                            "low": cndl["low"],
-                            "volume": cndl.get("volume", 0)
-                        }
-                        
-                        # Store in recently_completed cache (available to websocket during upload)
-                        cache_key = (sym, '1m', cndl["timestamp"])
-                        recently_completed_candles[cache_key] = {
-                            'candle': doc,
-                            'completed_at': now
-                        }
-                        
-                        # Add to upload queue (non-blocking)
-                        try:
-                            upload_queue.put_nowait({
-                                'collection': 'OHCLVData1m',
-                                'doc': doc
-                            })
-                        except asyncio.QueueFull:
-                            logger.warning(f"Upload queue full, waiting to enqueue 1m candle for {sym}")
-                            await upload_queue.put({'collection': 'OHCLVData1m', 'doc': doc})
-                        
-                        finished.append((sym, bkt))
-                        
-                        # Publish finalized candle immediately (important for real-time)
-                        asyncio.create_task(publish_candle(sym, "1m", {
-                            "timestamp": cndl["timestamp"],
-                            "tickerID": cndl["tickerID"],
-                            "open": cndl["open"],
-                            "close": cndl["close"],
-                            "high": cndl["high"],
-                            "low": cndl["low"],
-                            "volume": cndl.get("volume", 0),
-                            "final": True
-                        }))
-                
-                # Now safe to remove from main cache (still available in recently_completed)
-                for k in finished:
-                    candles.pop(k, None)
-                
-                # Log upload queue status periodically
-                time_since_stats = (datetime.utcnow() - last_stats_log).total_seconds()
-                if time_since_stats >= 60:  # Every minute
-                    queue_size = upload_queue.qsize()
-                    logger.info(f"[Aggregator] Upload queue: {queue_size} pending, Active 1m candles: {len(candles)}, Higher TF: {len(pending_candles)}, Daily: {len(pending_daily_candles)}, Weekly: {len(pending_weekly_candles)}")
-                    last_stats_log = datetime.utcnow()
-
-
-                # --- Higher timeframe candle logic with throttled publishing ---
-                for tf, minutes in HIGHER_TIMEFRAMES.items():
-                    bucket_start, bucket_end = get_bucket(ts, minutes)
-                    tf_key = (symbol, tf)
-                    tf_candle = pending_candles.get(tf_key)
-                    if not tf_candle or tf_candle.get('end') != bucket_end:
-                        # Finalize previous candle if exists and not finalized
-                        if tf_candle and not tf_candle.get('final', False):
-                            tf_candle['final'] = True
-                            tf_coll_name = f'OHCLVData{tf}' if tf != '1hr' else 'OHCLVData1hr'
-                            doc = {
-                                'tickerID': symbol,
-                                'timestamp': tf_candle['start'],
-                                'open': tf_candle['open'],
-                                'high': tf_candle['high'],
-                                'low': tf_candle['low'],
-                                'close': tf_candle['close'],
-                                'volume': tf_candle['volume']
-                            }
-                            
-                            # Store in recently_completed cache (available to websocket during upload)
-                            cache_key = (symbol, tf, tf_candle['start'])
-                            recently_completed_candles[cache_key] = {
-                                'candle': doc,
-                                'completed_at': datetime.utcnow().replace(tzinfo=timezone.utc)
-                            }
-                            
-                            # Queue for upload (handled by workers)
-                            tf_coll_name = f'OHCLVData{tf}' if tf != '1hr' else 'OHCLVData1hr'
-                            try:
-                                upload_queue.put_nowait({
-                                    'collection': tf_coll_name,
-                                    'doc': doc
-                                })
-                            except asyncio.QueueFull:
-                                logger.warning(f"Upload queue full, waiting to enqueue {tf} candle for {symbol}")
-                                await upload_queue.put({'collection': tf_coll_name, 'doc': doc})
-                            
-                            # Publish finalized immediately
-                            asyncio.create_task(publish_candle(symbol, tf, {**doc, 'final': True}))
-                        # Start new candle
-                        pending_candles[tf_key] = {
-                            'open': price,
-                            'high': price,
-                            'low': price,
-                            'close': price,
-                            'volume': 0,
-                            'start': bucket_start,
-                            'end': bucket_end,
-                            'final': False
-                        }
-                    else:
-                        tf_candle['high'] = max(tf_candle['high'], price)
-                        tf_candle['low'] = min(tf_candle['low'], price)
-                        tf_candle['close'] = price
-                    # Optionally, accumulate volume if available in d
-                    if isinstance(d, dict) and 'volume' in d:
-                        pending_candles[tf_key]['volume'] += float(d['volume'])
-
-                    # OPTIMIZED: Throttled publish for in-progress higher TF candles
-                    pub_key = (symbol, tf)
-                    last_pub = last_publish_time.get(pub_key)
-                    if last_pub is None or (now_time - last_pub).total_seconds() >= PUBLISH_THROTTLE:
-                        asyncio.create_task(publish_candle(symbol, tf, {
-                            'tickerID': symbol,
-                            'open': pending_candles[tf_key]['open'],
-                            'high': pending_candles[tf_key]['high'],
-                            'low': pending_candles[tf_key]['low'],
-                            'close': pending_candles[tf_key]['close'],
-                            'volume': pending_candles[tf_key]['volume'],
-                            'timestamp': pending_candles[tf_key]['start'],
-                            'final': False
-                        }))
-                        last_publish_time[pub_key] = now_time
-
-                # --- Daily candle logic (UTC) ---
-                # Use UTC midnight for candle timestamp, finalize at market close (20:00 UTC)
-                if isinstance(ts, (int, float)):
-                    dt_utc = datetime.utcfromtimestamp(ts / 1000).replace(tzinfo=timezone.utc)
-                elif isinstance(ts, str):
-                    dt_utc = datetime.fromisoformat(ts.replace("Z", "+00:00")).astimezone(timezone.utc)
-                else:
-                    raise ValueError("Unknown timestamp format")
-
-                day_start_utc = dt_utc.replace(hour=0, minute=0, second=0, microsecond=0)
-                market_close_utc = day_start_utc.replace(hour=MARKET_CLOSE_UTC_HOUR, minute=0, second=0, microsecond=0)
-                if market_close_utc <= day_start_utc:
-                    market_close_utc += timedelta(days=1)
-
-                daily_key = symbol
-                daily_candle = pending_daily_candles.get(daily_key)
-                if not daily_candle or daily_candle.get('end') != market_close_utc:
-                    # Finalize previous daily candle if exists and not finalized
-                    # Start new daily candle
-                    pending_daily_candles[daily_key] = {
-                        'open': price,
-                        'high': price,
-                        'low': price,
-                        'close': price,
-                        'volume': 0,
-                        'start': day_start_utc,
-                        'end': market_close_utc,
-                        'final': False
-                    }
-                else:
-                    daily_candle['high'] = max(daily_candle['high'], price)
-                    daily_candle['low'] = min(daily_candle['low'], price)
-                    daily_candle['close'] = price
-                # Optionally, accumulate volume if available in d
-                if isinstance(d, dict) and 'volume' in d:
-                    pending_daily_candles[daily_key]['volume'] += float(d['volume'])
-
-                # OPTIMIZED: Throttled publish for daily candles
-                pub_key = (symbol, '1d')
-                last_pub = last_publish_time.get(pub_key)
-                if last_pub is None or (now_time - last_pub).total_seconds() >= PUBLISH_THROTTLE:
-                    asyncio.create_task(publish_candle(symbol, '1d', {
-                        'tickerID': symbol,
-                        'open': pending_daily_candles[daily_key]['open'],
-                        'high': pending_daily_candles[daily_key]['high'],
-                        'low': pending_daily_candles[daily_key]['low'],
-                        'close': pending_daily_candles[daily_key]['close'],
-                        'volume': pending_daily_candles[daily_key]['volume'],
-                        'timestamp': pending_daily_candles[daily_key]['start'],
-                        'final': False
-                    }))
-                    last_publish_time[pub_key] = now_time
-
-                # Finalize and persist higher timeframe candles if their interval is over
-                # (This catches any stragglers that didn't finalize at bucket transitions)
-                for tf, minutes in HIGHER_TIMEFRAMES.items():
-                    tf_key = (symbol, tf)
-                    tf_candle = pending_candles.get(tf_key)
-                    if tf_candle and not tf_candle['final'] and now >= tf_candle['end']:
-                        tf_candle['final'] = True
-                        tf_coll_name = f'OHCLVData{tf}' if tf != '1hr' else 'OHCLVData1hr'
-                        doc = {
-                            'tickerID': symbol,
-                            'timestamp': tf_candle['start'],
-                            'open': tf_candle['open'],
-                            'high': tf_candle['high'],
-                            'low': tf_candle['low'],
-                            'close': tf_candle['close'],
-                            'volume': tf_candle['volume']
-                        }
-                        # Queue for upload
-                        try:
-                            upload_queue.put_nowait({'collection': tf_coll_name, 'doc': doc})
-                        except asyncio.QueueFull:
-                            await upload_queue.put({'collection': tf_coll_name, 'doc': doc})
-                        
-                        await publish_candle(symbol, tf, {**doc, 'final': True})
-                        del pending_candles[tf_key]
-
-                # --- Weekly candle logic (UTC week start) ---
-                week_start_utc = get_week_start(dt_utc)
-                week_end_utc = week_start_utc + timedelta(days=7)
-                weekly_key = symbol
-                weekly_candle = pending_weekly_candles.get(weekly_key)
-                if not weekly_candle or weekly_candle.get('end') != week_end_utc:
-                    # Finalize previous weekly candle if exists and not finalized
-                    # Start new weekly candle
-                    pending_weekly_candles[weekly_key] = {
-                        'open': price,
-                        'high': price,
-                        'low': price,
-                        'close': price,
-                        'volume': 0,
-                        'start': week_start_utc,
-                        'end': week_end_utc,
-                        'final': False
-                    }
-                else:
-                    weekly_candle['high'] = max(weekly_candle['high'], price)
-                    weekly_candle['low'] = min(weekly_candle['low'], price)
-                    weekly_candle['close'] = price
-                # Optionally, accumulate volume if available in d
-                if isinstance(d, dict) and 'volume' in d:
-                    pending_weekly_candles[weekly_key]['volume'] += float(d['volume'])
-
-                # OPTIMIZED: Throttled publish for weekly candles
-                pub_key = (symbol, '1w')
-                last_pub = last_publish_time.get(pub_key)
-                if last_pub is None or (now_time - last_pub).total_seconds() >= PUBLISH_THROTTLE:
-                    asyncio.create_task(publish_candle(symbol, '1w', {
-                        'tickerID': symbol,
-                        'open': pending_weekly_candles[weekly_key]['open'],
-                        'high': pending_weekly_candles[weekly_key]['high'],
-                        'low': pending_weekly_candles[weekly_key]['low'],
-                        'close': pending_weekly_candles[weekly_key]['close'],
-                        'volume': pending_weekly_candles[weekly_key]['volume'],
-                        'timestamp': pending_weekly_candles[weekly_key]['start'],
-                        'final': False
-                    }))
-                    last_publish_time[pub_key] = now_time
+            # The stream adapter hands over whole XREADGROUP batches (a single message is a batch of one)
+            batch = await message_queue.get()
+            if not isinstance(batch, list):
+                batch = [batch]
+            batch_start = time.perf_counter()
+            size = len(batch)
+            i = 0
+            applying_batch = True
+            while i < size:
+                try:
+                    # One try block per batch; on error skip the bad message and resume after it
+                    for i in range(i, size):
+                        tick = parse_message(batch[i])
+                        if tick is not None and owns_symbol(tick[0]):
+                            await apply_tick(*tick)
+                            processed_count += 1
+                    i = size
+                except Exception as e:
+                    logger.error(f"Aggregator message error: {e}, msg: {batch[i]}")
+                    anomaly_count += 1
+                    if anomaly_count % 10 == 0:
+                        logger.warning(f"Aggregator anomalies detected: {anomaly_count}")
+                    i += 1
+            applying_batch = False
+            last_id = getattr(batch, 'last_id', None)
+            if last_id is not None:
+                stream_position = last_id
+            _record_batch_metrics(size, time.perf_counter() - batch_start)
 
+            # Log summary every minute
+            now_log = datetime.utcnow()
+            if (now_log - last_log_time).total_seconds() >= 60:
+                counts = state_counts()
+                logger.info(f"[Aggregator] Status - Processed: {processed_count}, Symbols: {len(states)}, Active 1m candles: {counts['1m']}, Pending higher TF: {counts['higher_tf']}, Daily: {counts['daily']}, Weekly: {counts['weekly']}, Upload queue: {upload_queue.qsize()} pending, Late ticks: {late_ticks['amended']} amended / {late_ticks['dropped']} dropped")
+                last_log_time = now_log
 
-            except Exception as e:
-                logger.error(f"Aggregator message error: {e}, msg: {msg}")
-                anomaly_count += 1
-            if anomaly_count > 0 and anomaly_count % 10 == 0:
-                logger.warning(f"Aggregator anomalies detected: {anomaly_count}")
+            # Queue.get() doesn't yield while batches are waiting; let the timer and publish flusher run
+            await asyncio.sleep(0)
     except asyncio.CancelledError:
-        # On shutdown, flush all remaining candles with validation and retry
+        for task in background_tasks:
+            task.cancel()
+        # Finalized candles still queued or buffered go to Mongo before the client is closed
+        await stop_upload_workers(db, upload_worker_tasks)
+        try:
+            await flush_amends(db)
+        except Exception as e:
+            logger.error(f"Amend flush error on shutdown: {e}")
+        try:
+            await flush_publishes()
+        except Exception as e:
+            logger.error(f"Publish flush error on shutdown: {e}")
+        # Hand every open candle, 1m included, over to the next process in a final checkpoint: it
+        # resumes the minute from the stream. Interrupted mid-batch, the previous checkpoint plus
+        # replay rebuilds the same state. Without a checkpoint the 1m candles are flushed here.
+        handed_over = False
+        if checkpoint_target is not None:
+            checkpoint_dirty.update(states.values())
+            if applying_batch:
+                logger.warning("Shutdown interrupted a batch; keeping the previous checkpoint")
+                handed_over = checkpoint_saved
+            else:
+                handed_over = await save_checkpoint()
+        if handed_over:
+            logger.info(f"Aggregator shutdown: open candles of {len(states)} symbols handed over in the checkpoint")
+            return
+
         docs = []
-        for cndl in candles.values():
-            doc = {
-                "timestamp": cndl["timestamp"],
-                "tickerID": cndl["tickerID"],
-                "open": cndl["open"],
-                "close": cndl["close"],
-                "high": cndl["high"],
-                "low": cndl["low"],
-                "volume": cndl.get("volume", 0)
-            }
-            if validate_candle_data(doc):
-                docs.append(doc)
+        for state in states.values():
+            for cndl in (state.prev_1m, state.candles[TF_1M]):
+                if cndl is None:
+                    continue
+                doc = cndl.to_doc(state.symbol)
+                if validate_candle_data(doc):
+                    docs.append(doc)
         
         if docs:
             try:
@@ -898,28 +1412,107 @@ async def start_aggregator(message_queue, mongo_client):
             except Exception as e:
                 logger.error(f"MongoDB insert error on shutdown: {e}")
 
+def _market_hours_states():
+    return [state for state in states.values() if state.symbol not in crypto_symbols]
+
+def _drop_market_hours_candles(*indices):
+    """Clear the given timeframe slots of every non-crypto symbol."""
+    for state in _market_hours_states():
+        for idx in indices:
+            state.candles[idx] = None
+        if TF_1M in indices:
+            state.prev_1m = None
+        if checkpoint_target is not None:
+            checkpoint_dirty.add(state)
+    if columnar is not None:
+        sync_columnar()
+        slots = indices + (PREV_1M,) if TF_1M in indices else indices
+        columnar.clear(slots, ~columnar.row_mask(crypto_symbols))
+
+def market_snapshot(timeframe):
+    """Every open candle of a timeframe as docs (columnar store only, else None)."""
+    if columnar is None or timeframe not in TF_INDEX:
+        return None
+    sync_columnar()
+    return columnar.snapshot(TF_INDEX[timeframe])
+
+def market_breadth(timeframe='1d'):
+    """Advancers/decliners of the open candles of a timeframe, stocks only (columnar store only, else None)."""
+    if columnar is None or timeframe not in TF_INDEX:
+        return None
+    sync_columnar()
+    return columnar.breadth(TF_INDEX[timeframe], include=~columnar.row_mask(crypto_symbols))
+
+def _market_close_docs(idx, last_1m_close, stocks=None):
+    """
+    Mark the open idx candles of every non-crypto symbol final, sync their close to the last 1m
+    close and return ([(symbol, doc)], synced). last_1m_close is {symbol: close}, or per-row
+    closes (stocks = row mask) when the columnar store builds the docs in one vectorized pass.
+    """
+    tf = TIMEFRAMES[idx]
+    if columnar is not None:
+        sync_columnar()  # ticks may have landed while the previous step was uploading
+        docs, synced, invalid = columnar.close_docs(idx, stocks, last_1m_close)
+        pairs = []
+        for doc in docs:
+            symbol = doc['tickerID']
+            candle = states[symbol].candles[idx]
+            if candle is not None:
+                candle.final = True
+            pairs.append((symbol, doc))
+        if invalid:
+            logger.warning(f"[MarketClose] Skipping {invalid} invalid {tf} candles")
+        return pairs, synced
+
+    pairs = []
+    synced = 0
+    for state in _market_hours_states():
+        symbol = state.symbol
+        candle = state.candles[idx]
+        if candle is None:
+            continue
+        # Mark as final regardless of current state
+        candle.final = True
+
+        # Synchronize close price with last 1m candle if available
+        original_close = candle.close
+        if symbol in last_1m_close:
+            candle.close = last_1m_close[symbol]
+            if original_close != candle.close:
+                synced += 1
+                logger.debug(f"[MarketClose] Synced {tf} close for {symbol}: {original_close:.2f} -> {candle.close:.2f}")
+
+        doc = candle.to_doc(symbol)
+
+        # Validate before adding to batch
+        if validate_candle_data(doc):
+            pairs.append((symbol, doc))
+        else:
+            logger.warning(f"[MarketClose] Skipping invalid {tf} candle for {symbol}")
+    return pairs, synced
+
 async def flush_daily_weekly_candles_at_market_close(daily_collection, weekly_collection, market_close_utc_hour=None):
     """
-    Flush ALL candles at market close. If market_close_utc_hour is None, calculate dynamically with DST.
+    Flush ALL candles at market close. If market_close_utc_hour is None, the next close comes
+    from the shared trading calendar (DST, holidays and early closes).
     This ensures all pending candles (intraday, daily, weekly) are:
     1. Marked as final
     2. Uploaded to MongoDB
     3. Published to Redis
     4. Removed from memory
     """
+    last_close_ts = 0
     while True:
-        # Recalculate market close hour on each iteration to handle DST changes
+        now = datetime.utcnow().replace(tzinfo=timezone.utc)
         if market_close_utc_hour is None:
-            close_hour = get_market_close_hour_utc()
+            # Never pick the close we just flushed again (sleep can wake up a hair early)
+            next_close = datetime.fromtimestamp(calendar.next_close(max(now.timestamp(), last_close_ts + 1)), timezone.utc)
         else:
-            close_hour = market_close_utc_hour
-        
-        now = datetime.utcnow().replace(tzinfo=timezone.utc)
-        # Wait until the next market close (automatically accounts for DST)
-        next_close = now.replace(hour=close_hour, minute=0, second=0, microsecond=0)
-        if now >= next_close:
-            next_close += timedelta(days=1)
-        wait_seconds = (next_close - now).total_seconds()
+            next_close = now.replace(hour=market_close_utc_hour, minute=0, second=0, microsecond=0)
+            if now >= next_close:
+                next_close += timedelta(days=1)
+        last_close_ts = next_close.timestamp()
+        wait_seconds = max(0, (next_close - now).total_seconds())
         logger.info(f"[MarketClose] Waiting {wait_seconds/3600:.2f} hours until next market close at {next_close}")
         await asyncio.sleep(wait_seconds)
 
@@ -932,20 +1525,31 @@ async def flush_daily_weekly_candles_at_market_close(daily_collection, weekly_co
         
         total_flushed = 0
 
+        if ROLLUP_MODE:
+            # Fold the still-open 1m bars so every timeframe closes on the last 1m close
+            for state in _market_hours_states():
+                for bar in (state.prev_1m, state.candles[TF_1M]):
+                    if bar is not None:
+                        await fold_1m_bar(state, bar, expire=False)
+
         # Step 1: Flush ALL 1-minute candles that are still pending
         one_min_flushed = 0
         collection_1m = db.get_collection('OHCLVData1m')
         docs_1m = []
-        for (sym, bkt), cndl in list(candles.items()):
-            docs_1m.append({
-                "timestamp": cndl["timestamp"],
-                "tickerID": cndl["tickerID"],
-                "open": cndl["open"],
-                "close": cndl["close"],
-                "high": cndl["high"],
-                "low": cndl["low"],
-                "volume": cndl.get("volume", 0)
-            })
+        stocks = None
+        # Crypto keeps trading after the close; its candles finalize on their own schedule
+        if columnar is not None:
+            sync_columnar()
+            stocks = ~columnar.row_mask(crypto_symbols)
+            # Last 1m close per row, captured before the 1m slots are dropped
+            last_1m_close = columnar.last_1m_close()
+            for slot in (PREV_1M, TF_1M):
+                docs_1m.extend(columnar.close_docs(slot, stocks)[0])
+        else:
+            for state in _market_hours_states():
+                for cndl in (state.prev_1m, state.candles[TF_1M]):
+                    if cndl is not None:
+                        docs_1m.append(cndl.to_doc(state.symbol))
         if docs_1m:
             try:
                 result = await batch_insert_with_retry(
@@ -964,24 +1568,28 @@ async def flush_daily_weekly_candles_at_market_close(daily_collection, weekly_co
                 
                 one_min_flushed = result['success']
                 # Clear from memory
-                candles.clear()
+                _drop_market_hours_candles(TF_1M)
             except Exception as e:
                 logger.error(f"[MarketClose] ✗ Critical error flushing 1m candles: {e}")
                 # Still clear memory to prevent buildup
-                candles.clear()
+                _drop_market_hours_candles(TF_1M)
         
         total_flushed += one_min_flushed
 
         # Build a map of the last 1m close price for each symbol to ensure consistency
         # Only use validated candles
-        last_1m_close = {}
-        for doc in docs_1m:
-            if validate_candle_data(doc):
-                sym = doc['tickerID']
-                # Keep the most recent close price (docs_1m should be in chronological order)
-                last_1m_close[sym] = doc['close']
-        
-        logger.info(f"[MarketClose] Captured last 1m close prices for {len(last_1m_close)} symbols")
+        if columnar is None:
+            last_1m_close = {}
+            for doc in docs_1m:
+                if validate_candle_data(doc):
+                    sym = doc['tickerID']
+                    # Keep the most recent close price (docs_1m should be in chronological order)
+                    last_1m_close[sym] = doc['close']
+            captured = len(last_1m_close)
+        else:
+            captured = int((stocks & ~np.isnan(last_1m_close)).sum())
+
+        logger.info(f"[MarketClose] Captured last 1m close prices for {captured} symbols")
 
         # Step 2: Flush ALL intraday candles (5m, 15m, 30m, 1hr) with synchronized close prices
         intraday_flushed = 0
@@ -989,34 +1597,10 @@ async def flush_daily_weekly_candles_at_market_close(daily_collection, weekly_co
         intraday_docs_by_collection = defaultdict(list)
         
         # First, prepare all documents with validation
-        for (symbol, tf), tf_candle in list(pending_candles.items()):
-            # Mark as final regardless of current state
-            tf_candle['final'] = True
-            
-            # Synchronize close price with last 1m candle if available
-            original_close = tf_candle['close']
-            if symbol in last_1m_close:
-                tf_candle['close'] = last_1m_close[symbol]
-                if original_close != tf_candle['close']:
-                    intraday_synced += 1
-                    logger.debug(f"[MarketClose] Synced {tf} close for {symbol}: {original_close:.2f} -> {tf_candle['close']:.2f}")
-            
-            tf_coll_name = f'OHCLVData{tf}' if tf != '1hr' else 'OHCLVData1hr'
-            doc = {
-                'tickerID': symbol,
-                'timestamp': tf_candle['start'],
-                'open': tf_candle['open'],
-                'high': tf_candle['high'],
-                'low': tf_candle['low'],
-                'close': tf_candle['close'],
-                'volume': tf_candle['volume']
-            }
-            
-            # Validate before adding to batch
-            if validate_candle_data(doc):
-                intraday_docs_by_collection[tf_coll_name].append((symbol, tf, doc))
-            else:
-                logger.warning(f"[MarketClose] Skipping invalid {tf} candle for {symbol}")
+        for idx, tf, _minutes in INTRADAY_SLOTS:
+            pairs, synced = _market_close_docs(idx, last_1m_close, stocks)
+            intraday_docs_by_collection[COLLECTIONS[idx]].extend((symbol, tf, doc) for symbol, doc in pairs)
+            intraday_synced += synced
         
         # Batch insert by collection
         for tf_coll_name, doc_list in intraday_docs_by_collection.items():
@@ -1044,7 +1628,7 @@ async def flush_daily_weekly_candles_at_market_close(daily_collection, weekly_co
                 logger.error(f"[MarketClose] ✗ Error batch flushing {tf_coll_name}: {e}")
         
         # Remove all from memory (even failed ones to prevent buildup)
-        pending_candles.clear()
+        _drop_market_hours_candles(*(idx for idx, _tf, _minutes in INTRADAY_SLOTS))
         
         if intraday_flushed > 0:
             logger.info(f"[MarketClose] ✓ Flushed {intraday_flushed} intraday candles (5m, 15m, 30m, 1hr)")
@@ -1054,36 +1638,7 @@ async def flush_daily_weekly_candles_at_market_close(daily_collection, weekly_co
 
         # Step 3: Flush ALL daily candles with synchronized close prices
         daily_flushed = 0
-        daily_synced = 0
-        daily_docs = []
-        
-        for symbol, daily_candle in list(pending_daily_candles.items()):
-            # Mark as final regardless of current state
-            daily_candle['final'] = True
-            
-            # Synchronize close price with last 1m candle if available
-            original_close = daily_candle['close']
-            if symbol in last_1m_close:
-                daily_candle['close'] = last_1m_close[symbol]
-                if original_close != daily_candle['close']:
-                    daily_synced += 1
-                    logger.debug(f"[MarketClose] Synced daily close for {symbol}: {original_close:.2f} -> {daily_candle['close']:.2f}")
-            
-            doc = {
-                'tickerID': symbol,
-                'timestamp': daily_candle['start'],
-                'open': daily_candle['open'],
-                'high': daily_candle['high'],
-                'low': daily_candle['low'],
-                'close': daily_candle['close'],
-                'volume': daily_candle['volume']
-            }
-            
-            # Validate before adding to batch
-            if validate_candle_data(doc):
-                daily_docs.append((symbol, doc))
-            else:
-                logger.warning(f"[MarketClose] Skipping invalid daily candle for {symbol}")
+        daily_docs, daily_synced = _market_close_docs(TF_1D, last_1m_close, stocks)
         
         # Batch insert all daily candles
         if daily_docs:
@@ -1112,41 +1667,12 @@ async def flush_daily_weekly_candles_at_market_close(daily_collection, weekly_co
                 logger.error(f"[MarketClose] ✗ Critical error flushing daily candles: {e}")
         
         # Remove all from memory (even failed ones)
-        pending_daily_candles.clear()
+        _drop_market_hours_candles(TF_1D)
         total_flushed += daily_flushed
 
         # Step 4: Flush ALL weekly candles with synchronized close prices
         weekly_flushed = 0
-        weekly_synced = 0
-        weekly_docs = []
-        
-        for symbol, weekly_candle in list(pending_weekly_candles.items()):
-            # Mark as final regardless of current state
-            weekly_candle['final'] = True
-            
-            # Synchronize close price with last 1m candle if available
-            original_close = weekly_candle['close']
-            if symbol in last_1m_close:
-                weekly_candle['close'] = last_1m_close[symbol]
-                if original_close != weekly_candle['close']:
-                    weekly_synced += 1
-                    logger.debug(f"[MarketClose] Synced weekly close for {symbol}: {original_close:.2f} -> {weekly_candle['close']:.2f}")
-            
-            doc = {
-                'tickerID': symbol,
-                'timestamp': weekly_candle['start'],
-                'open': weekly_candle['open'],
-                'high': weekly_candle['high'],
-                'low': weekly_candle['low'],
-                'close': weekly_candle['close'],
-                'volume': weekly_candle['volume']
-            }
-            
-            # Validate before adding to batch
-            if validate_candle_data(doc):
-                weekly_docs.append((symbol, doc))
-            else:
-                logger.warning(f"[MarketClose] Skipping invalid weekly candle for {symbol}")
+        weekly_docs, weekly_synced = _market_close_docs(TF_1W, last_1m_close, stocks)
         
         # Batch insert all weekly candles
         if weekly_docs:
@@ -1175,7 +1701,7 @@ async def flush_daily_weekly_candles_at_market_close(daily_collection, weekly_co
                 logger.error(f"[MarketClose] ✗ Critical error flushing weekly candles: {e}")
         
         # Remove all from memory (even failed ones)
-        pending_weekly_candles.clear()
+        _drop_market_hours_candles(TF_1W)
         total_flushed += weekly_flushed
 
         # Final summary
@@ -1195,20 +1721,27 @@ async def main_aggregator_and_flush(message_queue, mongo_client):
     db = mongo_client.get_database('EreunaDB')
     daily_collection = db.get_collection('OHCLVData')
     weekly_collection = db.get_collection('OHCLVData2')
-    # Start all tasks including memory cleanup
+    # start_aggregator runs the memory cleanup itself
     aggregator_task = asyncio.create_task(start_aggregator(message_queue, mongo_client))
     flush_task = asyncio.create_task(flush_daily_weekly_candles_at_market_close(daily_collection, weekly_collection))
-    cleanup_task = asyncio.create_task(cleanup_old_candles())
-    await asyncio.gather(aggregator_task, flush_task, cleanup_task)
+    await asyncio.gather(aggregator_task, flush_task)
     
 
 async def redis_stream_adapter(queue: asyncio.Queue, redis_client: aioredis.Redis, stream='tiingo:stream', group='aggregator', consumer=None, block=5000, count=500):
     """
     OPTIMIZED: Read messages from a Redis Stream using XREADGROUP with larger batches (500 instead of 100).
-    Messages are expected as a field 'data' containing the raw JSON string.
+    Messages are expected as a field 'data' containing the raw JSON string, or a
+    compact binary record (see server.common.tick_codec) that is decoded here to
+    a (symbol, price, epoch ms) tuple. Each XREADGROUP batch is put on the queue
+    as one list, which start_aggregator processes in a single pass.
     """
     if consumer is None:
         consumer = f"consumer-{os.getpid()}"
+    symbols = SymbolDictionary(redis_client)
+    try:
+        await symbols.load()
+    except Exception as e:
+        logger.warning(f"Could not preload symbol dictionary: {e}")
     # Create group if not exists
     try:
         await redis_client.xgroup_create(stream, group, id='0', mkstream=True)
@@ -1233,11 +1766,31 @@ async def redis_stream_adapter(queue: asyncio.Queue, redis_client: aioredis.Redi
                     
                     # PERFORMANCE: Batch acknowledge at the end instead of per-message
                     msg_ids = []
+                    batch = StreamBatch()
+                    last_id = messages[-1][0]
+                    batch.last_id = last_id.decode('utf-8') if isinstance(last_id, bytes) else last_id
+                    batch_ids = []
                     for msg_id, fields in messages:
                         data = None
                         if b'data' in fields:
                             raw = fields[b'data']
-                            if isinstance(raw, bytes):
+                            if isinstance(raw, bytes) and is_binary(raw):
+                                try:
+                                    if is_conflated(raw):
+                                        ts_ms, sid, open_, high, low, close, _count = decode_conflated(raw)
+                                    else:
+                                        ts_ms, sid, close = decode_tick(raw)
+                                        open_ = None
+                                    symbol = await symbols.symbol_for(sid)
+                                except Exception as e:
+                                    symbol = None
+                                    logger.warning(f"Undecodable binary tick {msg_id}: {e}")
+                                if symbol is None:
+                                    logger.warning(f"Dropping binary tick {msg_id} with unknown symbol id")
+                                    msg_ids.append(msg_id)
+                                    continue
+                                data = (symbol, close, ts_ms) if open_ is None else (symbol, close, ts_ms, open_, high, low)
+                            elif isinstance(raw, bytes):
                                 try:
                                     data = raw.decode('utf-8')
                                 except Exception:
@@ -1251,12 +1804,16 @@ async def redis_stream_adapter(queue: asyncio.Queue, redis_client: aioredis.Redi
                             msg_ids.append(msg_id)
                             continue
 
-                        # Put into queue for aggregator to process
+                        batch.append(data)
+                        batch_ids.append(msg_id)
+
+                    # Hand the whole batch to the aggregator (acknowledged only once queued)
+                    if batch:
                         try:
-                            await queue.put(data)
-                            msg_ids.append(msg_id)
+                            await queue.put(batch)
+                            msg_ids.extend(batch_ids)
                         except Exception as e:
-                            logger.error(f"Failed to put redis message into queue: {e}")
+                            logger.error(f"Failed to put {len(batch)} redis messages into queue: {e}")
                     
                     # Batch acknowledge all messages at once
                     if msg_ids:
@@ -16,8 +16,11 @@ from server.aggregator.aggregator import (
     redis_stream_adapter,
 )
 from server.aggregator.organizer import Daily
+from server.aggregator.workers import AGGREGATOR_WORKERS, WorkerPool, group_name, prune_consumer_groups
 from pydantic import BaseModel, validator
 from server.aggregator.ipo import IPO
+from server.common.trading_calendar import calendar
+from server.common.tick_codec import is_binary, is_conflated, decode_tick, decode_conflated
 import re
 
 logger = logging.getLogger('aggregator_server')
@@ -34,6 +37,14 @@ upload_batch_size = Histogram('aggregator_upload_batch_size', 'Upload batch size
 upload_duration_seconds = Histogram('aggregator_upload_duration_seconds', 'Upload duration in seconds', ['collection'])
 pending_candles_gauge = Gauge('aggregator_pending_candles', 'Number of pending candles in memory', ['type'])
 
+# Ingestion metrics (per stream batch)
+ingest_batch_size = Histogram('aggregator_ingest_batch_size', 'Messages per stream batch processed by the aggregator',
+                              buckets=(1, 10, 50, 100, 250, 500, 1000))
+ingest_batch_duration_seconds = Histogram('aggregator_ingest_batch_duration_seconds', 'Time to process one stream batch',
+                                          buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+ingest_messages_total = Counter('aggregator_ingest_messages_total', 'Stream messages processed by the aggregator')
+late_ticks_total = Counter('aggregator_late_ticks_total', 'Ticks behind their bar: amended into a finalized bar or dropped', ['outcome'])
+
 # Filter out health check/metrics logs from uvicorn access logger
 class HealthCheckFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
@@ -69,6 +80,7 @@ async def startup():
                     app.state.redis_client = redis_from_url(alt)
                     pong2 = await app.state.redis_client.ping()
                     logger.debug(f"Redis fallback ping successful: {pong2}")
+                    REDIS_URL = alt
             except Exception as e2:
                 logger.warning(f"Redis fallback also failed: {e2}")
     except Exception:
@@ -136,20 +148,47 @@ async def startup():
         aggregator_mod.metrics_callbacks['upload_batch_size'] = lambda coll, size: upload_batch_size.labels(collection=coll).observe(size)
         aggregator_mod.metrics_callbacks['upload_duration'] = lambda coll, duration: upload_duration_seconds.labels(collection=coll).observe(duration)
         aggregator_mod.metrics_callbacks['pending_candles'] = lambda candle_type, count: pending_candles_gauge.labels(type=candle_type).set(count)
+        aggregator_mod.metrics_callbacks['ingest_batch_size'] = lambda size: (ingest_batch_size.observe(size), ingest_messages_total.inc(size))
+        aggregator_mod.metrics_callbacks['ingest_batch_duration'] = lambda duration: ingest_batch_duration_seconds.observe(duration)
+        aggregator_mod.metrics_callbacks['late_ticks'] = lambda outcome: late_ticks_total.labels(outcome=outcome).inc()
         logger.debug('Connected Prometheus metrics to aggregator module')
     except Exception:
         logger.exception('Failed to connect metrics callbacks')
 
-    app.state.queue = asyncio.Queue()
-
-    # start background tasks
-    app.state.adapter_task = asyncio.create_task(redis_stream_adapter(app.state.queue, app.state.redis_client))
-    app.state.aggregator_task = asyncio.create_task(start_aggregator(app.state.queue, app.state.mongo_client))
+    # Drop consumer groups of a previous worker count so they don't hold back stream trimming
+    try:
+        await prune_consumer_groups(app.state.redis_client, {group_name(i, AGGREGATOR_WORKERS) for i in range(AGGREGATOR_WORKERS)})
+    except Exception:
+        logger.exception('Failed to prune stale consumer groups')
 
     db = app.state.mongo_client.get_database('EreunaDB')
-    daily_collection = db.get_collection('OHCLVData')
-    weekly_collection = db.get_collection('OHCLVData2')
-    app.state.flush_task = asyncio.create_task(flush_daily_weekly_candles_at_market_close(daily_collection, weekly_collection))
+
+    # Trading calendar: load holidays/early closes before anything schedules around market close
+    await calendar.refresh(db)
+    app.state.calendar_task = asyncio.create_task(calendar.refresh_loop(db))
+
+    if AGGREGATOR_WORKERS > 1:
+        # Symbol-partitioned worker processes aggregate (each with its own market-close flush);
+        # this process keeps the HTTP endpoints, metrics and the organizer
+        app.state.worker_pool = WorkerPool(AGGREGATOR_WORKERS, REDIS_URL, MONGO_URI, aggregator_mod.metrics_callbacks)
+        app.state.worker_pool.start()
+    else:
+        app.state.queue = asyncio.Queue()
+
+        # Resume in-progress candles from the last checkpoint before the stream adapter starts reading
+        try:
+            await aggregator_mod.restore_checkpoint(app.state.redis_client, group_name(0, 1))
+        except Exception:
+            logger.exception('Failed to restore aggregator checkpoint')
+
+        # start background tasks
+        app.state.adapter_task = asyncio.create_task(redis_stream_adapter(app.state.queue, app.state.redis_client))
+        app.state.aggregator_task = asyncio.create_task(start_aggregator(app.state.queue, app.state.mongo_client))
+
+    if AGGREGATOR_WORKERS <= 1:
+        daily_collection = db.get_collection('OHCLVData')
+        weekly_collection = db.get_collection('OHCLVData2')
+        app.state.flush_task = asyncio.create_task(flush_daily_weekly_candles_at_market_close(daily_collection, weekly_collection))
 
     # organizer task to run Daily() 3 hours after market close (automatically handles DST)
     # Runs every day (including weekends) to support crypto data updates
@@ -194,7 +233,7 @@ async def startup():
 async def shutdown():
     logger.info('Aggregator server shutting down')
     # cancel tasks
-    tasks = ['adapter_task', 'aggregator_task', 'flush_task', 'organizer_task']
+    tasks = ['adapter_task', 'aggregator_task', 'flush_task', 'organizer_task', 'calendar_task']
     for name in tasks:
         t = getattr(app.state, name, None)
         if t:
@@ -203,8 +242,17 @@ async def shutdown():
             except Exception:
                 pass
 
-    # allow tasks to cancel
+    # allow tasks to cancel; the aggregator hands its open candles over in a final checkpoint (or flushes the 1m ones)
     await asyncio.sleep(0)
+    aggregator_task = getattr(app.state, 'aggregator_task', None)
+    if aggregator_task is not None:
+        await asyncio.wait([aggregator_task], timeout=30)
+    # partition workers hand over their open candles on SIGTERM
+    if getattr(app.state, 'worker_pool', None) is not None:
+        try:
+            await app.state.worker_pool.stop()
+        except Exception:
+            logger.exception('Failed to stop aggregator workers')
     # attempt graceful close
     try:
         if getattr(app.state, 'redis_client', None) is not None:
@@ -257,6 +305,14 @@ async def debug_redis_stream():
             for msg_id, fields in last_messages:
                 if b'data' in fields:
                     try:
+                        if is_binary(fields[b'data']) and is_conflated(fields[b'data']):
+                            ts_ms, sid, o, h, l, c, n = decode_conflated(fields[b'data'])
+                            last_msg_data.append({'id': msg_id.decode('utf-8'), 'binary': {'ts': ts_ms, 'symbolId': sid, 'open': o, 'high': h, 'low': l, 'close': c, 'count': n}})
+                            continue
+                        if is_binary(fields[b'data']):
+                            ts_ms, sid, price = decode_tick(fields[b'data'])
+                            last_msg_data.append({'id': msg_id.decode('utf-8'), 'binary': {'ts': ts_ms, 'symbolId': sid, 'price': price}})
+                            continue
                         data = json.loads(fields[b'data'].decode('utf-8'))
                         last_msg_data.append({'id': msg_id.decode('utf-8'), 'data': data})
                     except Exception:
@@ -266,12 +322,17 @@ async def debug_redis_stream():
         
         # Get aggregator state
         from . import aggregator as agg_mod
+        pool = getattr(app.state, 'worker_pool', None)
+        counts = pool.state_counts() if pool is not None else {**agg_mod.state_counts(), 'symbols': len(agg_mod.states)}
         agg_state = {
-            'active_1m_candles': len(agg_mod.candles),
-            'pending_higher_tf': len(agg_mod.pending_candles),
-            'pending_daily': len(agg_mod.pending_daily_candles),
-            'pending_weekly': len(agg_mod.pending_weekly_candles),
+            'symbols': counts.get('symbols', 0),
+            'active_1m_candles': counts.get('1m', 0),
+            'pending_higher_tf': counts.get('higher_tf', 0),
+            'pending_daily': counts.get('daily', 0),
+            'pending_weekly': counts.get('weekly', 0),
         }
+        if pool is not None:
+            agg_state['workers'] = pool.status()
         
         return {
             'stream_length': stream_length,
@@ -286,6 +347,30 @@ async def debug_redis_stream():
         return {'error': str(e)}
 
 
+@app.get('/market/snapshot/{timeframe}')
+async def market_snapshot(timeframe: str):
+    """Every open candle of a timeframe (needs AGGREGATOR_COLUMNAR=1 and a single aggregator process)"""
+    from . import aggregator as agg_mod
+    if getattr(app.state, 'worker_pool', None) is not None or agg_mod.columnar is None:
+        return {'error': 'columnar store not enabled in this process'}
+    candles = agg_mod.market_snapshot(timeframe)
+    if candles is None:
+        return {'error': f'unknown timeframe {timeframe}'}
+    return {'timeframe': timeframe, 'count': len(candles), 'candles': candles}
+
+
+@app.get('/market/breadth/{timeframe}')
+async def market_breadth(timeframe: str = '1d'):
+    """Advancers/decliners over the open stock candles of a timeframe (columnar store only)"""
+    from . import aggregator as agg_mod
+    if getattr(app.state, 'worker_pool', None) is not None or agg_mod.columnar is None:
+        return {'error': 'columnar store not enabled in this process'}
+    breadth = agg_mod.market_breadth(timeframe)
+    if breadth is None:
+        return {'error': f'unknown timeframe {timeframe}'}
+    return breadth
+
+
 @app.get('/ready')
 async def ready():
     # check redis and mongo connectivity
@@ -0,0 +1,101 @@
+"""
+Crash-safe checkpoints of the aggregator's in-progress candles.
+- Every CHECKPOINT_INTERVAL seconds the SymbolStates changed since the last
+  checkpoint are written to one Redis hash per consumer group
+  (aggr:checkpoint:{group}, one field per symbol), together with the id of the
+  last stream entry applied to them, in one MULTI
+- On startup the state is restored and the consumer group is rewound to that
+  id, so everything after it (including entries that were acknowledged but
+  never applied) is read again through the normal XREADGROUP path
+- Bars ending before the restore may already have been written by the process
+  that stopped, so the ones replay finalizes again are upserted, not inserted
+- The lateness watermark (latest_ts) is restored; the recent-final rings are
+  not, so a late tick for a bar finalized before the restart is dropped
+- Finalized bars still waiting for their Mongo insert are saved with it (their
+  ticks are behind the stream id) and requeued as upserts on restore
+- The ingestor's stream trimmer keeps entries after a checkpoint's stream id;
+  the hash expires after CHECKPOINT_MAX_AGE so an abandoned one can't pin the stream
+- On shutdown the final checkpoint also carries the open 1m candles, so the
+  next process completes the minute instead of a truncated bar being written
+- Checkpoints older than CHECKPOINT_MAX_AGE or taken before the last market
+  close are not resumed; only their 1m candles are written
+"""
+import os
+from datetime import datetime
+from operator import attrgetter, itemgetter
+
+import orjson
+
+from server.aggregator.state import TIMEFRAMES, Candle, SymbolState
+
+CHECKPOINT_INTERVAL = float(os.getenv('AGGREGATOR_CHECKPOINT_INTERVAL', '5'))  # seconds, 0 = disabled
+CHECKPOINT_MAX_AGE = int(os.getenv('AGGREGATOR_CHECKPOINT_MAX_AGE', '900'))  # seconds
+CHECKPOINT_VERSION = 1
+SYMBOL_FIELD = 's:'  # per-symbol hash field prefix
+FINALS_FIELD = 'finals'  # finalized bars not in Mongo yet
+
+_candle_fields = attrgetter('start', 'end', 'open', 'high', 'low', 'close', 'volume', 'final')
+_bar_fields = itemgetter('tickerID', 'timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+
+def checkpoint_key(group):
+    return f"aggr:checkpoint:{group}"
+
+
+def _candle(candle):
+    return None if candle is None else _candle_fields(candle)
+
+
+def _restore_candle(fields):
+    if fields is None:
+        return None
+    candle = Candle(*fields[:7])
+    candle.final = fields[7]
+    return candle
+
+
+def encode_checkpoint(changed, stream_id, saved_at, finals=()):
+    """
+    Hash fields for one checkpoint: the header, the unwritten finalized bars ([(collection, doc)],
+    rewritten every time) and one field per changed SymbolState.
+    """
+    dumps = orjson.dumps
+    fields = {
+        'version': CHECKPOINT_VERSION,
+        'stream_id': stream_id,
+        'saved_at': saved_at,
+        FINALS_FIELD: dumps([(collection, *_bar_fields(doc)) for collection, doc in finals]),
+    }
+    for state in changed:
+        fields[SYMBOL_FIELD + state.symbol] = dumps((state.closed_1m, _candle(state.prev_1m),
+                                                    [None if c is None else _candle_fields(c) for c in state.candles],
+                                                    state.latest_ts))
+    return fields
+
+
+def decode_checkpoint(fields):
+    """
+    Hash fields (as returned by HGETALL) -> (stream_id, saved_at ms, [SymbolState], [(collection, doc)]),
+    or None for a missing or incompatible checkpoint.
+    """
+    fields = {k.decode('utf-8') if isinstance(k, bytes) else k: v for k, v in fields.items()}
+    if not fields or int(fields.get('version', 0)) != CHECKPOINT_VERSION:
+        return None
+    stream_id = fields['stream_id']
+    stream_id = stream_id.decode('utf-8') if isinstance(stream_id, bytes) else stream_id
+    restored = []
+    for field, value in fields.items():
+        if not field.startswith(SYMBOL_FIELD):
+            continue
+        closed_1m, prev_1m, candles, *rest = orjson.loads(value)
+        state = SymbolState(field[len(SYMBOL_FIELD):])
+        state.closed_1m = closed_1m
+        state.latest_ts = rest[0] if rest else 0  # lateness watermark (absent in older checkpoints)
+        state.prev_1m = _restore_candle(prev_1m)
+        state.candles = [_restore_candle(c) for c in candles[:len(TIMEFRAMES)]]
+        restored.append(state)
+    finals = []
+    for collection, symbol, timestamp, open_price, high_price, low_price, close, volume in orjson.loads(fields.get(FINALS_FIELD, b'[]')):
+        finals.append((collection, {'tickerID': symbol, 'timestamp': datetime.fromisoformat(timestamp), 'open': open_price,
+                                    'high': high_price, 'low': low_price, 'close': close, 'volume': volume}))
+    return stream_id, int(fields['saved_at']), restored, finals
@@ -0,0 +1,207 @@
+"""
+Columnar NumPy mirror of the aggregator's live candles (opt-in, AGGREGATOR_COLUMNAR=1).
+- Each symbol gets an integer row id; every timeframe slot (plus the previous
+  minute's 1m candle) has preallocated float64 open/high/low/close/volume,
+  int64 start/end (epoch ms) and a uint8 flag byte (ACTIVE / DIRTY / FINAL)
+- SymbolState stays the source of truth for ticks; the aggregator queues
+  changed states and copies them in with each publish flush (and before any
+  whole-market read) through per-slot memoryviews (cheap scalar stores), so a
+  symbol that ticks many times between flushes is written once
+- DIRTY marks rows written since the last publish flush
+- Whole-market work (market-close docs, counts, snapshots, breadth) is done
+  with array operations over all rows instead of Python loops over candles
+"""
+import os
+
+import numpy as np
+
+from server.aggregator.state import TIMEFRAMES, TF_1M, TF_1D, TF_1W, ms_to_datetime
+
+COLUMNAR_STORE = os.getenv('AGGREGATOR_COLUMNAR', '0').lower() in ('1', 'true', 'yes')
+INITIAL_CAPACITY = int(os.getenv('AGGREGATOR_COLUMNAR_CAPACITY', '16384'))
+
+PREV_1M = len(TIMEFRAMES)  # extra slot: last minute's 1m candle, open until the minute timer finalizes it
+SLOTS = PREV_1M + 1
+
+ACTIVE = 1
+DIRTY = 2
+FINAL = 4
+
+_FLOAT_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+_INT_FIELDS = ('start', 'end')
+
+
+def _fit(array, n, fill):
+    """Pad a per-row array captured when there were fewer rows."""
+    if len(array) >= n:
+        return array[:n]
+    return np.concatenate((array, np.full(n - len(array), fill, dtype=array.dtype)))
+
+
+class ColumnarCandleStore:
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.ids = {}  # {symbol: row}
+        self.symbols = []  # row -> symbol
+        self.capacity = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        old = self.capacity
+        for name in _FLOAT_FIELDS:
+            array = np.zeros((SLOTS, capacity), dtype=np.float64)
+            if old:
+                array[:, :old] = getattr(self, name)
+            setattr(self, name, array)
+        for name in _INT_FIELDS:
+            array = np.zeros((SLOTS, capacity), dtype=np.int64)
+            if old:
+                array[:, :old] = getattr(self, name)
+            setattr(self, name, array)
+        flags = np.zeros((SLOTS, capacity), dtype=np.uint8)
+        if old:
+            flags[:, :old] = self.flags
+        self.flags = flags
+        self.capacity = capacity
+        # Per-slot memoryviews for the per-tick write path
+        self._views = tuple(tuple(memoryview(getattr(self, name)[slot]) for slot in range(SLOTS))
+                            for name in _FLOAT_FIELDS + _INT_FIELDS + ('flags',))
+
+    def add(self, symbol):
+        """Row id for symbol (assigned on first sight, never reused)."""
+        row = self.ids.get(symbol)
+        if row is None:
+            row = len(self.symbols)
+            if row >= self.capacity:
+                self._allocate(self.capacity * 2)
+            self.ids[symbol] = row
+            self.symbols.append(symbol)
+        return row
+
+    def write(self, row, slot, candle):
+        """Mirror one slot of a SymbolState (candle None = slot empty)."""
+        views = self._views
+        if candle is None:
+            views[7][slot][row] = 0
+            return
+        views[0][slot][row] = candle.open
+        views[1][slot][row] = candle.high
+        views[2][slot][row] = candle.low
+        views[3][slot][row] = candle.close
+        views[4][slot][row] = candle.volume
+        views[5][slot][row] = candle.start
+        views[6][slot][row] = candle.end
+        views[7][slot][row] = (ACTIVE | DIRTY | FINAL) if candle.final else (ACTIVE | DIRTY)
+
+    def write_state(self, state):
+        row = state.row
+        for slot, candle in enumerate(state.candles):
+            self.write(row, slot, candle)
+        self.write(row, PREV_1M, state.prev_1m)
+
+    # --- Whole-market operations ---
+
+    def _rows(self):
+        return len(self.symbols)
+
+    def active(self, slot=None):
+        n = self._rows()
+        flags = self.flags[:, :n] if slot is None else self.flags[slot, :n]
+        return (flags & ACTIVE) != 0
+
+    def row_mask(self, symbols):
+        """Boolean row mask for a set of symbols (loops over the set, not over rows)."""
+        mask = np.zeros(self._rows(), dtype=bool)
+        rows = [self.ids[s] for s in symbols if s in self.ids]
+        if rows:
+            mask[rows] = True
+        return mask
+
+    def counts(self):
+        per_slot = self.active().sum(axis=1)
+        return {
+            '1m': int(per_slot[TF_1M] + per_slot[PREV_1M]),
+            'higher_tf': int(per_slot[TF_1M + 1:TF_1D].sum()),
+            'daily': int(per_slot[TF_1D]),
+            'weekly': int(per_slot[TF_1W]),
+        }
+
+    def clear_dirty(self):
+        n = self._rows()
+        self.flags[:, :n] &= np.uint8(~DIRTY & 0xFF)
+
+    def clear(self, slots, rows):
+        """Mark the given slots empty for the rows selected by a boolean mask."""
+        for slot in slots:
+            self.flags[slot, :self._rows()][rows] = 0
+
+    def last_1m_close(self):
+        """Close of each row's newest open 1m candle (current minute, else previous), NaN if none."""
+        n = self._rows()
+        return np.where(self.active(TF_1M), self.close[TF_1M, :n],
+                        np.where(self.active(PREV_1M), self.close[PREV_1M, :n], np.nan))
+
+    def _docs(self, slot, rows, close):
+        """Mongo docs for the selected rows (one datetime per distinct bucket start)."""
+        starts = {}
+        symbols = self.symbols
+        docs = []
+        for row, start, open_, high, low, close_, volume in zip(
+                rows.tolist(), self.start[slot, rows].tolist(), self.open[slot, rows].tolist(),
+                self.high[slot, rows].tolist(), self.low[slot, rows].tolist(), close[rows].tolist(),
+                self.volume[slot, rows].tolist()):
+            timestamp = starts.get(start)
+            if timestamp is None:
+                timestamp = starts[start] = ms_to_datetime(start)
+            # Share volumes are integers in Mongo; only crypto carries fractional volume
+            docs.append({'tickerID': symbols[row], 'timestamp': timestamp, 'open': open_, 'high': high,
+                         'low': low, 'close': close_, 'volume': int(volume) if volume.is_integer() else volume})
+        return docs
+
+    def close_docs(self, slot, include, sync_close=None):
+        """
+        Docs for the open candles of slot in the rows selected by include. With sync_close
+        (per-row prices, NaN = keep) the close is replaced first, as the market-close flush does.
+        Rows with invalid OHLC are dropped. Returns (docs, synced, invalid).
+        Masks taken before symbols were added are padded (new rows: excluded / not synced).
+        """
+        n = self._rows()
+        selected = self.active(slot) & _fit(include, n, False)
+        close = self.close[slot, :n]
+        synced = 0
+        if sync_close is not None:
+            sync_close = _fit(sync_close, n, np.nan)
+            replace = selected & ~np.isnan(sync_close)
+            synced = int((replace & (sync_close != close)).sum())
+            close = np.where(replace, sync_close, close)
+        open_, high, low = self.open[slot, :n], self.high[slot, :n], self.low[slot, :n]
+        valid = (np.isfinite(open_) & np.isfinite(high) & np.isfinite(low) & np.isfinite(close)
+                 & (high >= np.maximum(open_, close)) & (low <= np.minimum(open_, close)))
+        rows = np.nonzero(selected & valid)[0]
+        invalid = int((selected & ~valid).sum())
+        return self._docs(slot, rows, close), synced, invalid
+
+    def snapshot(self, slot):
+        """Open (not final) candles of one timeframe slot as docs."""
+        n = self._rows()
+        rows = np.nonzero(self.active(slot) & ((self.flags[slot, :n] & FINAL) == 0))[0]
+        return self._docs(slot, rows, self.close[slot, :n])
+
+    def breadth(self, slot=TF_1D, include=None):
+        """Advancers / decliners / unchanged by close vs open of the open candles in slot."""
+        n = self._rows()
+        selected = self.active(slot) & ((self.flags[slot, :n] & FINAL) == 0)
+        if include is not None:
+            selected &= include
+        change = self.close[slot, :n][selected] - self.open[slot, :n][selected]
+        advancers = int((change > 0).sum())
+        decliners = int((change < 0).sum())
+        total = int(selected.sum())
+        return {
+            'timeframe': TIMEFRAMES[slot] if slot < PREV_1M else '1m',
+            'total': total,
+            'advancers': advancers,
+            'decliners': decliners,
+            'unchanged': total - advancers - decliners,
+            'advance_decline_ratio': advancers / decliners if decliners else None,
+        }
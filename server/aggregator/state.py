@@ -0,0 +1,101 @@
+"""
+Per-symbol candle state for the aggregator.
+- One SymbolState per symbol holds the in-progress candle of every timeframe in
+  a fixed slot list (indexed like TIMEFRAMES), plus its publish bookkeeping, so
+  a tick reaches everything with a single dict lookup
+- Candle and SymbolState use __slots__: no per-instance __dict__, and candle
+  fields are plain attributes instead of per-candle dicts
+- Bucket bounds are integer epoch milliseconds; datetimes are only built when
+  a candle is persisted or published (to_doc / to_pending)
+"""
+from datetime import datetime, timedelta, timezone
+
+TIMEFRAMES = ('1m', '5m', '15m', '30m', '1hr', '1d', '1w')
+TF_INDEX = {tf: i for i, tf in enumerate(TIMEFRAMES)}
+TF_1M = TF_INDEX['1m']
+TF_1D = TF_INDEX['1d']
+TF_1W = TF_INDEX['1w']
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def ms_to_datetime(ms):
+    """Epoch milliseconds -> aware UTC datetime (exact, unlike fromtimestamp on a float)."""
+    return _EPOCH + timedelta(milliseconds=ms)
+
+
+# Mongo collection per timeframe slot
+COLLECTIONS = ('OHCLVData1m', 'OHCLVData5m', 'OHCLVData15m', 'OHCLVData30m', 'OHCLVData1hr', 'OHCLVData', 'OHCLVData2')
+
+
+class Candle:
+    __slots__ = ('start', 'end', 'open', 'high', 'low', 'close', 'volume', 'final')
+
+    def __init__(self, start, end, open_price, high_price, low_price, close, volume=0):
+        self.start = start
+        self.end = end
+        self.open = open_price
+        self.high = high_price
+        self.low = low_price
+        self.close = close
+        self.volume = volume
+        self.final = False
+
+    def update(self, high_price, low_price, close, volume=0):
+        if high_price > self.high:
+            self.high = high_price
+        if low_price < self.low:
+            self.low = low_price
+        self.close = close
+        if volume:
+            self.volume += volume
+
+    def to_doc(self, symbol):
+        """Mongo document (also the published payload, plus 'final')."""
+        return {
+            'tickerID': symbol,
+            'timestamp': ms_to_datetime(self.start),
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'close': self.close,
+            'volume': self.volume
+        }
+
+    def to_pending(self):
+        """In-progress view in the shape the websocket service expects for higher timeframes."""
+        return {
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'close': self.close,
+            'volume': self.volume,
+            'start': ms_to_datetime(self.start),
+            'end': ms_to_datetime(self.end),
+            'final': self.final
+        }
+
+
+class SymbolState:
+    """
+    Everything the aggregator tracks for one symbol:
+    candles[i]       in-progress candle for TIMEFRAMES[i] (None when idle)
+    prev_1m          last minute's 1m candle, still open for stragglers until the minute timer finalizes it
+    closed_1m        start (epoch ms) of the newest finalized 1m bucket (older ticks are late for 1m)
+    latest_ts        newest tick timestamp seen (epoch ms); the lateness watermark trails it
+    dirty            bitmask of TIMEFRAMES slots updated since the last publish flush (bit i = TIMEFRAMES[i])
+    completed[i]     recent-final ring for TIMEFRAMES[i]: [(finalized_at ms, doc), ...] oldest first,
+                     served while the docs are being uploaded (None when empty)
+    row              row id in the columnar store (-1 when it is disabled)
+    """
+    __slots__ = ('symbol', 'row', 'candles', 'prev_1m', 'closed_1m', 'latest_ts', 'dirty', 'completed')
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.row = -1
+        self.candles = [None] * len(TIMEFRAMES)
+        self.prev_1m = None
+        self.closed_1m = None
+        self.latest_ts = 0
+        self.dirty = 0
+        self.completed = [None] * len(TIMEFRAMES)
@@ -0,0 +1,266 @@
+"""
+Symbol-partitioned aggregator worker processes (AGGREGATOR_WORKERS > 1).
+- Worker i of N owns the symbols with crc32(symbol) % N == i: it reads the shared
+  tiingo:stream through its own consumer group and skips everyone else's ticks,
+  so each symbol's candles live in exactly one process
+- Every worker runs the full aggregation stack for its partition (stream adapter,
+  candle state, upload queue + workers, publish flusher, market-close flush)
+- The uvicorn process keeps the HTTP endpoints and the Daily() organizer; worker
+  metrics are shipped back over a queue and applied to its Prometheus metrics
+- Workers that exit are restarted; SIGTERM lets a worker hand over (or flush) its open candles
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import queue as queue_mod
+import signal
+import time
+
+from server.aggregator.checkpoint import checkpoint_key
+
+AGGREGATOR_WORKERS = int(os.getenv('AGGREGATOR_WORKERS', '1'))  # 1 = aggregate inside the uvicorn process
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv('AGGREGATOR_WORKER_SHUTDOWN_TIMEOUT', '30'))
+WORKER_STATUS_INTERVAL = 30  # seconds between state_counts reports
+GROUP_PREFIX = 'aggregator'
+
+logger = logging.getLogger('aggregator.workers')
+
+
+def group_name(index, count):
+    """Consumer group for one partition; the worker count is part of the name so re-partitioning starts fresh groups."""
+    return GROUP_PREFIX if count <= 1 else f"{GROUP_PREFIX}-{index}of{count}"
+
+
+def _stream_id(value):
+    value = value.decode('utf-8') if isinstance(value, bytes) else value
+    ms, _, seq = value.partition('-')
+    return int(ms), int(seq or 0)
+
+
+async def prune_consumer_groups(redis_client, keep, stream='tiingo:stream'):
+    """
+    Drop aggregator consumer groups left over from another worker count. The ingestor
+    trims the stream to its slowest group, so an abandoned group would pin it at the hard ceiling.
+    The new groups start where the old ones stopped reading: created at '0' they would replay
+    the retained stream and write its bars a second time.
+    """
+    try:
+        groups = await redis_client.xinfo_groups(stream)
+    except Exception:
+        return []
+    existing = {}
+    for group in groups:
+        name = group.get('name')
+        existing[name.decode('utf-8') if isinstance(name, bytes) else name] = group
+    stale = {name: group for name, group in existing.items() if name.startswith(GROUP_PREFIX) and name not in keep}
+    if not stale:
+        return []
+    delivered = [_stream_id(group['last-delivered-id']) for group in stale.values() if group.get('last-delivered-id')]
+    if delivered:
+        start_id = '%d-%d' % max(delivered)
+        for name in keep:
+            if name not in existing:
+                await redis_client.xgroup_create(stream, name, id=start_id, mkstream=True)
+        logger.info(f"Created aggregator consumer groups at {start_id}, where the previous ones stopped")
+    for name in stale:
+        await redis_client.xgroup_destroy(stream, name)
+        await redis_client.delete(checkpoint_key(name))
+    logger.info(f"Removed stale aggregator consumer groups: {', '.join(stale)}")
+    return list(stale)
+
+
+# --- Worker process side ---
+
+def _report(metrics_queue, index, name, *args):
+    try:
+        metrics_queue.put_nowait((index, name, args))
+    except Exception:
+        pass  # metrics are best effort
+
+
+async def _status_loop(metrics_queue, index):
+    from server.aggregator import aggregator
+    while True:
+        await asyncio.sleep(WORKER_STATUS_INTERVAL)
+        _report(metrics_queue, index, 'state_counts', {**aggregator.state_counts(), 'symbols': len(aggregator.states)})
+
+
+async def _run_worker(index, count, redis_url, mongo_uri, metrics_queue):
+    import motor.motor_asyncio
+    from redis.asyncio import from_url as redis_from_url
+    from server.aggregator import aggregator
+    from server.common.trading_calendar import calendar
+
+    loop = asyncio.get_running_loop()
+    main = asyncio.current_task()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, main.cancel)
+
+    aggregator.symbol_partition = (index, count)
+    for name in aggregator.metrics_callbacks:
+        aggregator.metrics_callbacks[name] = functools.partial(_report, metrics_queue, index, name)
+
+    redis_client = redis_from_url(redis_url)
+    mongo_client = motor.motor_asyncio.AsyncIOMotorClient(
+        mongo_uri,
+        maxPoolSize=max(20, 100 // count),  # each worker runs its own upload workers
+        minPoolSize=4,
+        maxIdleTimeMS=45000,
+        serverSelectionTimeoutMS=5000,
+        retryWrites=True,
+        w=1,
+        journal=False
+    )
+    aggregator.redis_pub = redis_client
+    db = mongo_client.get_database('EreunaDB')
+    message_queue = asyncio.Queue()
+    tasks = []
+    try:
+        await calendar.refresh(db)
+        # Resume this partition's candles before its stream adapter starts reading
+        await aggregator.restore_checkpoint(redis_client, group_name(index, count))
+        tasks = [
+            asyncio.create_task(calendar.refresh_loop(db)),
+            asyncio.create_task(aggregator.redis_stream_adapter(message_queue, redis_client, group=group_name(index, count),
+                                                                consumer=f"worker-{index}-{os.getpid()}")),
+            asyncio.create_task(aggregator.start_aggregator(message_queue, mongo_client)),
+            asyncio.create_task(aggregator.flush_daily_weekly_candles_at_market_close(db.get_collection('OHCLVData'),
+                                                                                      db.get_collection('OHCLVData2'))),
+            asyncio.create_task(_status_loop(metrics_queue, index)),
+        ]
+        logger.info(f"✓ Aggregator worker {index + 1}/{count} started (pid {os.getpid()})")
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        # start_aggregator hands this partition's open candles over in a final checkpoint on cancel (or flushes the 1m ones)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await redis_client.close()
+        except Exception:
+            pass
+        mongo_client.close()
+        logger.info(f"Aggregator worker {index + 1}/{count} stopped")
+
+
+def worker_main(index, count, redis_url, mongo_uri, metrics_queue):
+    """Process entry point (spawned, so it imports the aggregator fresh)."""
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'info').upper(),
+        format=f"%(asctime)s %(levelname)s [worker {index}] %(name)s: %(message)s"
+    )
+    asyncio.run(_run_worker(index, count, redis_url, mongo_uri, metrics_queue))
+
+
+# --- uvicorn process side ---
+
+class WorkerPool:
+    """Spawns and supervises the partition workers and merges their metrics into metrics_callbacks."""
+
+    # Callbacks that set a gauge: keep each worker's last value and report the sum
+    GAUGES = {'pending_candles'}
+
+    def __init__(self, count, redis_url, mongo_uri, metrics_callbacks):
+        self.count = count
+        self.redis_url = redis_url
+        self.mongo_uri = mongo_uri
+        self.metrics_callbacks = metrics_callbacks
+        self._ctx = multiprocessing.get_context('spawn')
+        self._metrics_queue = self._ctx.Queue(maxsize=100000)
+        self._processes = [None] * count
+        self._restarts = [0] * count
+        self._gauges = {}  # {(name, label): {worker: value}}
+        self._status = {}  # {worker: state_counts report}
+        self._tasks = []
+        self._stopping = False
+
+    def start(self):
+        for index in range(self.count):
+            self._spawn(index)
+        self._tasks = [asyncio.create_task(self._drain_metrics()), asyncio.create_task(self._supervise())]
+        logger.info(f"✓ Started {self.count} aggregator worker processes")
+
+    def _spawn(self, index):
+        process = self._ctx.Process(
+            target=worker_main,
+            args=(index, self.count, self.redis_url, self.mongo_uri, self._metrics_queue),
+            name=f"aggregator-worker-{index}"
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def _supervise(self):
+        while not self._stopping:
+            await asyncio.sleep(5)
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive() and not self._stopping:
+                    self._restarts[index] += 1
+                    logger.error(f"✗ Aggregator worker {index} exited with code {process.exitcode}; restarting "
+                                 f"(restart #{self._restarts[index]})")
+                    self._spawn(index)
+
+    async def _drain_metrics(self):
+        while True:
+            try:
+                index, name, args = await asyncio.to_thread(self._metrics_queue.get, True, 1.0)
+            except queue_mod.Empty:
+                continue
+            except (EOFError, OSError):
+                return  # queue closed on shutdown
+            self._apply(index, name, args)
+
+    def _apply(self, index, name, args):
+        if name == 'state_counts':
+            self._status[index] = {**args[0], 'reported_at': time.time()}
+            return
+        callback = self.metrics_callbacks.get(name)
+        if not callback:
+            return
+        try:
+            if name in self.GAUGES:
+                label, value = args
+                per_worker = self._gauges.setdefault((name, label), {})
+                per_worker[index] = value
+                callback(label, sum(per_worker.values()))
+            else:
+                callback(*args)
+        except Exception:
+            pass
+
+    def state_counts(self):
+        """Merged candle counts from the workers' last status reports."""
+        merged = {}
+        for report in self._status.values():
+            for key, value in report.items():
+                if key != 'reported_at':
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def status(self):
+        return [{
+            'worker': index,
+            'pid': process.pid if process is not None else None,
+            'alive': process is not None and process.is_alive(),
+            'restarts': self._restarts[index],
+            'state': self._status.get(index),
+        } for index, process in enumerate(self._processes)]
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()  # SIGTERM: the worker hands over its open candles
+        for process in self._processes:
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, WORKER_SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"Aggregator worker {process.name} did not stop in {WORKER_SHUTDOWN_TIMEOUT:.0f}s; killing it")
+                process.kill()
+        self._metrics_queue.close()
@@ -0,0 +1,98 @@
+"""
+Microbenchmark: aggregator ticks/sec with many open 1m candles.
+
+Usage:
+    python -m server.benchmarks.bench_candle_finalize [--symbols N] [--ticks N]
+
+  scan   old path: every tick walks all of candles.items() looking for finished buckets
+  wheel  new path: candles are indexed by bucket; the minute timer finalizes expired buckets only
+
+Both paths run the same 1m candle update; only the finalization strategy differs.
+"""
+import argparse
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+sys.path.append('.')
+from server.aggregator.aggregator import get_1min_bucket
+
+
+def make_ticks(symbols, count):
+    base = datetime(2025, 11, 3, 14, 30, tzinfo=timezone.utc)
+    ts = (base + timedelta(seconds=30)).isoformat()
+    names = [f"SYM{i}" for i in range(symbols)]
+    return [(random.choice(names), random.uniform(5, 500), ts) for _ in range(count)], names, base
+
+
+def update(candles, symbol, price, ts):
+    bucket = get_1min_bucket(ts)
+    key = (symbol, bucket)
+    candle = candles.get(key)
+    if not candle:
+        candle = candles[key] = {"timestamp": bucket, "tickerID": symbol, "open": price,
+                                 "high": price, "low": price, "close": price, "volume": 0}
+        return key, True
+    candle["high"] = max(candle["high"], price)
+    candle["low"] = min(candle["low"], price)
+    candle["close"] = price
+    return key, False
+
+
+def scan_path(ticks, names, base):
+    candles = {}
+    for name in names:
+        update(candles, name, 1.0, ticks[0][2])
+    start = time.perf_counter()
+    for symbol, price, ts in ticks:
+        update(candles, symbol, price, ts)
+        now = datetime.utcnow().replace(second=0, microsecond=0, tzinfo=timezone.utc)
+        now = min(now, base)  # keep every candle open, as during a live minute
+        finished = []
+        for (sym, bkt), cndl in list(candles.items()):
+            if now >= bkt + timedelta(minutes=1):
+                finished.append((sym, bkt))
+        for k in finished:
+            candles.pop(k, None)
+    return time.perf_counter() - start
+
+
+def wheel_path(ticks, names, base):
+    candles = {}
+    wheel = defaultdict(set)
+    for name in names:
+        key, _ = update(candles, name, 1.0, ticks[0][2])
+        wheel[key[1]].add(key)
+    start = time.perf_counter()
+    for symbol, price, ts in ticks:
+        key, created = update(candles, symbol, price, ts)
+        if created:
+            wheel[key[1]].add(key)
+    # One minute-boundary firing finalizes everything that expired
+    boundary = base + timedelta(minutes=1)
+    for bkt in [b for b in wheel if boundary >= b + timedelta(minutes=1)]:
+        for key in wheel.pop(bkt):
+            candles.pop(key, None)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=8500, help='active symbols (open 1m candles)')
+    parser.add_argument('--ticks', type=int, default=5000, help='ticks for the scan path (the wheel path runs 100x)')
+    args = parser.parse_args()
+
+    ticks, names, base = make_ticks(args.symbols, args.ticks)
+    scan = args.ticks / scan_path(ticks, names, base)
+    ticks, names, base = make_ticks(args.symbols, args.ticks * 100)
+    wheel = args.ticks * 100 / wheel_path(ticks, names, base)
+    print(f"{args.symbols:,} open candles")
+    print(f"scan   {scan:>12,.0f} ticks/sec")
+    print(f"wheel  {wheel:>12,.0f} ticks/sec")
+    print(f"speedup {wheel / scan:.0f}x")
+
+
+if __name__ == '__main__':
+    main()
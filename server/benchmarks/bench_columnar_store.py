@@ -0,0 +1,86 @@
+"""
+Microbenchmark: whole-market operations over the live candles.
+
+Usage:
+    python -m server.benchmarks.bench_columnar_store [--symbols N] [--rounds R]
+
+  objects   loop over every SymbolState (market-close daily docs with synced closes, breadth)
+  columnar  the same from the NumPy mirror (masks and array math; docs built from columns)
+
+Both paths produce the same docs (checked before timing).
+"""
+import argparse
+import random
+import sys
+import time
+
+sys.path.append('.')
+from server.aggregator.columnar import ColumnarCandleStore
+from server.aggregator.state import TF_1M, TF_1D, Candle, SymbolState
+
+DAY_START = 1762128000000  # 2025-11-03 00:00 UTC
+
+
+def make_states(count):
+    store = ColumnarCandleStore()
+    states = []
+    for i in range(count):
+        state = SymbolState(f"SYM{i}")
+        state.row = store.add(state.symbol)
+        o = random.uniform(5, 500)
+        h, l = o * random.uniform(1, 1.05), o * random.uniform(0.95, 1)
+        state.candles[TF_1D] = Candle(DAY_START, DAY_START + 75600000, o, h, l, random.uniform(l, h), random.randint(0, 10**6))
+        state.candles[TF_1M] = Candle(DAY_START + 71940000, DAY_START + 72000000, o, h, l, random.uniform(l, h))
+        store.write_state(state)
+        states.append(state)
+    return states, store
+
+
+def objects_path(states, crypto):
+    changes = [s.candles[TF_1D].close - s.candles[TF_1D].open for s in states if s.symbol not in crypto]
+    breadth = (sum(c > 0 for c in changes), sum(c < 0 for c in changes))
+    last = {s.symbol: s.candles[TF_1M].close for s in states if s.symbol not in crypto}
+    docs = []
+    for state in states:
+        if state.symbol in crypto:
+            continue
+        candle = state.candles[TF_1D]
+        candle.close = last.get(state.symbol, candle.close)
+        docs.append(candle.to_doc(state.symbol))
+    return docs, breadth
+
+
+def columnar_path(store, crypto):
+    stocks = ~store.row_mask(crypto)
+    docs = store.close_docs(TF_1D, stocks, store.last_1m_close())[0]
+    breadth = store.breadth(TF_1D, stocks)
+    return docs, (breadth['advancers'], breadth['decliners'])
+
+
+def run(name, fn, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<9} {best * 1000:>8.2f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    states, store = make_states(args.symbols)
+    crypto = {f"SYM{i}" for i in range(0, args.symbols, 50)}
+    # Breadth is taken before the close sync on both paths (the objects path syncs in place)
+    assert objects_path(states, crypto) == columnar_path(store, crypto)
+    before = run('objects', lambda: objects_path(states, crypto), args.rounds)
+    after = run('columnar', lambda: columnar_path(store, crypto), args.rounds)
+    print(f"speedup  {before / after:>8.2f}x  ({args.symbols:,} symbols)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Microbenchmark: ingestor frame decoding, legacy path vs orjson fast path.
+
+Usage:
+    python -m server.benchmarks.bench_ingest_decode [--sample FILE] [--count N]
+
+FILE is a recorded sample with one raw Tiingo frame per line. Without it a
+synthetic open-bell mix (mostly IEX trades, some heartbeats) is generated.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+sys.path.append('.')
+from server.ingestor.decode import decode_frame, frame_size
+
+
+def synthetic_sample(count):
+    symbols = [f"sym{i}" for i in range(8500)]
+    frames = []
+    for i in range(count):
+        if i % 200 == 0:
+            frames.append(json.dumps({"messageType": "H", "response": {"code": 200, "message": "HeartBeat"}}))
+            continue
+        frames.append(json.dumps({
+            "messageType": "A",
+            "service": "iex",
+            "data": ["2025-11-03T09:30:01.123456789-05:00", random.choice(symbols), round(random.uniform(5, 500), 2)]
+        }, separators=(',', ':')))
+    return frames
+
+
+def load_sample(path):
+    with open(path, 'r') as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+def legacy_path(frames):
+    """What tiingo_subscription() did per frame before the fast path."""
+    stats = {}
+    for msg in frames:
+        data = json.loads(msg)
+        if data.get("messageType") in ("I", "H"):
+            continue
+        if (data.get("messageType") == "A" and
+                data.get("service") == "iex" and
+                isinstance(data.get("data"), list) and len(data["data"]) > 2):
+            symbol = data["data"][1].lower()
+            s = stats.setdefault(symbol, {'bytes': 0, 'messages': 0})
+            s['bytes'] += len(msg.encode("utf-8"))
+            s['messages'] += 1
+    return stats
+
+
+def fast_path(frames):
+    stats = {}
+    for msg in frames:
+        _message_type, _service, symbol, _price, _ts = decode_frame(msg)
+        if symbol is not None:
+            s = stats.setdefault(symbol.lower(), {'bytes': 0, 'messages': 0})
+            s['bytes'] += frame_size(msg)
+            s['messages'] += 1
+    return stats
+
+
+def run(name, fn, frames, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(frames)
+        best = min(best, time.perf_counter() - start)
+    rate = len(frames) / best
+    print(f"{name:<8} {rate:>12,.0f} msg/sec  ({best * 1000:.1f} ms for {len(frames):,} frames)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sample', help='recorded frames, one per line')
+    parser.add_argument('--count', type=int, default=200000, help='synthetic frame count')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    frames = load_sample(args.sample) if args.sample else synthetic_sample(args.count)
+    # The fast path receives raw bytes from the websocket (recv(decode=False))
+    raw_frames = [f.encode('utf-8') for f in frames]
+
+    assert legacy_path(frames) == fast_path(raw_frames), "decoders disagree"
+    before = run('legacy', legacy_path, frames, args.rounds)
+    after = run('orjson', fast_path, raw_frames, args.rounds)
+    print(f"speedup  {after / before:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Microbenchmark: per-message overhead of the ingestor receive loop.
+
+Usage:
+    python -m server.benchmarks.bench_recv_loop [--count N] [--rounds R]
+
+  timer     old loop: market-hours/shutdown check + asyncio.wait_for(ws.recv(), 5) per message
+  watchdog  new loop: plain await ws.recv(), checks moved to a 1s watchdog task
+
+Frames come from an in-memory connection whose recv() returns immediately,
+so the numbers isolate loop overhead (both loops do the same decode_frame work).
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+sys.path.append('.')
+from server.common.trading_calendar import calendar
+from server.ingestor.decode import decode_frame
+
+FRAME = json.dumps({
+    "messageType": "A",
+    "service": "iex",
+    "data": ["2025-11-03T09:30:01.123456789-05:00", "aapl", 187.25]
+}, separators=(',', ':')).encode('utf-8')
+
+
+class FakeConnection:
+    def __init__(self, count):
+        self.remaining = count
+
+    async def recv(self, decode=None):
+        if self.remaining == 0:
+            raise EOFError
+        self.remaining -= 1
+        return FRAME
+
+
+def is_market_hours():
+    """Same cost as the ingestor's check, but always open so the benchmark also runs after hours."""
+    calendar.is_open()
+    return True
+
+
+async def timer_loop(ws):
+    shutdown_requested = False
+    while True:
+        if not is_market_hours() or shutdown_requested:
+            break
+        try:
+            msg = await asyncio.wait_for(ws.recv(decode=False), timeout=5)
+        except asyncio.TimeoutError:
+            continue
+        except EOFError:
+            break
+        decode_frame(msg)
+
+
+async def watchdog_loop(ws):
+    received = 0
+
+    async def receive_loop():
+        nonlocal received
+        recv = ws.recv
+        while True:
+            msg = await recv(decode=False)
+            received += 1
+            decode_frame(msg)
+
+    async def watchdog():
+        while True:
+            await asyncio.sleep(1)
+
+    receiver = asyncio.create_task(receive_loop())
+    watcher = asyncio.create_task(watchdog())
+    await asyncio.wait((receiver, watcher), return_when=asyncio.FIRST_COMPLETED)
+    watcher.cancel()
+    await asyncio.gather(receiver, watcher, return_exceptions=True)
+
+
+def run(name, loop_fn, count, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        ws = FakeConnection(count)
+        start = time.perf_counter()
+        asyncio.run(loop_fn(ws))
+        best = min(best, time.perf_counter() - start)
+    per_msg = best / count * 1e9
+    print(f"{name:<9} {per_msg:>8.0f} ns/msg  ({count / best:>12,.0f} msg/sec)")
+    return per_msg
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=200000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    before = run('timer', timer_loop, args.count, args.rounds)
+    after = run('watchdog', watchdog_loop, args.count, args.rounds)
+    print(f"saved    {before - after:>8.0f} ns/msg  ({before / after:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
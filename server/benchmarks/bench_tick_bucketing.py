@@ -0,0 +1,105 @@
+"""
+Microbenchmark: per-tick bucketing in the aggregator.
+
+Usage:
+    python -m server.benchmarks.bench_tick_bucketing [--ticks N] [--rounds R]
+
+  datetime  old path: fromisoformat six times per tick (1m, 5m, 15m, 30m, 1hr, daily/weekly)
+            plus timedelta arithmetic for every bucket bound
+  epoch     new path: one parse to epoch ms, every bucket bound is integer arithmetic
+
+Both paths compute the same 1m/5m/15m/30m/1hr/daily/weekly bounds (checked
+before timing); the stock daily close comes from the trading calendar in both.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.append('.')
+from server.aggregator.aggregator import (DAY_MS, HIGHER_TIMEFRAMES, INTRADAY_SLOTS, MINUTE_MS, WEEK_MS,
+                                          get_1min_bucket, get_bucket, to_epoch_ms, week_start_ms)
+from server.aggregator.state import ms_to_datetime
+from server.common.trading_calendar import calendar
+
+
+def make_ticks(count):
+    base = datetime(2025, 11, 3, 14, 30, tzinfo=timezone.utc)
+    ticks = []
+    for _ in range(count):
+        ts = base + timedelta(seconds=random.uniform(0, 6.5 * 3600))
+        # Tiingo IEX style: exchange-local offset, nanosecond fraction
+        local = ts.astimezone(timezone(timedelta(hours=-5)))
+        ticks.append(local.strftime('%Y-%m-%dT%H:%M:%S.%f') + f"{random.randint(0, 999)}-05:00")
+    return ticks
+
+
+def get_week_start(dt):
+    dt = dt.astimezone(timezone.utc)
+    monday = dt - timedelta(days=dt.weekday())
+    return monday.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def datetime_path(ts):
+    bounds = [get_1min_bucket(ts)]
+    for minutes in HIGHER_TIMEFRAMES.values():
+        bounds.append(get_bucket(ts, minutes))
+    dt_utc = datetime.fromisoformat(ts.replace("Z", "+00:00")).astimezone(timezone.utc)
+    day_start = dt_utc.replace(hour=0, minute=0, second=0, microsecond=0)
+    market_close = datetime.fromtimestamp(calendar.close_for_day(dt_utc.timestamp()), timezone.utc)
+    week_start = get_week_start(dt_utc)
+    bounds.append((day_start, market_close))
+    bounds.append((week_start, week_start + timedelta(days=7)))
+    return bounds
+
+
+def epoch_path(ts):
+    ts_ms = to_epoch_ms(ts)
+    bounds = [ts_ms - ts_ms % MINUTE_MS]
+    for _idx, _tf, span in INTRADAY_SLOTS:
+        start = ts_ms - ts_ms % span
+        bounds.append((start, start + span))
+    day_start = ts_ms - ts_ms % DAY_MS
+    market_close = round(calendar.close_for_day(ts_ms / 1000) * 1000)
+    week_start = week_start_ms(ts_ms)
+    bounds.append((day_start, market_close))
+    bounds.append((week_start, week_start + WEEK_MS))
+    return bounds
+
+
+def check(ticks):
+    for ts in ticks:
+        old = datetime_path(ts)
+        new = epoch_path(ts)
+        converted = [ms_to_datetime(new[0])] + [tuple(ms_to_datetime(v) for v in pair) for pair in new[1:]]
+        assert converted == old, (ts, old, converted)
+
+
+def run(name, fn, ticks, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for ts in ticks:
+            fn(ts)
+        best = min(best, time.perf_counter() - start)
+    per_tick = best / len(ticks) * 1e9
+    print(f"{name:<9} {per_tick:>8.0f} ns/tick  ({len(ticks) / best:>12,.0f} ticks/sec)")
+    return per_tick
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ticks', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    ticks = make_ticks(args.ticks)
+    check(ticks[:10000])
+    before = run('datetime', datetime_path, ticks, args.rounds)
+    after = run('epoch', epoch_path, ticks, args.rounds)
+    print(f"saved    {before - after:>8.0f} ns/tick  ({before / after:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
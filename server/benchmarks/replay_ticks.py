@@ -0,0 +1,135 @@
+"""
+Replay captured ticks into a (local) Redis stream for load tests.
+
+Usage:
+    python -m server.benchmarks.replay_ticks CAPTURE [CAPTURE ...] [--speed N | --max]
+        [--redis-url URL] [--skip SECONDS] [--duration SECONDS] [--retime] [--publish]
+
+CAPTURE files are written by the ingestor when INGESTOR_CAPTURE_DIR is set
+(ticks-YYYY-MM-DD.cap.gz). Frames are XADDed to tiingo:stream exactly as the
+ingestor relays them, paced by their original receive timestamps:
+  --speed 1   real time (default), --speed 10   ten times faster, --max   no pacing
+Start the aggregator/websocket services against the same Redis to load-test
+or profile them, e.g. replay only the opening bell:
+    python -m server.benchmarks.replay_ticks ticks-2025-11-03.cap.gz --skip 0 --duration 300 --speed 5
+--retime shifts exchange timestamps so the first frame is "now", so candles
+are built and finalized as if the session were live.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import orjson
+import redis
+
+sys.path.append('.')
+from server.ingestor.capture import read_capture
+from server.ingestor.decode import parse_exchange_ts
+
+
+def retime_frame(frame, offset):
+    """Shift a trade frame's exchange timestamp by offset seconds (other frames pass through)."""
+    data = orjson.loads(frame)
+    d = data.get("data")
+    if data.get("messageType") != "A" or type(d) is not list or not d:
+        return frame
+    shifted = parse_exchange_ts(d[0]) + offset
+    d[0] = datetime.fromtimestamp(shifted, timezone.utc).isoformat()
+    return orjson.dumps(data)
+
+
+def records(paths, skip, duration):
+    first = None
+    for path in paths:
+        for recv_ts, frame in read_capture(path):
+            if first is None:
+                first = recv_ts
+            offset = recv_ts - first
+            if offset < skip:
+                continue
+            if duration is not None and offset >= skip + duration:
+                return
+            yield recv_ts, frame
+
+
+def replay(args):
+    client = redis.Redis.from_url(args.redis_url)
+    client.ping()
+    speed = None if args.max else args.speed
+    pipe = client.pipeline(transaction=False)
+    pending = 0
+    sent = 0
+    base = None
+    retime_offset = None
+    start = time.perf_counter()
+    last_report = start
+    last_sent = 0
+    lag = 0.0
+
+    def flush():
+        nonlocal pending, sent
+        if pending:
+            pipe.execute()
+            sent += pending
+            pending = 0
+
+    for recv_ts, frame in records(args.captures, args.skip, args.duration):
+        if base is None:
+            base = recv_ts
+            retime_offset = time.time() - recv_ts
+        if speed:
+            due = (recv_ts - base) / speed
+            ahead = due - (time.perf_counter() - start)
+            if ahead > 0.001:
+                flush()
+                time.sleep(ahead)
+            else:
+                lag = max(lag, -ahead)
+        if args.retime:
+            # Scale exchange time with the replay speed so bucket boundaries arrive on schedule
+            frame = retime_frame(frame, retime_offset + (recv_ts - base) * ((1 / speed - 1) if speed else 0))
+        if args.publish:
+            pipe.publish(args.channel, frame)
+        pipe.xadd(args.stream, {'data': frame}, maxlen=args.maxlen, approximate=True)
+        pending += 1
+        if pending >= args.batch:
+            flush()
+
+        now = time.perf_counter()
+        if now - last_report >= 1:
+            rate = (sent - last_sent) / (now - last_report)
+            print(f"{now - start:8.1f}s  {sent:>10,} sent  {rate:>10,.0f} msg/sec  behind schedule {lag * 1000:.0f}ms")
+            last_report, last_sent, lag = now, sent, 0.0
+    flush()
+
+    elapsed = time.perf_counter() - start
+    print(f"done: {sent:,} frames in {elapsed:.1f}s ({sent / elapsed if elapsed else 0:,.0f} msg/sec)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('captures', nargs='+', help='capture files, replayed in the given order')
+    parser.add_argument('--redis-url', default=os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+    parser.add_argument('--stream', default='tiingo:stream')
+    parser.add_argument('--channel', default='tiingo:raw')
+    parser.add_argument('--publish', action='store_true', help='also PUBLISH every frame to --channel')
+    parser.add_argument('--maxlen', type=int, default=10000, help='approximate stream MAXLEN, as the ingestor uses')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed multiplier')
+    parser.add_argument('--max', action='store_true', help='replay as fast as possible')
+    parser.add_argument('--skip', type=float, default=0, help='seconds to skip from the start of the capture')
+    parser.add_argument('--duration', type=float, help='seconds of capture to replay')
+    parser.add_argument('--retime', action='store_true', help='shift exchange timestamps to start at now')
+    parser.add_argument('--batch', type=int, default=500, help='frames per Redis pipeline')
+    args = parser.parse_args()
+    if not args.max and args.speed <= 0:
+        parser.error('--speed must be positive (or use --max)')
+    try:
+        replay(args)
+    except KeyboardInterrupt:
+        print("interrupted")
+
+
+if __name__ == '__main__':
+    main()
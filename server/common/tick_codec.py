@@ -0,0 +1,117 @@
+"""
+Compact binary tick encoding for tiingo:stream.
+- One fixed 21-byte record per trade instead of the full Tiingo JSON frame:
+    <uint8 magic><int64 epoch ms><uint32 symbol id><float64 price>
+- Symbol ids live in a Redis dictionary shared by the ingestor and aggregator:
+    tiingo:symbols     HASH  SYMBOL -> id
+    tiingo:symbol_ids  HASH  id -> SYMBOL
+    tiingo:symbol_seq  INT   last assigned id
+- Conflated ticks (ingestor CONFLATION_MS) use a second, 49-byte record:
+    <uint8 magic 0x02><int64 epoch ms><uint32 symbol id><float64 open><float64 high><float64 low><float64 close><uint32 count>
+- Records are self-describing: JSON frames start with '{', binary records
+  with a magic byte, so both can share the same 'data' stream field (and the
+  ingestor spool) and consumers decode whatever they get.
+"""
+import logging
+import struct
+
+logger = logging.getLogger("tick_codec")
+
+TICK_MAGIC = 0x01
+CONFLATED_MAGIC = 0x02
+_TICK = struct.Struct('<BqId')
+_CONFLATED = struct.Struct('<BqIddddI')
+
+SYMBOLS_KEY = 'tiingo:symbols'
+SYMBOL_IDS_KEY = 'tiingo:symbol_ids'
+SYMBOL_SEQ_KEY = 'tiingo:symbol_seq'
+
+
+def encode_tick(ts_ms, symbol_id, price):
+    return _TICK.pack(TICK_MAGIC, ts_ms, symbol_id, price)
+
+
+def encode_conflated(ts_ms, symbol_id, open_, high, low, close, count):
+    return _CONFLATED.pack(CONFLATED_MAGIC, ts_ms, symbol_id, open_, high, low, close, count)
+
+
+def is_binary(raw):
+    """True if a stream payload is a binary record (not a JSON frame)."""
+    return len(raw) > 0 and raw[0] in (TICK_MAGIC, CONFLATED_MAGIC)
+
+
+def is_conflated(raw):
+    return raw[0] == CONFLATED_MAGIC
+
+
+def decode_tick(raw):
+    """Binary trade record -> (ts_ms, symbol_id, price)."""
+    _magic, ts_ms, symbol_id, price = _TICK.unpack(raw)
+    return ts_ms, symbol_id, price
+
+
+def decode_conflated(raw):
+    """Binary conflated record -> (ts_ms, symbol_id, open, high, low, close, count)."""
+    return _CONFLATED.unpack(raw)[1:]
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class SymbolDictionary:
+    """Local cache over the Redis symbol dictionary. Lookups are dict hits after warm-up."""
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.ids = {}  # SYMBOL -> id
+        self.symbols = {}  # id -> SYMBOL
+
+    def cached_id(self, symbol):
+        """Synchronous lookup for hot paths; None on a cache miss."""
+        return self.ids.get(symbol)
+
+    async def load(self):
+        """Pull the whole dictionary into the local cache."""
+        mapping = await self.redis.hgetall(SYMBOLS_KEY)
+        for symbol, sid in mapping.items():
+            symbol, sid = _text(symbol), int(sid)
+            self.ids[symbol] = sid
+            self.symbols[sid] = symbol
+        return len(mapping)
+
+    async def ensure(self, symbols):
+        """Make sure every symbol has an id (assigning new ones as needed)."""
+        missing = [s for s in symbols if s not in self.ids]
+        if missing:
+            await self.load()
+            missing = [s for s in missing if s not in self.ids]
+        for symbol in missing:
+            await self.register(symbol)
+
+    async def register(self, symbol):
+        """Assign an id to symbol, or adopt the one another process assigned first."""
+        sid = self.ids.get(symbol)
+        if sid is not None:
+            return sid
+        candidate = await self.redis.incr(SYMBOL_SEQ_KEY)
+        if await self.redis.hsetnx(SYMBOLS_KEY, symbol, candidate):
+            await self.redis.hset(SYMBOL_IDS_KEY, candidate, symbol)
+            sid = candidate
+        else:
+            sid = int(await self.redis.hget(SYMBOLS_KEY, symbol))
+        self.ids[symbol] = sid
+        self.symbols[sid] = symbol
+        return sid
+
+    async def symbol_for(self, sid):
+        """id -> SYMBOL, going to Redis only on a cache miss. None if unknown."""
+        symbol = self.symbols.get(sid)
+        if symbol is None:
+            value = await self.redis.hget(SYMBOL_IDS_KEY, sid)
+            if value is None:
+                return None
+            symbol = _text(value)
+            self.symbols[sid] = symbol
+            self.ids[symbol] = sid
+        return symbol
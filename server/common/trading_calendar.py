@@ -0,0 +1,213 @@
+"""
+Shared US equities trading calendar (NYSE/NASDAQ regular session).
+Used by the ingestor, aggregator and websocket services.
+
+- Sessions for ~a year are precomputed into an index keyed by UTC day
+  number (epoch seconds // 86400). A regular session never crosses UTC
+  midnight, so is_open(ts) and next_transition(ts) are O(1) dict lookups.
+- DST is handled per day by localizing 9:30/16:00 US/Eastern on that date,
+  so a process started before a DST switch stays correct after it.
+- Holidays come from the Stats collection ({_id: "Holidays"}) and are
+  refreshed in the background. An entry may carry "earlyClose": "HH:MM"
+  (ET) to mark a shortened session instead of a full closure.
+- Standard early closes (July 3, day after Thanksgiving, Christmas Eve)
+  are built in; Stats entries override them.
+"""
+import asyncio
+import datetime
+import logging
+import time
+
+import pytz
+
+logger = logging.getLogger("trading_calendar")
+
+ET = pytz.timezone('US/Eastern')
+REGULAR_OPEN = datetime.time(9, 30)
+REGULAR_CLOSE = datetime.time(16, 0)
+EARLY_CLOSE = datetime.time(13, 0)
+DAY_SECONDS = 86400
+
+# How much of the calendar is indexed around "now"
+LOOKBACK_DAYS = 14
+LOOKAHEAD_DAYS = 380
+
+
+def _et_timestamp(date, t):
+    return ET.localize(datetime.datetime.combine(date, t)).timestamp()
+
+
+def _parse_hhmm(value):
+    hour, minute = str(value).split(':')[:2]
+    return datetime.time(int(hour), int(minute))
+
+
+def _builtin_early_closes(year, holidays):
+    """NYSE 1pm closes: July 3, day after Thanksgiving, Christmas Eve (when they are trading days)."""
+    days = []
+    july3 = datetime.date(year, 7, 3)
+    if july3.weekday() < 4:  # Mon-Thu; a Friday July 3 is the observed holiday
+        days.append(july3)
+    nov1 = datetime.date(year, 11, 1)
+    thanksgiving = nov1 + datetime.timedelta(days=(3 - nov1.weekday()) % 7 + 21)
+    days.append(thanksgiving + datetime.timedelta(days=1))
+    xmas_eve = datetime.date(year, 12, 24)
+    if xmas_eve.weekday() < 4:  # a Friday Dec 24 is the observed Christmas holiday
+        days.append(xmas_eve)
+    return {d.isoformat(): EARLY_CLOSE for d in days if d.isoformat() not in holidays}
+
+
+class TradingCalendar:
+    """In-memory session index. Rebuilt (and swapped atomically) on refresh."""
+
+    def __init__(self, holidays=None, early_closes=None):
+        self._holidays = dict(holidays or {})  # {'YYYY-MM-DD': name}
+        self._early_closes = dict(early_closes or {})  # {'YYYY-MM-DD': datetime.time (ET)}
+        self._index = None
+        self._build(time.time())
+
+    # --- Index ---
+    def _build(self, center_ts):
+        center = datetime.datetime.utcfromtimestamp(center_ts).date()
+        start = center - datetime.timedelta(days=LOOKBACK_DAYS)
+        end = center + datetime.timedelta(days=LOOKAHEAD_DAYS)
+
+        early = {}
+        for year in range(start.year, end.year + 1):
+            early.update(_builtin_early_closes(year, self._holidays))
+        early.update(self._early_closes)
+
+        sessions = {}  # {utc_day: (open_ts, close_ts)}
+        d = start
+        while d <= end:
+            key = d.isoformat()
+            if d.weekday() < 5 and key not in self._holidays:
+                open_ts = _et_timestamp(d, REGULAR_OPEN)
+                close_ts = _et_timestamp(d, early.get(key, REGULAR_CLOSE))
+                sessions[int(open_ts // DAY_SECONDS)] = (open_ts, close_ts)
+            d += datetime.timedelta(days=1)
+
+        first_day = int(_et_timestamp(start, datetime.time(0, 0)) // DAY_SECONDS)
+        last_day = int(_et_timestamp(end, datetime.time(23, 59)) // DAY_SECONDS)
+        next_session = {}  # {utc_day: first session day strictly after it}
+        following = None
+        for day in range(last_day, first_day - 1, -1):
+            next_session[day] = following
+            if day in sessions:
+                following = day
+        self._index = (first_day, last_day, sessions, next_session)
+
+    def _lookup(self, ts):
+        day = int(ts // DAY_SECONDS)
+        first_day, last_day, sessions, next_session = self._index
+        if not first_day <= day <= last_day:
+            self._build(ts)
+            first_day, last_day, sessions, next_session = self._index
+        return day, sessions, next_session
+
+    # --- Queries (ts = epoch seconds, default now) ---
+    def is_open(self, ts=None):
+        if ts is None:
+            ts = time.time()
+        day, sessions, _ = self._lookup(ts)
+        session = sessions.get(day)
+        return session is not None and session[0] <= ts < session[1]
+
+    def session(self, ts=None):
+        """(open_ts, close_ts) of the session on ts's UTC day, or None if it is not a trading day."""
+        if ts is None:
+            ts = time.time()
+        day, sessions, _ = self._lookup(ts)
+        return sessions.get(day)
+
+    def is_trading_day(self, ts=None):
+        return self.session(ts) is not None
+
+    def next_transition(self, ts=None):
+        """Return (transition_ts, 'open' | 'close') for the next session boundary after ts."""
+        if ts is None:
+            ts = time.time()
+        day, sessions, next_session = self._lookup(ts)
+        session = sessions.get(day)
+        if session is not None:
+            if ts < session[0]:
+                return session[0], 'open'
+            if ts < session[1]:
+                return session[1], 'close'
+        nxt = next_session.get(day)
+        if nxt is None:
+            # Beyond the indexed horizon: rebuild around the edge and retry
+            self._build(ts + LOOKAHEAD_DAYS * DAY_SECONDS / 2)
+            return self.next_transition(ts)
+        return sessions[nxt][0], 'open'
+
+    def next_open(self, ts=None):
+        if ts is None:
+            ts = time.time()
+        transition, kind = self.next_transition(ts)
+        if kind == 'open':
+            return transition
+        return self.next_transition(transition)[0]
+
+    def next_close(self, ts=None):
+        if ts is None:
+            ts = time.time()
+        transition, kind = self.next_transition(ts)
+        if kind == 'close':
+            return transition
+        return self.next_transition(transition)[0]
+
+    def close_for_day(self, ts):
+        """
+        Session close for ts's UTC day. Non-trading days fall back to the
+        regular 4:00 PM ET close of that date (used for candle bucketing).
+        """
+        session = self.session(ts)
+        if session is not None:
+            return session[1]
+        date = datetime.datetime.utcfromtimestamp(ts).date()
+        return _et_timestamp(date, REGULAR_CLOSE)
+
+    # --- Refresh ---
+    def update(self, holidays, early_closes):
+        self._holidays = dict(holidays)
+        self._early_closes = dict(early_closes)
+        self._build(time.time())
+
+    async def refresh(self, db):
+        """Reload holidays/early closes from Stats (motor database). Keeps the old index on error."""
+        try:
+            doc = await db.Stats.find_one({"_id": "Holidays"})
+        except Exception as e:
+            logger.error(f"Trading calendar refresh failed: {e}")
+            return False
+        if not doc or "Holidays" not in doc:
+            logger.warning("No holidays document found in Stats collection")
+            return False
+        holidays = {}
+        early_closes = {}
+        for entry in doc["Holidays"]:
+            date = entry.get("date")
+            if not date:
+                continue
+            if entry.get("earlyClose"):
+                try:
+                    early_closes[date] = _parse_hhmm(entry["earlyClose"])
+                except Exception:
+                    logger.warning(f"Ignoring malformed earlyClose for {date}: {entry['earlyClose']}")
+            else:
+                holidays[date] = entry.get("name", "")
+        if holidays != self._holidays or early_closes != self._early_closes:
+            self.update(holidays, early_closes)
+            logger.info(f"Trading calendar refreshed: {len(holidays)} holidays, {len(early_closes)} early closes")
+        return True
+
+    async def refresh_loop(self, db, interval=3600):
+        """Background task: refresh from Stats every `interval` seconds."""
+        while True:
+            await self.refresh(db)
+            await asyncio.sleep(interval)
+
+
+# Process-wide instance shared by everything in a service
+calendar = TradingCalendar()
@@ -0,0 +1,135 @@
+"""
+Tick capture for offline load tests (see server/benchmarks/replay_ticks.py).
+- Every relayed frame is recorded with its receive timestamp
+- One gzip file per UTC day: ticks-YYYY-MM-DD.cap.gz (restarts append a new gzip member)
+- Records are length-prefixed: <float64 receive epoch seconds><uint32 length><frame>
+- The websocket loop only appends to a list; compression runs in a worker thread
+"""
+import asyncio
+import gzip
+import logging
+import os
+import struct
+import threading
+import time
+
+from prometheus_client import Counter
+
+logger = logging.getLogger("ingestor.capture")
+
+CAPTURE_FLUSH_INTERVAL = float(os.getenv('CAPTURE_FLUSH_INTERVAL', '1'))
+CAPTURE_MAX_BUFFER = int(os.getenv('CAPTURE_MAX_BUFFER', '1000000'))  # drop (and count) beyond this many pending records
+CAPTURE_COMPRESS_LEVEL = int(os.getenv('CAPTURE_COMPRESS_LEVEL', '3'))
+
+_HEADER = struct.Struct('<dI')
+_PREFIX = 'ticks-'
+_SUFFIX = '.cap.gz'
+
+capture_written_total = Counter('ingestor_capture_written_total', 'Frames written to the tick capture')
+capture_dropped_total = Counter('ingestor_capture_dropped_total', 'Frames dropped because the capture writer fell behind')
+
+
+def capture_path(directory, day):
+    return os.path.join(directory, f"{_PREFIX}{day}{_SUFFIX}")
+
+
+def read_capture(path):
+    """Yield (receive_ts, frame bytes) from a capture file, stopping quietly at a truncated tail."""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            try:
+                header = f.read(_HEADER.size)
+            except EOFError:
+                return  # writer died mid-member
+            if len(header) < _HEADER.size:
+                return
+            recv_ts, n = _HEADER.unpack(header)
+            try:
+                frame = f.read(n)
+            except EOFError:
+                return
+            if len(frame) < n:
+                return
+            yield recv_ts, frame
+
+
+class TickCapture:
+    """Buffers (receive time, frame) pairs and appends them to daily gzip files."""
+
+    def __init__(self, directory, flush_interval=CAPTURE_FLUSH_INTERVAL, max_buffer=CAPTURE_MAX_BUFFER):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._day_end = 0
+        self._file = None
+        self._task = None
+        self._lock = threading.Lock()  # a cancelled drain's thread may still be writing on close
+
+    def record(self, frame):
+        """Queue a frame for capture. Never blocks."""
+        if len(self._buffer) >= self.max_buffer:
+            capture_dropped_total.inc()
+            return
+        self._buffer.append((time.time(), frame))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._drain()
+
+    async def _drain(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write, batch)
+            capture_written_total.inc(len(batch))
+        except Exception as e:
+            capture_dropped_total.inc(len(batch))
+            logger.error(f"✗ Tick capture write failed ({len(batch)} frames lost): {e}")
+
+    def _write(self, batch):
+        with self._lock:
+            chunk = bytearray()
+            for recv_ts, frame in batch:
+                if recv_ts >= self._day_end:
+                    if chunk:
+                        self._file.write(chunk)
+                        chunk = bytearray()
+                    self._open(recv_ts)
+                if isinstance(frame, str):
+                    frame = frame.encode('utf-8')
+                chunk += _HEADER.pack(recv_ts, len(frame))
+                chunk += frame
+            if chunk:
+                self._file.write(chunk)
+            # Sync flush so a crash loses at most one interval
+            self._file.flush()
+
+    def _open(self, recv_ts):
+        if self._file is not None:
+            self._file.close()
+        path = capture_path(self.directory, time.strftime('%Y-%m-%d', time.gmtime(recv_ts)))
+        self._file = gzip.open(path, 'ab', compresslevel=CAPTURE_COMPRESS_LEVEL)
+        self._day_end = (recv_ts // 86400 + 1) * 86400
+        logger.info(f"✓ Capturing ticks to {path}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._drain()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,88 @@
+"""
+Per-symbol tick conflation for the Tiingo ingestor (opt-in, CONFLATION_MS > 0).
+- Trades for one symbol within a window are merged into ONE message carrying
+  open (first), high, low, close (last) and the trade count
+- A window never spans a minute boundary: a trade in a new minute emits the
+  pending entry first, so 1m candles (and everything rolled up from them)
+  keep exact OHLC downstream
+- A window holding a single trade emits the original frame untouched
+- Symbols in CONFLATION_EXCLUDE are never conflated
+"""
+import os
+
+from prometheus_client import Counter
+
+CONFLATION_MS = float(os.getenv('CONFLATION_MS', '0'))  # 0 disables conflation
+CONFLATION_EXCLUDE = {s.strip().lower() for s in os.getenv('CONFLATION_EXCLUDE', '').split(',') if s.strip()}
+
+conflation_ticks_total = Counter('ingestor_conflation_ticks_total', 'Trades entering the conflator')
+conflation_messages_total = Counter('ingestor_conflation_messages_total', 'Messages emitted by the conflator')
+
+
+def _minute(ts):
+    """Minute key of an exchange timestamp without parsing it."""
+    if isinstance(ts, str):
+        return ts[:16]  # 'YYYY-MM-DDTHH:MM'; US offsets are whole hours, so local and UTC minutes align
+    return int(ts) // 60000
+
+
+class ConflatedTick:
+    __slots__ = ('minute', 'ts', 'symbol', 'open', 'high', 'low', 'close', 'count', 'frame', 'exchange_ts')
+
+    def __init__(self, minute, ts, symbol, price, frame, exchange_ts):
+        self.minute = minute
+        self.ts = ts
+        self.symbol = symbol
+        self.open = self.high = self.low = self.close = price
+        self.count = 1
+        self.frame = frame
+        self.exchange_ts = exchange_ts
+
+
+class Conflator:
+    """Holds at most one pending ConflatedTick per symbol; emit(entry) is called on flush or minute rollover."""
+
+    def __init__(self, emit, exclude=CONFLATION_EXCLUDE):
+        self.emit = emit
+        self.exclude = exclude
+        self._pending = {}
+
+    def add(self, symbol, price, ts, frame, exchange_ts=None):
+        """Absorb a trade. Returns False if the symbol is excluded (the caller relays it as-is)."""
+        if symbol in self.exclude:
+            return False
+        try:
+            price = float(price)
+        except (TypeError, ValueError):
+            return False
+        conflation_ticks_total.inc()
+        minute = _minute(ts)
+        entry = self._pending.get(symbol)
+        if entry is not None and entry.minute != minute:
+            self._emit(entry)
+            entry = None
+        if entry is None:
+            self._pending[symbol] = ConflatedTick(minute, ts, symbol, price, frame, exchange_ts)
+            return True
+        if price > entry.high:
+            entry.high = price
+        elif price < entry.low:
+            entry.low = price
+        entry.close = price
+        entry.count += 1
+        entry.ts = ts
+        if exchange_ts is not None:
+            entry.exchange_ts = exchange_ts
+        return True
+
+    def flush(self):
+        """Emit every pending entry (called once per window)."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        for entry in pending.values():
+            self._emit(entry)
+
+    def _emit(self, entry):
+        conflation_messages_total.inc()
+        self.emit(entry)
@@ -0,0 +1,50 @@
+"""
+Fast-path decoding for Tiingo websocket frames.
+Almost every frame is an IEX trade (messageType "A"), so decoding does the
+minimum: one orjson parse and a handful of index lookups. Crypto trades
+(service "crypto_data") take the same path. The raw frame is
+never re-encoded; callers forward the original bytes untouched.
+"""
+from datetime import datetime
+
+import orjson
+
+_loads = orjson.loads
+
+
+def decode_frame(raw):
+    """
+    Decode a raw websocket frame (bytes or str).
+    Returns (message_type, service, symbol, price, timestamp); symbol, price and
+    timestamp are None for anything that is not a well-formed trade update.
+    The timestamp is returned unparsed (see parse_exchange_ts).
+    Raises orjson.JSONDecodeError (a ValueError) on invalid JSON.
+    """
+    data = _loads(raw)
+    message_type = data.get("messageType")
+    if message_type != "A":
+        return message_type, None, None, None, None
+    service = data.get("service")
+    d = data.get("data")
+    if service == "iex" and type(d) is list and len(d) > 2:
+        return message_type, service, d[1], d[2], d[0]
+    if service == "crypto_data" and type(d) is list and len(d) > 5 and d[0] == "T":
+        # Crypto trade: ["T", ticker, date, exchange, size, price]
+        return message_type, service, d[1], d[5], d[2]
+    return message_type, service, None, None, None
+
+
+def parse_exchange_ts(ts):
+    """Exchange timestamp (ISO8601, any fractional precision, or epoch ms) -> epoch seconds."""
+    if isinstance(ts, (int, float)):
+        return ts / 1000
+    return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+
+
+def frame_size(raw):
+    """Byte length of a frame without re-encoding ASCII text frames."""
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        return len(raw)
+    if raw.isascii():
+        return len(raw)
+    return len(raw.encode("utf-8"))
@@ -0,0 +1,70 @@
+"""
+Failover helpers for the Tiingo ingestor.
+- Backoff: jittered exponential reconnect delays, starting in milliseconds
+- FrameDeduper: drops the second copy of frames received on redundant
+  (hot-standby) connections, so the stream has neither gaps nor duplicates
+"""
+import collections
+import os
+import random
+import time
+
+RECONNECT_BASE_MS = float(os.getenv('RECONNECT_BASE_MS', '50'))
+RECONNECT_MAX_MS = float(os.getenv('RECONNECT_MAX_MS', '5000'))
+DEDUP_WINDOW_MS = float(os.getenv('DEDUP_WINDOW_MS', '3000'))
+
+
+class Backoff:
+    """Jittered exponential backoff: delay ~ U(base/2, min(cap, base * 2^attempt))."""
+
+    def __init__(self, base_ms=RECONNECT_BASE_MS, max_ms=RECONNECT_MAX_MS):
+        self.base = base_ms / 1000
+        self.cap = max_ms / 1000
+        self.attempt = 0
+
+    def next(self):
+        delay = random.uniform(self.base / 2, min(self.cap, self.base * (2 ** self.attempt)))
+        self.attempt = min(self.attempt + 1, 30)
+        return delay
+
+    def reset(self):
+        self.attempt = 0
+
+
+class FrameDeduper:
+    """
+    Tracks raw frames seen per replica connection over a sliding window.
+    A frame is relayed the first time ANY replica delivers its n-th copy, so
+    genuine repeats on one connection still pass while the mirror copy from
+    the other connection is dropped.
+    """
+
+    def __init__(self, replicas, window_ms=DEDUP_WINDOW_MS):
+        self.replicas = replicas
+        self.window = window_ms / 1000
+        self._counts = {}  # frame -> [count per replica]
+        self._order = collections.deque()  # (seen_at, frame) in arrival order
+        self.dropped = 0
+
+    def first_copy(self, frame, replica):
+        now = time.monotonic()
+        self._expire(now)
+        counts = self._counts.get(frame)
+        if counts is None:
+            counts = [0] * self.replicas
+            self._counts[frame] = counts
+            self._order.append((now, frame))
+        counts[replica] += 1
+        mine = counts[replica]
+        for i, c in enumerate(counts):
+            if i != replica and c >= mine:
+                self.dropped += 1
+                return False
+        return True
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        order = self._order
+        while order and order[0][0] < cutoff:
+            _, frame = order.popleft()
+            self._counts.pop(frame, None)
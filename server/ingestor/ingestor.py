@@ -1,8 +1,13 @@
 """
 SIMPLE Tiingo Ingestor - No race conditions, no complexity
-- Market open: Subscribe to tickers
-- Receive data: Send to Redis
-- Market close OR exception: Unsubscribe and exit cleanly
+- Market open: Subscribe to tickers (split across K sharded connections)
+- Optional: Crypto feed around the clock (no market-hours gating)
+- During the session: Follow AssetInfo listings/delistings incrementally
+- Receive data: Send to Redis (micro-batched, one pipeline per flush; optionally conflated per symbol)
+- Redis slow/down: Spool ticks to disk, replay in order when it recovers
+- Optional: Capture every relayed frame to daily files for offline replay
+- Market close: Unsubscribe and exit cleanly
+- Exception: Reconnect only the affected shard (ms backoff, optional hot standby)
 - Next day: Fresh start
 """
 import sys
@@ -20,8 +25,20 @@ import motor.motor_asyncio
 import logging
 import redis.asyncio as aioredis
 import signal
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
-import pytz
+import time
+import zlib
+import heapq
+import orjson
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from server.ingestor.relay import RedisRelay
+from server.ingestor.spool import TickSpool
+from server.ingestor.capture import TickCapture
+from server.ingestor.trimmer import StreamTrimmer, STREAM_HARD_MAXLEN
+from server.ingestor.conflate import Conflator, CONFLATION_MS
+from server.ingestor.failover import Backoff, FrameDeduper
+from server.common.trading_calendar import calendar
+from server.common.tick_codec import SymbolDictionary, encode_tick, encode_conflated
+from server.ingestor.decode import decode_frame, frame_size, parse_exchange_ts
 
 load_dotenv()
 
@@ -45,6 +62,61 @@ logging.getLogger("uvicorn.access").addFilter(HealthCheckFilter())
 TIINGO_API_KEY = os.getenv('TIINGO_KEY')
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# Sharding: tickers are split across INGESTOR_SHARDS connections by stable hash.
+# INGESTOR_SHARD_IDS selects which shards this process runs (default: all), so
+# shards can also be spread over several ingestor processes to use more cores.
+INGESTOR_SHARDS = max(1, int(os.getenv('INGESTOR_SHARDS', '1')))
+INGESTOR_SHARD_IDS = [int(i) for i in os.getenv('INGESTOR_SHARD_IDS', '').split(',') if i.strip()] or list(range(INGESTOR_SHARDS))
+# Stream encoding: 'json' relays raw Tiingo frames, 'binary' writes compact 21-byte records
+TICK_ENCODING = os.getenv('TICK_ENCODING', 'json').lower()
+# Crypto: also subscribe to Tiingo's crypto feed (24/7, no market-hours gating)
+CRYPTO_ENABLED = os.getenv('CRYPTO_ENABLED', '0').lower() in ('1', 'true', 'yes')
+CRYPTO_THRESHOLD_LEVEL = int(os.getenv('CRYPTO_THRESHOLD_LEVEL', '5'))  # 5 = last trades only
+# Receive-loop watchdog: market close/shutdown checks and dead-connection detection
+WATCHDOG_INTERVAL = float(os.getenv('WATCHDOG_INTERVAL', '1'))
+STALE_CONNECTION_SECONDS = float(os.getenv('STALE_CONNECTION_SECONDS', '60'))
+# Poll AssetInfo this often during the session for IPOs/delistings (0 disables)
+UNIVERSE_POLL_INTERVAL = float(os.getenv('UNIVERSE_POLL_INTERVAL', '60'))
+# Hot standby: run a second, mirrored connection per shard and dedupe the overlap
+INGESTOR_STANDBY = os.getenv('INGESTOR_STANDBY', '0').lower() in ('1', 'true', 'yes')
+# Write-ahead spool for ticks that can't reach Redis (empty INGESTOR_SPOOL_DIR disables it)
+INGESTOR_SPOOL_DIR = os.getenv('INGESTOR_SPOOL_DIR', '/tmp/ingestor-spool')
+SPOOL_SEGMENT_MB = int(os.getenv('SPOOL_SEGMENT_MB', '64'))
+# Stream trimming: 'lag' trims to what the slowest consumer group has read, 'maxlen' caps at 10k entries
+STREAM_TRIM_MODE = os.getenv('STREAM_TRIM_MODE', 'lag').lower()
+# Record every relayed frame to daily gzip files for offline replay (empty disables)
+INGESTOR_CAPTURE_DIR = os.getenv('INGESTOR_CAPTURE_DIR', '')
+
+# Tiingo websocket feeds: IEX is gated on market hours, crypto trades around the clock
+FEEDS = {
+    'iex': {'url': "wss://api.tiingo.com/iex", 'threshold': 6, 'market_hours': True},
+    'crypto': {'url': "wss://api.tiingo.com/crypto", 'threshold': CRYPTO_THRESHOLD_LEVEL, 'market_hours': False},
+}
+
+# Live ingest stats: every Nth tick is a latency sample; top-K hottest symbols refreshed every interval
+LATENCY_SAMPLE_EVERY = max(1, int(os.getenv('LATENCY_SAMPLE_EVERY', '100')))
+INGESTOR_STATS_INTERVAL = float(os.getenv('INGESTOR_STATS_INTERVAL', '10'))
+INGESTOR_TOPK = int(os.getenv('INGESTOR_TOPK', '20'))
+
+# --- Prometheus metrics ---
+ingest_messages_total = Counter('ingestor_messages_total', 'Market data messages received')
+ingest_bytes_total = Counter('ingestor_bytes_total', 'Market data bytes received')
+ingest_message_rate = Gauge('ingestor_messages_per_second', 'Messages/sec over the last stats interval')
+ingest_byte_rate = Gauge('ingestor_bytes_per_second', 'Bytes/sec over the last stats interval')
+hot_symbol_rate = Gauge('ingestor_hot_symbol_messages_per_second', 'Messages/sec of the top-K hottest symbols', ['symbol'])
+shard_messages_total = Counter('ingestor_shard_messages_total', 'Market data messages received per shard', ['shard'])
+shard_bytes_total = Counter('ingestor_shard_bytes_total', 'Market data bytes received per shard', ['shard'])
+shard_restarts_total = Counter('ingestor_shard_restarts_total', 'Shard connection restarts after errors', ['shard'])
+shard_connected = Gauge('ingestor_shard_connected', 'Shard websocket subscribed (1) or not (0)', ['shard', 'replica'])
+reconnect_seconds = Histogram(
+    'ingestor_reconnect_seconds',
+    'Time from losing a connection to being subscribed again',
+    ['shard'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+universe_changes_total = Counter('ingestor_universe_changes_total', 'Symbols added/removed on live subscriptions', ['action'])
+duplicates_dropped_total = Counter('ingestor_duplicates_dropped_total', 'Mirrored frames dropped by the standby deduper', ['shard'])
+shard_tickers = Gauge('ingestor_shard_tickers', 'Tickers assigned to each shard', ['shard'])
 
 # --- FastAPI app ---
 app = FastAPI()
@@ -67,52 +139,104 @@ except Exception as e:
     redis_client = None
     logger.error(f"✗ Redis connection failed: {e}")
 
-# --- Market hours calculation (auto DST) ---
-def get_market_hours_utc():
-    et = pytz.timezone('US/Eastern')
-    now_et = datetime.datetime.now(et)
-    open_et = now_et.replace(hour=9, minute=30, second=0, microsecond=0)
-    close_et = now_et.replace(hour=16, minute=0, second=0, microsecond=0)
-    return (open_et.astimezone(pytz.UTC).hour, open_et.astimezone(pytz.UTC).minute,
-            close_et.astimezone(pytz.UTC).hour, close_et.astimezone(pytz.UTC).minute)
+spool = None
+if INGESTOR_SPOOL_DIR:
+    try:
+        spool = TickSpool(INGESTOR_SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_MB * 1024 * 1024)
+        logger.info(f"✓ Tick spool ready: {INGESTOR_SPOOL_DIR}")
+    except Exception as e:
+        logger.error(f"✗ Tick spool unavailable, ticks will be dropped if Redis fails: {e}")
+
+capture = None
+if INGESTOR_CAPTURE_DIR:
+    try:
+        capture = TickCapture(INGESTOR_CAPTURE_DIR)
+        logger.info(f"✓ Tick capture enabled: {INGESTOR_CAPTURE_DIR}")
+    except Exception as e:
+        logger.error(f"✗ Tick capture unavailable: {e}")
 
-MARKET_OPEN_H, MARKET_OPEN_M, MARKET_CLOSE_H, MARKET_CLOSE_M = get_market_hours_utc()
-logger.info(f"Market hours: {MARKET_OPEN_H}:{MARKET_OPEN_M:02d} - {MARKET_CLOSE_H}:{MARKET_CLOSE_M:02d} UTC")
+# Started on app startup; batches ticks into Redis pipelines, spools when Redis is unhealthy
+# (in 'lag' mode XADD only enforces the hard ceiling; the trimmer does the rest)
+if STREAM_TRIM_MODE == 'lag':
+    trimmer = StreamTrimmer(redis_client) if redis_client else None
+    relay = RedisRelay(redis_client, spool=spool, maxlen=STREAM_HARD_MAXLEN) if redis_client else None
+else:
+    trimmer = None
+    relay = RedisRelay(redis_client, spool=spool) if redis_client else None
 
-async def is_holiday():
-    """
-    Check if today is a market holiday by querying the Stats collection.
-    Returns True if today is a holiday (in New York timezone).
-    """
+# Symbol -> id dictionary for binary stream records (shared with the aggregator through Redis)
+symbol_dictionary = SymbolDictionary(redis_client) if redis_client and TICK_ENCODING == 'binary' else None
+_registering = set()
+
+async def register_symbol(symbol):
     try:
-        # Get current date in New York timezone
-        ny_tz = pytz.timezone('America/New_York')
-        today = datetime.datetime.now(ny_tz).strftime('%Y-%m-%d')
-        
-        # Query the Stats collection for holidays
-        holidays_doc = await db.Stats.find_one({"_id": "Holidays"})
-        
-        if not holidays_doc or "Holidays" not in holidays_doc:
-            logger.warning("No holidays document found in Stats collection")
-            return False
-        
-        # Check if today matches any holiday date
-        for holiday in holidays_doc["Holidays"]:
-            if holiday.get("date") == today:
-                return True
-        
-        return False
+        await symbol_dictionary.register(symbol)
     except Exception as e:
-        logger.error(f"Error checking holidays: {e}")
-        return False  # Fail open - don't block trading on error
+        logger.error(f"✗ Failed to register symbol id for {symbol}: {e}")
+    finally:
+        _registering.discard(symbol)
+
+def encode_binary_tick(symbol, price, ts, exchange_ts=None):
+    """Binary stream record for a trade, or None to fall back to the raw JSON frame."""
+    symbol = symbol.upper()
+    sid = symbol_dictionary.cached_id(symbol)
+    if sid is None:
+        # Unknown symbol: relay this tick as JSON and register it in the background
+        if symbol not in _registering:
+            _registering.add(symbol)
+            asyncio.create_task(register_symbol(symbol))
+        return None
+    try:
+        if exchange_ts is None:
+            exchange_ts = parse_exchange_ts(ts)
+        return encode_tick(int(exchange_ts * 1000), sid, float(price))
+    except Exception:
+        return None
+
+def relay_trade(msg, symbol, price, ts, exchange_ts=None, encode=True):
+    """encode=False keeps the raw frame on the stream (crypto frames carry trade size, binary records don't)."""
+    if relay:
+        encoded = encode_binary_tick(symbol, price, ts, exchange_ts) if symbol_dictionary and encode else None
+        relay.submit(msg, exchange_ts, encoded)
+
+def relay_conflated(entry):
+    """Relay a conflated window; a single-trade window goes out as the original frame."""
+    if entry.count == 1:
+        relay_trade(entry.frame, entry.symbol, entry.close, entry.ts, entry.exchange_ts)
+        return
+    if not relay:
+        return
+    # Same layout as a trade (ts, ticker, price=close) plus open/high/low/count
+    msg = orjson.dumps({
+        "messageType": "A",
+        "service": "iex_conflated",
+        "data": [entry.ts, entry.symbol, entry.close, entry.open, entry.high, entry.low, entry.count]
+    })
+    encoded = None
+    if symbol_dictionary:
+        sid = symbol_dictionary.cached_id(entry.symbol.upper())
+        if sid is not None:
+            try:
+                ts_ms = int(parse_exchange_ts(entry.ts) * 1000)
+                encoded = encode_conflated(ts_ms, sid, entry.open, entry.high, entry.low, entry.close, entry.count)
+            except Exception:
+                pass
+    relay.submit(msg, entry.exchange_ts, encoded)
+
+# Merges bursts of trades per symbol into one OHLC message per window (CONFLATION_MS > 0)
+conflator = Conflator(relay_conflated) if CONFLATION_MS > 0 else None
+
+async def conflation_loop():
+    while True:
+        await asyncio.sleep(CONFLATION_MS / 1000)
+        try:
+            conflator.flush()
+        except Exception as e:
+            logger.error(f"✗ Conflation flush failed: {e}")
 
+# --- Market hours (shared trading calendar: DST, holidays, early closes) ---
 def is_market_hours():
-    now = datetime.datetime.utcnow()
-    if now.weekday() >= 5:  # Weekend
-        return False
-    open_time = now.replace(hour=MARKET_OPEN_H, minute=MARKET_OPEN_M, second=0, microsecond=0)
-    close_time = now.replace(hour=MARKET_CLOSE_H, minute=MARKET_CLOSE_M, second=0, microsecond=0)
-    return open_time <= now <= close_time
+    return calendar.is_open()
 
 # --- Bandwidth tracking ---
 bandwidth_stats = {}  # {symbol: {'bytes': int, 'messages': int}}
@@ -142,14 +266,53 @@ def handle_shutdown(signum, frame):
 signal.signal(signal.SIGINT, handle_shutdown)
 signal.signal(signal.SIGTERM, handle_shutdown)
 
-# --- THE CORE: Simple subscription function ---
-async def tiingo_subscription():
+# --- Live stats ---
+async def stats_loop():
+    """Export live rates and the top-K hottest symbols while the market is open."""
+    previous = {}
+    previous_total = (0, 0)
+    exported = set()
+    while not shutdown_requested:
+        await asyncio.sleep(INGESTOR_STATS_INTERVAL)
+        try:
+            deltas = []
+            total_msgs = total_bytes = 0
+            for symbol, s in bandwidth_stats.items():
+                msgs = s['messages']
+                total_msgs += msgs
+                total_bytes += s['bytes']
+                delta = msgs - previous.get(symbol, 0)
+                if delta > 0:
+                    deltas.append((delta, symbol))
+                previous[symbol] = msgs
+            # bandwidth_stats only grows, so totals never go backwards
+            ingest_message_rate.set((total_msgs - previous_total[0]) / INGESTOR_STATS_INTERVAL)
+            ingest_byte_rate.set((total_bytes - previous_total[1]) / INGESTOR_STATS_INTERVAL)
+            previous_total = (total_msgs, total_bytes)
+
+            # Bounded label set: only the current top-K symbols are exported
+            hottest = heapq.nlargest(INGESTOR_TOPK, deltas)
+            current = set()
+            for delta, symbol in hottest:
+                hot_symbol_rate.labels(symbol=symbol).set(delta / INGESTOR_STATS_INTERVAL)
+                current.add(symbol)
+            for symbol in exported - current:
+                try:
+                    hot_symbol_rate.remove(symbol)
+                except KeyError:
+                    pass
+            exported = current
+        except Exception as e:
+            logger.error(f"Stats loop error: {e}")
+
+# --- Ticker universe ---
+async def load_tickers(quiet=False):
     """
-    Connect to Tiingo, subscribe, relay to Redis, unsubscribe on close/error.
-    THIS IS IT. Nothing more, nothing less.
+    Load all non-delisted NASDAQ/NYSE symbols from AssetInfo (deduped, uppercase).
+    Returns None if the query failed (so callers never mistake an error for an empty universe).
     """
-    # Get tickers from DB
-    logger.info("Loading tickers from database...")
+    if not quiet:
+        logger.info("Loading tickers from database...")
     try:
         query = {
             "Delisted": False,
@@ -158,97 +321,201 @@ async def tiingo_subscription():
         docs = await db.AssetInfo.find(query, {"Symbol": 1, "_id": 0}).to_list(length=None)
         tickers = [d.get("Symbol").upper() for d in docs if d.get("Symbol")]
         tickers = list(dict.fromkeys(tickers))  # dedupe
-        logger.info(f"✓ Loaded {len(tickers)} tickers for bandwidth test (Stocks + ETFs, non-delisted)")
+        if not quiet:
+            logger.info(f"✓ Loaded {len(tickers)} tickers (Stocks + ETFs, non-delisted)")
+        return tickers
     except Exception as e:
         logger.error(f"✗ Failed to load tickers: {e}")
-        return
-    
-    if not tickers:
-        logger.warning("No tickers to subscribe to")
-        return
+        return None
+
+async def load_crypto_tickers(quiet=False):
+    """Load all non-delisted crypto symbols from AssetInfo (lowercase, as Tiingo's crypto feed expects)."""
+    try:
+        docs = await db.AssetInfo.find({"AssetType": "Crypto", "Delisted": False}, {"Symbol": 1, "_id": 0}).to_list(length=None)
+        tickers = list(dict.fromkeys(d.get("Symbol").lower() for d in docs if d.get("Symbol")))
+        if not quiet:
+            logger.info(f"✓ Loaded {len(tickers)} crypto tickers")
+        return tickers
+    except Exception as e:
+        logger.error(f"✗ Failed to load crypto tickers: {e}")
+        return None
+
+def shard_for(symbol, num_shards=INGESTOR_SHARDS):
+    """Stable shard index for a symbol (same on every run and every process)."""
+    return zlib.crc32(symbol.upper().encode("utf-8")) % num_shards
+
+def partition_tickers(tickers, num_shards=INGESTOR_SHARDS):
+    """Split tickers into {shard_id: [symbols]} by stable hash."""
+    shards = {i: [] for i in range(num_shards)}
+    for t in tickers:
+        shards[shard_for(t, num_shards)].append(t)
+    return shards
+
+# --- Session state (lets the universe watcher patch live subscriptions) ---
+session_shards = {}  # {shard_id: [symbols]} for shards owned by this process; lists are mutated in place
+live_subscriptions = {}  # {(shard_id, replica): (ws, subscription_id)}
+
+async def send_subscription_update(ws, subscription_id, event, tickers):
+    """Add (event='subscribe') or drop (event='unsubscribe') tickers on a live subscription."""
+    await ws.send(json.dumps({
+        "eventName": event,
+        "authorization": TIINGO_API_KEY,
+        "eventData": {
+            "subscriptionId": subscription_id,
+            "tickers": tickers
+        }
+    }))
+
+# --- THE CORE: Simple subscription function ---
+async def tiingo_subscription(shard_id, tickers, replica=0, deduper=None, on_subscribed=None, feed='iex'):
+    """
+    Connect to Tiingo, subscribe one shard's tickers, relay to Redis, unsubscribe on close/error.
+    With a hot standby, both replicas relay through the shared deduper.
+    Returns True if the session ended normally (market close/shutdown), False on error.
+    """
+    feed_config = FEEDS[feed]
+    market_hours_only = feed_config['market_hours']
+    is_iex = feed == 'iex'
+    feed_conflator = conflator if is_iex else None
+    shard = str(shard_id)
+    replica_label = str(replica)
+    shard_messages = shard_messages_total.labels(shard=shard)
+    shard_bytes = shard_bytes_total.labels(shard=shard)
+    shard_duplicates = duplicates_dropped_total.labels(shard=shard)
+    sample_counter = 0
     
     # Connect to Tiingo
-    ws_url = "wss://api.tiingo.com/iex"
+    ws_url = feed_config['url']
     ssl_ctx = ssl.create_default_context()
     subscription_id = None
     
     try:
-        logger.info(f"Connecting to {ws_url}...")
+        logger.info(f"[shard {shard_id}/{replica}] Connecting to {ws_url}...")
         async with websockets.connect(ws_url, ssl=ssl_ctx) as ws:
-            logger.info("✓ Connected to Tiingo")
+            logger.info(f"[shard {shard_id}/{replica}] ✓ Connected to Tiingo")
             
             # Subscribe
             subscribe_msg = {
                 "eventName": "subscribe",
                 "authorization": TIINGO_API_KEY,
                 "eventData": {
-                    "thresholdLevel": 6,
+                    "thresholdLevel": feed_config['threshold'],
                     "tickers": tickers
                 }
             }
             
-            logger.info(f"Subscribing to {len(tickers)} tickers...")
+            logger.info(f"[shard {shard_id}/{replica}] Subscribing to {len(tickers)} tickers...")
+            subscribed = set(tickers)
             await ws.send(json.dumps(subscribe_msg))
             
             # Wait for confirmation
             response = await asyncio.wait_for(ws.recv(), timeout=10)
-            logger.info(f"Subscribe response: {response}")
+            logger.info(f"[shard {shard_id}/{replica}] Subscribe response: {response}")
             
             resp_data = json.loads(response)
             subscription_id = resp_data.get('data', {}).get('subscriptionId')
             if not subscription_id:
                 raise ValueError(f"No subscriptionId in response: {response}")
             
-            logger.info(f"✓ Subscribed with ID: {subscription_id}")
+            logger.info(f"[shard {shard_id}/{replica}] ✓ Subscribed with ID: {subscription_id}")
+            shard_connected.labels(shard=shard, replica=replica_label).set(1)
+            live_subscriptions[(shard_id, replica)] = (ws, subscription_id)
+            if on_subscribed:
+                on_subscribed()
             
-            # Receive and relay messages
-            while True:
-                # Check if market closed or shutdown requested
-                if not is_market_hours() or shutdown_requested:
-                    logger.info("Market closed or shutdown requested - breaking loop")
-                    break
-                
-                # Receive message with timeout
-                try:
-                    msg = await asyncio.wait_for(ws.recv(), timeout=5)
-                except asyncio.TimeoutError:
-                    continue  # Normal timeout, just check conditions and continue
-                
-                # Parse message
-                try:
-                    data = json.loads(msg)
-                except Exception as e:
-                    logger.error(f"JSON decode error: {e}")
-                    continue
-                
-                # Skip heartbeat/info messages
-                if data.get("messageType") in ("I", "H"):
-                    continue
-                
-                # Process market data
-                if (data.get("messageType") == "A" and 
-                    data.get("service") == "iex" and
-                    isinstance(data.get("data"), list) and len(data["data"]) > 2):
-                    
-                    symbol = data["data"][1].lower()
-                    msg_bytes = len(msg.encode("utf-8"))
+            # Catch up on universe changes made while we were (re)subscribing
+            current = set(tickers)
+            if current - subscribed:
+                await send_subscription_update(ws, subscription_id, "subscribe", sorted(current - subscribed))
+            if subscribed - current:
+                await send_subscription_update(ws, subscription_id, "unsubscribe", sorted(subscribed - current))
+            
+            # Receive and relay messages. No per-message timer or market-hours check:
+            # the watchdog ends the session and drops connections that go silent.
+            received = 0
+            
+            async def receive_loop():
+                nonlocal sample_counter, received
+                recv = ws.recv
+                while True:
+                    # Raw bytes, no UTF-8 decode (forwarded as-is)
+                    msg = await recv(decode=False)
+                    received += 1
                     
-                    # Track bandwidth
-                    stats = bandwidth_stats.setdefault(symbol, {'bytes': 0, 'messages': 0})
-                    stats['bytes'] += msg_bytes
-                    stats['messages'] += 1
+                    # Fast-path parse: only messageType, service, ticker, price (+ raw timestamp)
+                    try:
+                        message_type, service, symbol, price, ts = decode_frame(msg)
+                    except Exception as e:
+                        logger.error(f"[shard {shard_id}/{replica}] JSON decode error: {e}")
+                        continue
                     
-                    # Send to Redis
-                    if redis_client:
-                        try:
-                            await redis_client.publish('tiingo:raw', msg)
-                            await redis_client.xadd('tiingo:stream', {'data': msg}, maxlen=10000, approximate=True)
-                        except Exception as e:
-                            logger.error(f"Redis error: {e}")
+                    # Process market data (heartbeat/info messages have no symbol)
+                    if symbol is not None:
+                        # Hot standby: drop the mirror's copy before it is counted anywhere
+                        if deduper is not None and not deduper.first_copy(msg, replica):
+                            shard_duplicates.inc()
+                            continue
+                        symbol = symbol.lower()
+                        msg_bytes = frame_size(msg)
+                        
+                        # Track bandwidth
+                        stats = bandwidth_stats.setdefault(symbol, {'bytes': 0, 'messages': 0})
+                        stats['bytes'] += msg_bytes
+                        stats['messages'] += 1
+                        shard_messages.inc()
+                        shard_bytes.inc(msg_bytes)
+                        ingest_messages_total.inc()
+                        ingest_bytes_total.inc(msg_bytes)
+                        
+                        # Sample exchange-to-XADD latency on every Nth tick (timestamp parse is not free)
+                        sample_counter += 1
+                        exchange_ts = None
+                        if sample_counter >= LATENCY_SAMPLE_EVERY:
+                            sample_counter = 0
+                            try:
+                                exchange_ts = parse_exchange_ts(ts)
+                            except Exception:
+                                pass
+                        
+                        # Send to Redis (flushed in batches by the relay)
+                        if capture:
+                            capture.record(msg)
+                        if feed_conflator is None or not feed_conflator.add(symbol, price, ts, msg, exchange_ts):
+                            relay_trade(msg, symbol, price, ts, exchange_ts, encode=is_iex)
+            
+            async def watchdog():
+                """Returns 'closed' on market close/shutdown, 'stale' if no frame (not even a heartbeat) arrives in time."""
+                last_received = received
+                last_activity = time.monotonic()
+                while True:
+                    await asyncio.sleep(WATCHDOG_INTERVAL)
+                    if (market_hours_only and not is_market_hours()) or shutdown_requested:
+                        return 'closed'
+                    now = time.monotonic()
+                    if received != last_received:
+                        last_received = received
+                        last_activity = now
+                    elif now - last_activity > STALE_CONNECTION_SECONDS:
+                        return 'stale'
+            
+            receiver = asyncio.create_task(receive_loop())
+            watcher = asyncio.create_task(watchdog())
+            try:
+                done, _ = await asyncio.wait((receiver, watcher), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                # Cancelling recv() is safe: no frame is lost mid-read
+                receiver.cancel()
+                watcher.cancel()
+                await asyncio.gather(receiver, watcher, return_exceptions=True)
+            if receiver in done:
+                receiver.result()  # only ends by raising (connection closed/error)
+            if watcher.result() == 'stale':
+                raise ConnectionError(f"no frames for {STALE_CONNECTION_SECONDS:g}s")
+            logger.info(f"[shard {shard_id}/{replica}] Market closed or shutdown requested - breaking loop")
     
             # Unsubscribe before closing
             if subscription_id:
-                logger.info(f"Unsubscribing from subscription {subscription_id}...")
+                logger.info(f"[shard {shard_id}/{replica}] Unsubscribing from subscription {subscription_id}...")
                 try:
                     unsubscribe_msg = {
                         "eventName": "unsubscribe",
@@ -260,49 +527,212 @@ async def tiingo_subscription():
                     }
                     await ws.send(json.dumps(unsubscribe_msg))
                     response = await asyncio.wait_for(ws.recv(), timeout=5)
-                    logger.info(f"Unsubscribe response: {response}")
+                    logger.info(f"[shard {shard_id}/{replica}] Unsubscribe response: {response}")
                     
                     resp_data = json.loads(response)
                     # 404 is expected if Tiingo already unsubscribed (e.g., market close)
                     if resp_data.get('response', {}).get('code') == 404:
-                        logger.info("✓ Subscription already ended by Tiingo (404)")
+                        logger.info(f"[shard {shard_id}/{replica}] ✓ Subscription already ended by Tiingo (404)")
                     elif resp_data.get('response', {}).get('code') == 200:
-                        logger.info("✓ Unsubscribe successful (200)")
+                        logger.info(f"[shard {shard_id}/{replica}] ✓ Unsubscribe successful (200)")
                 except Exception as e:
-                    logger.info(f"Unsubscribe error (connection may already be closed): {e}")
+                    logger.info(f"[shard {shard_id}/{replica}] Unsubscribe error (connection may already be closed): {e}")
+        return True
     
     except Exception as e:
-        logger.error(f"Error in subscription: {e}")
+        logger.error(f"[shard {shard_id}/{replica}] Error in subscription: {e}")
+        return False
     
     finally:
-        logger.info("Subscription ended cleanly")
+        live_subscriptions.pop((shard_id, replica), None)
+        shard_connected.labels(shard=shard, replica=replica_label).set(0)
+        logger.info(f"[shard {shard_id}/{replica}] Subscription ended")
+
+async def run_replica(shard_id, replica, tickers, deduper, feed='iex'):
+    """Keep one connection subscribed for the whole session, reconnecting with jittered backoff."""
+    market_hours_only = FEEDS[feed]['market_hours']
+    backoff = Backoff()
+    lost_at = None
+
+    def on_subscribed():
+        nonlocal lost_at
+        backoff.reset()
+        if lost_at is not None:
+            reconnect_seconds.labels(shard=str(shard_id)).observe(time.monotonic() - lost_at)
+            lost_at = None
+
+    while (is_market_hours() or not market_hours_only) and not shutdown_requested:
+        if await tiingo_subscription(shard_id, tickers, replica, deduper, on_subscribed, feed):
+            break
+        if lost_at is None:
+            lost_at = time.monotonic()
+        shard_restarts_total.labels(shard=str(shard_id)).inc()
+        delay = backoff.next()
+        logger.warning(f"[shard {shard_id}/{replica}] Reconnecting in {delay * 1000:.0f}ms...")
+        await asyncio.sleep(delay)
+
+async def run_shard(shard_id, tickers):
+    """Run one shard (plus its hot standby, if enabled); restarts only this shard on error."""
+    shard_tickers.labels(shard=str(shard_id)).set(len(tickers))
+    replicas = 2 if INGESTOR_STANDBY else 1
+    deduper = FrameDeduper(replicas) if replicas > 1 else None
+    await asyncio.gather(*(run_replica(shard_id, r, tickers, deduper) for r in range(replicas)))
+
+async def sync_universe(shard_tasks):
+    """
+    Diff AssetInfo against the live subscriptions and send incremental
+    subscribe/unsubscribe messages (no resubscribe, no reconnect).
+    """
+    tickers = await load_tickers(quiet=True)
+    if not tickers:
+        return  # query failed or came back empty; never unsubscribe everything on a hiccup
+    wanted = {t for t in tickers if shard_for(t) in INGESTOR_SHARD_IDS}
+    current = {t for symbols in session_shards.values() for t in symbols}
+    added = wanted - current
+    removed = current - wanted
+    if not added and not removed:
+        return
+    
+    if added and symbol_dictionary is not None:
+        try:
+            await symbol_dictionary.ensure(sorted(added))
+        except Exception as e:
+            logger.error(f"✗ Failed to assign symbol ids for new tickers: {e}")
+    
+    for shard_id in INGESTOR_SHARD_IDS:
+        shard_added = sorted(t for t in added if shard_for(t) == shard_id)
+        shard_removed = sorted(t for t in removed if shard_for(t) == shard_id)
+        if not shard_added and not shard_removed:
+            continue
+        symbols = session_shards.setdefault(shard_id, [])
+        # Update the list first so any (re)connect in flight picks up the change
+        symbols.extend(shard_added)
+        if shard_removed:
+            drop = set(shard_removed)
+            symbols[:] = [t for t in symbols if t not in drop]
+        shard_tickers.labels(shard=str(shard_id)).set(len(symbols))
+        universe_changes_total.labels(action='added').inc(len(shard_added))
+        universe_changes_total.labels(action='removed').inc(len(shard_removed))
+        logger.info(f"[shard {shard_id}] Universe change: +{shard_added} -{shard_removed}")
+        
+        if shard_id not in shard_tasks and symbols:
+            # Shard had no tickers at session start; bring it up now
+            shard_tasks[shard_id] = asyncio.create_task(run_shard(shard_id, symbols))
+            continue
+        for (sid, replica), (ws, subscription_id) in list(live_subscriptions.items()):
+            if sid != shard_id:
+                continue
+            try:
+                if shard_added:
+                    await send_subscription_update(ws, subscription_id, "subscribe", shard_added)
+                if shard_removed:
+                    await send_subscription_update(ws, subscription_id, "unsubscribe", shard_removed)
+            except Exception as e:
+                # The reconnect path resubscribes from the updated list
+                logger.warning(f"[shard {shard_id}/{replica}] Incremental update failed: {e}")
+
+async def universe_loop(shard_tasks):
+    """Poll AssetInfo for listings/delistings during the session."""
+    while is_market_hours() and not shutdown_requested:
+        await asyncio.sleep(UNIVERSE_POLL_INTERVAL)
+        try:
+            await sync_universe(shard_tasks)
+        except Exception as e:
+            logger.error(f"Universe sync error: {e}")
+
+async def sync_crypto_universe(tickers):
+    """Follow crypto listings/delistings on the live crypto subscription (tickers is mutated in place)."""
+    wanted = await load_crypto_tickers(quiet=True)
+    if not wanted:
+        return
+    added = sorted(set(wanted) - set(tickers))
+    removed = sorted(set(tickers) - set(wanted))
+    if not added and not removed:
+        return
+    tickers[:] = wanted
+    shard_tickers.labels(shard='crypto').set(len(tickers))
+    universe_changes_total.labels(action='added').inc(len(added))
+    universe_changes_total.labels(action='removed').inc(len(removed))
+    logger.info(f"[shard crypto] Universe change: +{added} -{removed}")
+    live = live_subscriptions.get(('crypto', 0))
+    if live is None:
+        return  # picked up by the catch-up diff when the connection is (re)subscribed
+    ws, subscription_id = live
+    if added:
+        await send_subscription_update(ws, subscription_id, "subscribe", added)
+    if removed:
+        await send_subscription_update(ws, subscription_id, "unsubscribe", removed)
+
+async def crypto_loop():
+    """Crypto trades 24/7: keep the crypto connection up until shutdown, independent of market hours."""
+    while not shutdown_requested:
+        tickers = await load_crypto_tickers()
+        if not tickers:
+            await asyncio.sleep(60)
+            continue
+        shard_tickers.labels(shard='crypto').set(len(tickers))
+        runner = asyncio.create_task(run_replica('crypto', 0, tickers, None, feed='crypto'))
+        try:
+            while not runner.done():
+                await asyncio.wait((runner,), timeout=UNIVERSE_POLL_INTERVAL or None)
+                if not runner.done() and UNIVERSE_POLL_INTERVAL > 0:
+                    try:
+                        await sync_crypto_universe(tickers)
+                    except Exception as e:
+                        logger.error(f"Crypto universe sync error: {e}")
+        finally:
+            runner.cancel()
+
+async def run_session():
+    """Load the ticker universe and run every shard owned by this process, following AssetInfo changes."""
+    tickers = await load_tickers()
+    if not tickers:
+        logger.warning("No tickers to subscribe to")
+        return
+    
+    if symbol_dictionary is not None:
+        try:
+            await symbol_dictionary.ensure(tickers)
+            logger.info(f"✓ Binary tick encoding: {len(symbol_dictionary.ids)} symbol ids loaded")
+        except Exception as e:
+            logger.error(f"✗ Symbol dictionary warm-up failed, unknown symbols fall back to JSON: {e}")
+    
+    shards = partition_tickers(tickers)
+    session_shards.clear()
+    session_shards.update({i: shards[i] for i in INGESTOR_SHARD_IDS if i in shards})
+    owned = [i for i in INGESTOR_SHARD_IDS if shards.get(i)]
+    logger.info(f"Running shards {owned} of {INGESTOR_SHARDS} "
+                f"({sum(len(shards[i]) for i in owned)} tickers)")
+    shard_tasks = {i: asyncio.create_task(run_shard(i, shards[i])) for i in owned}
+    watcher = asyncio.create_task(universe_loop(shard_tasks)) if UNIVERSE_POLL_INTERVAL > 0 else None
+    try:
+        # Shards may be added by the watcher, so wait until no shard is left running
+        while True:
+            running = [t for t in shard_tasks.values() if not t.done()]
+            if not running:
+                break
+            await asyncio.wait(running)
+    finally:
+        if watcher:
+            watcher.cancel()
         print_bandwidth()
 
 # --- Market hours loop ---
 async def market_loop():
-    """Check market hours every 10 seconds, run subscription when open"""
+    """Run a subscription session while the market is open; otherwise wait for the next open"""
     logger.info("Market loop started")
-    holiday_logged = False
     
     while not shutdown_requested:
-        # Check if today is a holiday
-        if await is_holiday():
-            if not holiday_logged:
-                holiday_logged = True
-            await asyncio.sleep(60)
-            continue
-        
-        # Reset flag when no longer a holiday
-        holiday_logged = False
-        
         if is_market_hours():
             logger.info("🔔 Market is OPEN - starting subscription")
-            await tiingo_subscription()
+            await run_session()
             logger.info("Subscription ended, waiting for next market open...")
         else:
             logger.debug("Market closed, checking again in 10s...")
         
-        await asyncio.sleep(10)
+        # Wake up right at the opening bell if it is less than 10s away
+        until_open = calendar.next_open() - time.time()
+        await asyncio.sleep(min(10, max(0.1, until_open)))
     
     logger.info("Market loop ended")
 
@@ -310,6 +740,24 @@ async def market_loop():
 @app.on_event("startup")
 async def startup():
     logger.info("🚀 Ingestor starting...")
+    await calendar.refresh(db)
+    asyncio.create_task(calendar.refresh_loop(db))
+    transition_ts, kind = calendar.next_transition()
+    logger.info(f"Market {'open' if is_market_hours() else 'closed'}; next {kind} at "
+                f"{datetime.datetime.utcfromtimestamp(transition_ts):%Y-%m-%d %H:%M} UTC")
+    if relay:
+        relay.start()
+    if trimmer:
+        trimmer.start()
+    if capture:
+        capture.start()
+    if conflator:
+        logger.info(f"✓ Conflation enabled: {CONFLATION_MS:g}ms window")
+        asyncio.create_task(conflation_loop())
+    if CRYPTO_ENABLED:
+        logger.info("✓ Crypto feed enabled (24/7)")
+        asyncio.create_task(crypto_loop())
+    asyncio.create_task(stats_loop())
     asyncio.create_task(market_loop())
 
 # --- Shutdown ---
@@ -320,6 +768,24 @@ async def shutdown():
     shutdown_requested = True
     await asyncio.sleep(2)  # Give tasks time to cleanup
     
+    if conflator:
+        conflator.flush()
+    
+    if relay:
+        try:
+            await relay.close()
+        except Exception as e:
+            logger.error(f"Error closing relay: {e}")
+    
+    if trimmer:
+        await trimmer.close()
+    
+    if capture:
+        try:
+            await capture.close()
+        except Exception as e:
+            logger.error(f"Error closing tick capture: {e}")
+    
     if redis_client:
         try:
             await redis_client.close()
@@ -0,0 +1,205 @@
+"""
+Micro-batching Redis relay for the Tiingo ingestor.
+- Ticks are buffered for a short window (or until the batch is full)
+- Each batch is flushed in ONE Redis pipeline (PUBLISH + XADD per tick)
+- Websocket reads never wait on a Redis round trip
+- While Redis is failing or slow, batches go to a disk spool and are replayed
+  into the stream in order once Redis recovers
+"""
+import asyncio
+import logging
+import os
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger("ingestor.relay")
+
+# --- Config ---
+RELAY_FLUSH_MS = float(os.getenv('RELAY_FLUSH_MS', '3'))  # max time a tick waits in the buffer
+RELAY_MAX_BATCH = int(os.getenv('RELAY_MAX_BATCH', '500'))  # flush early once this many ticks are buffered
+RELAY_FLUSH_TIMEOUT = float(os.getenv('RELAY_FLUSH_TIMEOUT', '2'))  # give up on a pipeline after this many seconds
+SPOOL_LATENCY_MS = float(os.getenv('SPOOL_LATENCY_MS', '250'))  # flushes slower than this divert to the spool
+SPOOL_REPLAY_BATCH = int(os.getenv('SPOOL_REPLAY_BATCH', '1000'))
+SPOOL_PROBE_INTERVAL = float(os.getenv('SPOOL_PROBE_INTERVAL', '0.5'))
+
+# --- Metrics ---
+relay_batch_size = Histogram(
+    'ingestor_relay_batch_size',
+    'Ticks per Redis pipeline flush',
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+relay_flush_seconds = Histogram(
+    'ingestor_relay_flush_seconds',
+    'Redis pipeline flush latency in seconds',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+tick_latency_seconds = Histogram(
+    'ingestor_tick_latency_seconds',
+    'Exchange timestamp to XADD acknowledged, sampled',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+spool_written_total = Counter('ingestor_spool_written_total', 'Ticks written to the disk spool')
+spool_replayed_total = Counter('ingestor_spool_replayed_total', 'Spooled ticks replayed into the Redis stream')
+spool_backlog = Gauge('ingestor_spool_backlog', 'Spooled ticks waiting for replay')
+relay_redis_healthy = Gauge('ingestor_redis_healthy', 'Relay considers Redis healthy (1) or is spooling (0)')
+
+
+class RedisRelay:
+    """Collects raw Tiingo frames and relays them to Redis in pipelined batches."""
+
+    def __init__(self, redis_client, stream='tiingo:stream', channel='tiingo:raw',
+                 flush_ms=RELAY_FLUSH_MS, max_batch=RELAY_MAX_BATCH, maxlen=10000, spool=None):
+        self.redis = redis_client
+        self.stream = stream
+        self.channel = channel
+        self.flush_interval = flush_ms / 1000
+        self.max_batch = max_batch
+        self.maxlen = maxlen
+        self.spool = spool  # optional TickSpool; without it failed batches are dropped
+        self.healthy = True
+        self._buffer = []
+        self._samples = []  # exchange epoch seconds of sampled ticks in _buffer
+        self._pending = asyncio.Event()  # set when the buffer goes from empty to non-empty
+        self._full = asyncio.Event()  # set when the buffer reaches max_batch
+        self._task = None
+        self._replay_task = None
+        relay_redis_healthy.set(1)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"✓ Redis relay started (window={self.flush_interval * 1000:.1f}ms, max_batch={self.max_batch})")
+        if self.spool is not None and self._replay_task is None:
+            spool_backlog.set(self.spool.pending)
+            self._replay_task = asyncio.create_task(self._replay_loop())
+
+    def submit(self, msg, exchange_ts=None, encoded=None):
+        """
+        Queue a raw frame for relay. Never blocks.
+        exchange_ts (epoch seconds) marks the tick as a latency sample.
+        encoded, if given, is written to the stream instead of the raw frame
+        (the raw frame still goes to the pub/sub channel).
+        """
+        self._buffer.append(msg if encoded is None else (msg, encoded))
+        if exchange_ts is not None:
+            self._samples.append(exchange_ts)
+        size = len(self._buffer)
+        if size == 1:
+            self._pending.set()
+        if size >= self.max_batch:
+            self._full.set()
+
+    async def _run(self):
+        while True:
+            await self._pending.wait()
+            # Let the window fill up unless the batch is already full
+            if not self._full.is_set():
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._pending.clear()
+            self._full.clear()
+            batch, self._buffer = self._buffer, []
+            samples, self._samples = self._samples, []
+            if batch:
+                await self._flush(batch, samples)
+
+    async def _flush(self, batch, samples=()):
+        # Keep stream order: while a backlog exists, new ticks queue behind it on disk
+        if self.spool is not None and (not self.healthy or self.spool.pending):
+            self._spool_batch(batch)
+            return
+        start = time.perf_counter()
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for item in batch:
+                if type(item) is tuple:
+                    msg, entry = item
+                else:
+                    msg = entry = item
+                pipe.publish(self.channel, msg)
+                pipe.xadd(self.stream, {'data': entry}, maxlen=self.maxlen, approximate=True)
+            await asyncio.wait_for(pipe.execute(), timeout=RELAY_FLUSH_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Redis error: {e!r} ({len(batch)} ticks in batch)")
+            if self.spool is not None:
+                self._set_healthy(False)
+                self._spool_batch(batch)
+            return
+        elapsed = time.perf_counter() - start
+        relay_flush_seconds.observe(elapsed)
+        relay_batch_size.observe(len(batch))
+        if samples:
+            now = time.time()
+            for exchange_ts in samples:
+                tick_latency_seconds.observe(now - exchange_ts)
+        if self.spool is not None and elapsed * 1000 > SPOOL_LATENCY_MS:
+            logger.warning(f"Redis flush took {elapsed * 1000:.0f}ms (> {SPOOL_LATENCY_MS:.0f}ms), spooling until it recovers")
+            self._set_healthy(False)
+
+    def _spool_batch(self, batch):
+        try:
+            for item in batch:
+                # Only the stream entry is spooled; replay goes to the stream, not pub/sub
+                self.spool.append(item[1] if type(item) is tuple else item)
+        except Exception as e:
+            logger.error(f"✗ Spool write failed, {len(batch)} ticks lost: {e}")
+            return
+        spool_written_total.inc(len(batch))
+        spool_backlog.set(self.spool.pending)
+
+    def _set_healthy(self, healthy):
+        if healthy != self.healthy:
+            self.healthy = healthy
+            relay_redis_healthy.set(1 if healthy else 0)
+            if healthy:
+                logger.info("✓ Redis healthy again, relaying directly")
+
+    async def _replay_loop(self):
+        """Drain the spool into the stream, oldest first, whenever Redis responds in time."""
+        while True:
+            if not self.spool.pending:
+                self._set_healthy(True)
+                await asyncio.sleep(SPOOL_PROBE_INTERVAL)
+                continue
+            payloads, cursor = self.spool.read(SPOOL_REPLAY_BATCH)
+            start = time.perf_counter()
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for msg in payloads:
+                    pipe.xadd(self.stream, {'data': msg}, maxlen=self.maxlen, approximate=True)
+                await asyncio.wait_for(pipe.execute(), timeout=RELAY_FLUSH_TIMEOUT)
+            except Exception as e:
+                logger.debug(f"Spool replay waiting for Redis: {e!r}")
+                await asyncio.sleep(SPOOL_PROBE_INTERVAL)
+                continue
+            self.spool.commit(cursor)
+            spool_replayed_total.inc(len(payloads))
+            spool_backlog.set(self.spool.pending)
+            if not self.spool.pending:
+                logger.info("✓ Spool drained")
+            elif (time.perf_counter() - start) * 1000 > SPOOL_LATENCY_MS:
+                await asyncio.sleep(SPOOL_PROBE_INTERVAL)  # Redis still slow, don't hammer it
+
+    async def close(self):
+        """Stop the flusher and push out whatever is still buffered (to the spool if Redis is down)."""
+        for task in (self._task, self._replay_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._replay_task = None
+        batch, self._buffer = self._buffer, []
+        samples, self._samples = self._samples, []
+        if batch:
+            await self._flush(batch, samples)
+        if self.spool is not None:
+            if self.spool.pending:
+                logger.warning(f"{self.spool.pending} ticks left in spool, will replay on next start")
+            self.spool.close()
+        logger.info("✓ Redis relay stopped")
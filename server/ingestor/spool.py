@@ -0,0 +1,165 @@
+"""
+Disk-backed write-ahead spool for the Tiingo ingestor.
+- Append-only, memory-mapped segment files with rotation
+- Records are length-prefixed raw frames: <uint32 length><payload>
+- Segments are zero-filled on creation, so a zero length marks the end of data
+- Fully replayed segments are deleted; leftovers from a crash are replayed on startup
+"""
+import logging
+import mmap
+import os
+import struct
+
+logger = logging.getLogger("ingestor.spool")
+
+_LEN = struct.Struct('<I')
+_SUFFIX = '.seg'
+
+
+class _Segment:
+    __slots__ = ('seq', 'path', 'file', 'mm', 'size', 'write_pos')
+
+    def __init__(self, seq, path, size=None):
+        self.seq = seq
+        self.path = path
+        if size is not None:
+            # New segment: preallocate (zero-filled) and map
+            self.file = open(path, 'w+b')
+            self.file.truncate(size)
+        else:
+            self.file = open(path, 'r+b')
+            size = os.path.getsize(path)
+        self.size = size
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        self.write_pos = 0
+
+    def scan(self):
+        """Find the end of written data in an existing segment; returns the record count."""
+        pos = 0
+        count = 0
+        while pos + _LEN.size <= self.size:
+            (n,) = _LEN.unpack_from(self.mm, pos)
+            if n == 0 or pos + _LEN.size + n > self.size:
+                break
+            pos += _LEN.size + n
+            count += 1
+        self.write_pos = pos
+        return count
+
+    def close(self, delete=False):
+        try:
+            self.mm.flush()
+            self.mm.close()
+            self.file.close()
+        except Exception:
+            pass
+        if delete:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class TickSpool:
+    """Ordered append-only spool. Not thread-safe; used from the ingestor event loop only."""
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segments = []  # oldest first; the last one is the write segment
+        self.pending = 0  # records appended but not yet committed as replayed
+        self.pending_bytes = 0
+        self._read_index = 0  # index into self.segments
+        self._read_pos = 0
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _recover(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(_SUFFIX))
+        for name in names:
+            try:
+                seq = int(name[:-len(_SUFFIX)])
+                seg = _Segment(seq, os.path.join(self.directory, name))
+            except Exception as e:
+                logger.error(f"✗ Skipping unreadable spool segment {name}: {e}")
+                continue
+            records = seg.scan()
+            if records == 0:
+                seg.close(delete=True)
+                continue
+            self.segments.append(seg)
+            self.pending += records
+            self.pending_bytes += seg.write_pos
+        if self.pending:
+            logger.warning(f"Recovered {self.pending} spooled ticks from {len(self.segments)} segment(s) in {self.directory}")
+
+    def _rotate(self):
+        seq = self.segments[-1].seq + 1 if self.segments else 0
+        if self.segments:
+            self.segments[-1].mm.flush()
+        path = os.path.join(self.directory, f"{seq:012d}{_SUFFIX}")
+        self.segments.append(_Segment(seq, path, self.segment_bytes))
+        logger.info(f"Spool rotated to segment {seq}")
+
+    def append(self, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        need = _LEN.size + len(payload)
+        if need > self.segment_bytes:
+            raise ValueError(f"Record of {len(payload)} bytes does not fit in a spool segment")
+        seg = self.segments[-1] if self.segments else None
+        if seg is None or seg.write_pos + need > seg.size:
+            self._rotate()
+            seg = self.segments[-1]
+        pos = seg.write_pos
+        seg.mm[pos + _LEN.size:pos + need] = payload
+        _LEN.pack_into(seg.mm, pos, len(payload))  # length last, so a torn write reads as end of data
+        seg.write_pos = pos + need
+        self.pending += 1
+        self.pending_bytes += need
+
+    def read(self, max_records):
+        """
+        Return (payloads, cursor) for up to max_records unreplayed records, oldest first.
+        Nothing is consumed until commit(cursor) is called.
+        """
+        payloads = []
+        index, pos = self._read_index, self._read_pos
+        while index < len(self.segments) and len(payloads) < max_records:
+            seg = self.segments[index]
+            while pos < seg.write_pos and len(payloads) < max_records:
+                (n,) = _LEN.unpack_from(seg.mm, pos)
+                pos += _LEN.size
+                payloads.append(seg.mm[pos:pos + n])
+                pos += n
+            if pos >= seg.write_pos and index < len(self.segments) - 1:
+                index, pos = index + 1, 0
+            else:
+                break
+        return payloads, (index, pos, len(payloads))
+
+    def commit(self, cursor):
+        """Mark everything up to cursor (from read()) as replayed and drop finished segments."""
+        index, pos, count = cursor
+        consumed_bytes = 0
+        for i in range(self._read_index, index):
+            consumed_bytes += self.segments[i].write_pos - (self._read_pos if i == self._read_index else 0)
+        consumed_bytes += pos - (self._read_pos if index == self._read_index else 0)
+        # Delete sealed segments that are fully replayed
+        for seg in self.segments[:index]:
+            seg.close(delete=True)
+        self.segments = self.segments[index:]
+        self._read_index, self._read_pos = 0, pos
+        self.pending -= count
+        self.pending_bytes -= consumed_bytes
+        if self.pending == 0 and len(self.segments) == 1:
+            # Fully drained: recycle the write segment instead of growing it forever
+            self.segments[0].close(delete=True)
+            self.segments = []
+            self._read_pos = 0
+            self.pending_bytes = 0
+
+    def close(self):
+        for seg in self.segments:
+            seg.close()
+        self.segments = []
@@ -0,0 +1,126 @@
+"""
+Consumer-lag-aware trimming for tiingo:stream.
+- XADD only enforces a hard ceiling (STREAM_HARD_MAXLEN), so a consumer group
+  that falls behind during the open no longer loses unread ticks at 10k
+- A background task trims by MINID up to the slowest group's last-delivered
+  id: entries every group has already read are dropped, nothing unread is
+- With no consumer groups the stream is capped at STREAM_IDLE_MAXLEN (the old
+  behaviour), so it cannot grow unbounded while the aggregator is down
+- A group's aggregator checkpoint (CHECKPOINT_KEY) holds the trim point back to
+  its stream id, so a restarted aggregator can replay everything after it
+"""
+import asyncio
+import logging
+import os
+import time
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger("ingestor.trimmer")
+
+# --- Config ---
+STREAM_TRIM_INTERVAL = float(os.getenv('STREAM_TRIM_INTERVAL', '1'))
+STREAM_HARD_MAXLEN = int(os.getenv('STREAM_HARD_MAXLEN', '1000000'))  # memory ceiling, enforced on every XADD
+STREAM_IDLE_MAXLEN = int(os.getenv('STREAM_IDLE_MAXLEN', '10000'))  # cap when no consumer group exists
+STREAM_CEILING_WARN = 0.8  # warn when the stream is this close to the hard ceiling
+CHECKPOINT_KEY = 'aggr:checkpoint:{group}'  # written by the aggregator (server/aggregator/checkpoint.py)
+
+# --- Metrics ---
+stream_length = Gauge('ingestor_stream_length', 'Entries in the Redis stream')
+stream_group_lag = Gauge('ingestor_stream_group_lag', 'Entries not yet delivered to each consumer group', ['group'])
+stream_group_pending = Gauge('ingestor_stream_group_pending', 'Entries delivered but not acknowledged per consumer group', ['group'])
+stream_trimmed_total = Counter('ingestor_stream_trimmed_total', 'Entries trimmed from the Redis stream', ['mode'])
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _parse_id(stream_id):
+    ms, _, seq = _text(stream_id).partition('-')
+    return int(ms), int(seq or 0)
+
+
+class StreamTrimmer:
+    """Periodically trims a stream to what its slowest consumer group has read (and checkpointed)."""
+
+    def __init__(self, redis_client, stream='tiingo:stream', interval=STREAM_TRIM_INTERVAL,
+                 hard_maxlen=STREAM_HARD_MAXLEN, idle_maxlen=STREAM_IDLE_MAXLEN):
+        self.redis = redis_client
+        self.stream = stream
+        self.interval = interval
+        self.hard_maxlen = hard_maxlen
+        self.idle_maxlen = idle_maxlen
+        self._groups = set()
+        self._last_warning = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.trim_once()
+            except Exception as e:
+                logger.error(f"✗ Stream trim failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def trim_once(self):
+        try:
+            groups = await self.redis.xinfo_groups(self.stream)
+        except Exception as e:
+            if 'no such key' in str(e).lower():
+                return 0  # nothing written yet
+            raise
+
+        slowest = None
+        seen = set()
+        checkpoints = []
+        if groups:
+            pipe = self.redis.pipeline(transaction=False)
+            for group in groups:
+                pipe.hget(CHECKPOINT_KEY.format(group=_text(group.get('name'))), 'stream_id')
+            checkpoints = await pipe.execute()
+        for group, checkpoint_id in zip(groups, checkpoints):
+            name = _text(group.get('name'))
+            seen.add(name)
+            last_id = _parse_id(group.get('last-delivered-id', '0-0'))
+            if checkpoint_id:
+                last_id = min(last_id, _parse_id(checkpoint_id))
+            if slowest is None or last_id < slowest:
+                slowest = last_id
+            lag = group.get('lag')  # Redis 7+; None when it can't be computed
+            if lag is not None:
+                stream_group_lag.labels(group=name).set(lag)
+            stream_group_pending.labels(group=name).set(group.get('pending', 0))
+        for name in self._groups - seen:
+            stream_group_lag.remove(name)
+            stream_group_pending.remove(name)
+        self._groups = seen
+
+        if slowest is None:
+            trimmed = await self.redis.xtrim(self.stream, maxlen=self.idle_maxlen, approximate=True)
+            stream_trimmed_total.labels(mode='maxlen').inc(trimmed)
+        else:
+            # MINID keeps the last-delivered entry itself and everything after it
+            trimmed = await self.redis.xtrim(self.stream, minid=f"{slowest[0]}-{slowest[1]}", approximate=True)
+            stream_trimmed_total.labels(mode='minid').inc(trimmed)
+
+        length = await self.redis.xlen(self.stream)
+        stream_length.set(length)
+        if length >= self.hard_maxlen * STREAM_CEILING_WARN and time.monotonic() - self._last_warning > 60:
+            self._last_warning = time.monotonic()
+            logger.warning(f"Stream {self.stream} at {length:,} entries (hard ceiling {self.hard_maxlen:,}); "
+                           f"a consumer group is falling behind and unread ticks will be trimmed at the ceiling")
+        return trimmed
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -12,10 +12,9 @@ from server.aggregator.aggregator import pubsub_channels, get_latest_in_progress
 import redis.asyncio as aioredis
 import typing
 from dateutil.parser import isoparse
-import datetime
 from starlette.websockets import WebSocketDisconnect
 from prometheus_client import Counter, Gauge, generate_latest, CONTENT_TYPE_LATEST
-import pytz
+from server.common.trading_calendar import calendar
 
 load_dotenv()
 
@@ -53,6 +52,8 @@ latest_cache: dict[tuple[str, str], dict] = {}
 # Redis client and listener task (initialized on startup)
 redis_client: typing.Optional[aioredis.Redis] = None
 redis_listener_task: typing.Optional[asyncio.Task] = None
+calendar_task: typing.Optional[asyncio.Task] = None
+crypto_task: typing.Optional[asyncio.Task] = None
 
 # Queue helpers to avoid unbounded memory growth per-client
 def make_bounded_queue(maxsize: int = 2000) -> asyncio.Queue:
@@ -189,7 +190,7 @@ app.add_middleware(
 
 @app.on_event('startup')
 async def websocket_startup():
-    global redis_client, redis_listener_task, mongo_client, db
+    global redis_client, redis_listener_task, calendar_task, crypto_task, mongo_client, db
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
     logger.info(f"websocket startup: MONGO_URI={MONGO_URI}, REDIS_URL={REDIS_URL}")
@@ -240,10 +241,19 @@ async def websocket_startup():
     except Exception:
         logger.exception('Error during websocket mongo fallback check')
 
+    # Trading calendar: load holidays now, then refresh in the background
+    await calendar.refresh(db)
+    calendar_task = asyncio.create_task(calendar.refresh_loop(db))
+    crypto_task = asyncio.create_task(refresh_crypto_symbols_loop())
+
 
 @app.on_event('shutdown')
 async def websocket_shutdown():
-    global redis_client, redis_listener_task
+    global redis_client, redis_listener_task, calendar_task, crypto_task
+    if calendar_task:
+        calendar_task.cancel()
+    if crypto_task:
+        crypto_task.cancel()
     if redis_listener_task:
         redis_listener_task.cancel()
         try:
@@ -256,25 +266,26 @@ async def websocket_shutdown():
         except Exception:
             pass
 
-# --- Market hours calculation (auto DST) ---
-def get_market_hours_utc():
-    et = pytz.timezone('US/Eastern')
-    now_et = datetime.datetime.now(et)
-    open_et = now_et.replace(hour=9, minute=30, second=0, microsecond=0)
-    close_et = now_et.replace(hour=16, minute=0, second=0, microsecond=0)
-    return (open_et.astimezone(pytz.UTC).hour, open_et.astimezone(pytz.UTC).minute,
-            close_et.astimezone(pytz.UTC).hour, close_et.astimezone(pytz.UTC).minute)
+# --- Market hours (shared trading calendar: DST, holidays, early closes) ---
+def is_market_hours():
+    return calendar.is_open()
 
-MARKET_OPEN_H, MARKET_OPEN_M, MARKET_CLOSE_H, MARKET_CLOSE_M = get_market_hours_utc()
-logger.info(f"Market hours: {MARKET_OPEN_H}:{MARKET_OPEN_M:02d} - {MARKET_CLOSE_H}:{MARKET_CLOSE_M:02d} UTC")
+# Crypto trades 24/7, so its in-progress candles are live outside market hours too
+crypto_symbols = set()
 
-def is_market_hours():
-    now = datetime.datetime.utcnow()
-    if now.weekday() >= 5:  # Weekend
-        return False
-    open_time = now.replace(hour=MARKET_OPEN_H, minute=MARKET_OPEN_M, second=0, microsecond=0)
-    close_time = now.replace(hour=MARKET_CLOSE_H, minute=MARKET_CLOSE_M, second=0, microsecond=0)
-    return open_time <= now <= close_time
+async def refresh_crypto_symbols_loop(interval=600):
+    global crypto_symbols
+    while True:
+        try:
+            docs = await db.AssetInfo.find({'AssetType': 'Crypto', 'Delisted': False}, {'Symbol': 1}).to_list(length=None)
+            crypto_symbols = {doc['Symbol'].upper() for doc in docs if doc.get('Symbol')}
+        except Exception as e:
+            logger.warning(f"Failed to refresh crypto symbols: {e}")
+        await asyncio.sleep(interval)
+
+def is_live(symbol):
+    """True if symbol's in-progress candles are current (market hours, or crypto at any time)."""
+    return is_market_hours() or symbol.upper() in crypto_symbols
 
 async def market_hours_monitor(interval=10):
     """Monitor market hours and yield True when market is open, False when closed"""
@@ -638,7 +649,7 @@ async def websocket_quotes(
 
     async def fetch_best_close(sym: str):
         try:
-            if is_market_hours():
+            if is_live(sym):
                 # prefer in-progress cached candle (if exists) for more real-time accuracy
                 # Try Redis first, then local cache
                 cached = await get_in_progress_from_redis(sym, '1m')
@@ -730,7 +741,7 @@ async def websocket_watchpanel(
         docs = await db['OHCLVData'].find({'tickerID': ticker}).sort('timestamp', -1).limit(2).to_list(length=2)
         # Only use cached candle during market hours for initial load
         cached_candle = None
-        if is_market_hours():
+        if is_live(ticker):
             # Try Redis first, then local cache
             cached_candle = await get_in_progress_from_redis(ticker, '1d')
             if not cached_candle:
@@ -895,7 +906,7 @@ async def websocket_data_values(
     for ticker in ticker_list:
         # Only use cached candle during market hours for initial load
         cached_candle = None
-        if is_market_hours():
+        if is_live(ticker):
             # Try Redis first, then local cache
             cached_candle = await get_in_progress_from_redis(ticker, '1d')
             if not cached_candle: